@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+ingestion_throughput.py
+
+Compare ingest_folder throughput (papers/second) between the thread and process pool modes.
+Usage:
+    python benchmarks/ingestion_throughput.py /path/to/pdf/folder [--workers 8] [--repeat 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from rag_app.utils.file_loader import ingest_folder
+
+DEFAULT_NBCHAR = {"research_question": 5000, "methodology": 5000, "findings": 5000, "gaps": 5000}
+
+
+def bench_mode(folder, mode, workers, repeat):
+    best = None
+    nb_papers = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        corpus = ingest_folder(folder, DEFAULT_NBCHAR, mode=mode, max_workers=workers,
+                               output_path=None, use_cache=False)
+        elapsed = time.perf_counter() - start
+        nb_papers = len(corpus)
+        best = elapsed if best is None else min(best, elapsed)
+    return nb_papers, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest_folder in thread and process modes.")
+    parser.add_argument("folder", help="Path to the folder containing PDF papers.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of workers (default: executor default).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode, the best one is kept.")
+    parser.add_argument("--modes", nargs="+", default=["thread", "process"])
+    args = parser.parse_args()
+
+    report = []
+    for mode in args.modes:
+        nb_papers, seconds = bench_mode(args.folder, mode, args.workers, args.repeat)
+        report.append((mode, nb_papers, seconds))
+
+    print("\nmode      papers   seconds   papers/s")
+    for mode, nb_papers, seconds in report:
+        print(f"{mode:8s} {nb_papers:7d} {seconds:9.2f} {nb_papers / seconds:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
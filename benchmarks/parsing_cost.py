@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+parsing_cost.py
+
+Measure how many times each PDF is opened and how many pages are decoded
+while extracting the sections given to the per-paper agents.
+Usage:
+    python benchmarks/parsing_cost.py /path/to/pdf/folder
+"""
+
+import os
+import sys
+import time
+import argparse
+import fitz  # PyMuPDF
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from rag_app.utils.file_loader import list_pdfs, extract_specific_sections
+from rag_app.utils.parsed_document import ParsedDocument
+
+DEFAULT_NBCHAR = {"research_question": 5000, "methodology": 5000, "findings": 5000, "gaps": 5000}
+
+
+class PdfCallCounter:
+    """
+    Count every fitz.open and page.get_text call made while the context is active,
+    whichever module makes them.
+    """
+
+    def __enter__(self):
+        self.opens = 0
+        self.page_decodes = 0
+        self._open = fitz.open
+        self._get_text = fitz.Page.get_text
+
+        def counting_open(*args, **kwargs):
+            self.opens += 1
+            return self._open(*args, **kwargs)
+
+        def counting_get_text(page, *args, **kwargs):
+            self.page_decodes += 1
+            return self._get_text(page, *args, **kwargs)
+
+        fitz.open = counting_open
+        fitz.Page.get_text = counting_get_text
+        return self
+
+    def __exit__(self, *exc):
+        fitz.open = self._open
+        fitz.Page.get_text = self._get_text
+        return False
+
+
+def measure(pdf_path, nbchar):
+    with PdfCallCounter() as counter:
+        start = time.perf_counter()
+        doc = ParsedDocument(pdf_path)
+        extract_specific_sections(doc, nbchar)
+        elapsed = time.perf_counter() - start
+    # large documents are decoded in worker processes, whose calls the counter cannot see:
+    # count them from the document's own counters
+    stats = doc.stats()
+    return {
+        "pages": stats["pages"],
+        "opens": max(counter.opens, stats["opens"]),
+        "page_decodes": max(counter.page_decodes, stats["page_decodes"]),
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count PDF opens and page decodes per paper.")
+    parser.add_argument("folder", help="Path to the folder containing PDF papers.")
+    args = parser.parse_args()
+
+    rows = []
+    for path in sorted(list_pdfs(args.folder)):
+        row = measure(path, DEFAULT_NBCHAR)
+        rows.append(row)
+        print(f"{os.path.basename(path)[:40]:40s} pages={row['pages']:4d} opens={row['opens']:2d} "
+              f"page_decodes={row['page_decodes']:5d} ({row['page_decodes'] / max(row['pages'], 1):.2f}/page) "
+              f"time={row['seconds']:.3f}s")
+
+    total_pages = sum(r["pages"] for r in rows)
+    total_decodes = sum(r["page_decodes"] for r in rows)
+    print(f"\n{len(rows)} papers, {total_pages} pages")
+    print(f"opens per paper: {sum(r['opens'] for r in rows) / len(rows):.2f}")
+    print(f"page decodes per page: {total_decodes / max(total_pages, 1):.2f}")
+    print(f"total time: {sum(r['seconds'] for r in rows):.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+run_suite.py
+
+Offline ingestion benchmark suite: no API key and no network needed.
+Generates a synthetic corpus (or uses the given folder) and reports, per stage,
+the time, the papers/second and the peak RSS of the process so far:
+- pdf decoding (ParsedDocument)
+- regex splitter (extract_sections_by_parsing) and layout splitter (extract_sections_by_format)
+- keyword matching: match_sections_keywords per group, and match_keyword_groups
+- ingest_folder in thread and process mode, and with a warm section cache
+Usage:
+    python benchmarks/run_suite.py [--folder /path/to/pdfs] [--papers 50] [--json results/bench.json]
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import tempfile
+import argparse
+import contextlib
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_corpus import generate_corpus
+from rag_app.utils import file_loader
+from rag_app.utils.file_loader import list_pdfs, ingest_folder, match_sections_keywords, match_keyword_groups, KEYWORD_GROUPS
+from rag_app.utils.parsed_document import ParsedDocument
+from rag_app.utils.section_cache import SectionCache
+from rag_app.utils.section_splitter import extract_sections_by_parsing
+from rag_app.utils.section_splitterv2 import extract_sections_by_format
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+DEFAULT_NBCHAR = {"research_question": 5000, "methodology": 5000, "findings": 5000, "gaps": 5000}
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident memory of this process and of its finished children, in MB (None if unknown).
+    """
+    if resource is None:
+        return None
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class Suite:
+    def __init__(self, nb_papers: int):
+        self.nb_papers = nb_papers
+        self.rows = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str, quiet: bool = True):
+        # the loader prints one line per pdf: keep the report readable
+        out = io.StringIO() if quiet else sys.stdout
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(out):
+            yield
+        seconds = time.perf_counter() - start
+        row = {
+            "stage": name,
+            "seconds": seconds,
+            "papers_per_second": self.nb_papers / seconds if seconds else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        self.rows.append(row)
+        print(f"{name:34s} {seconds:9.3f} {row['papers_per_second'] or 0:11.1f} {row['peak_rss_mb'] or 0:10.1f}")
+
+
+def run(folder: str, workers: int = None) -> list[dict]:
+    pdf_paths = sorted(list_pdfs(folder))
+    suite = Suite(len(pdf_paths))
+    print(f"{len(pdf_paths)} papers in {folder}\n")
+    print(f"{'stage':34s} {'seconds':>9s} {'papers/s':>11s} {'peak MB':>10s}")
+
+    with suite.stage("decode (ParsedDocument)"):
+        docs = [ParsedDocument(path) for path in pdf_paths]
+        for doc in docs:
+            doc.page_blocks
+    with suite.stage("regex splitter"):
+        sections_v1 = [extract_sections_by_parsing(doc)[1] for doc in docs]
+    with suite.stage("layout splitter"):
+        sections_v2 = [extract_sections_by_format(doc)[1] for doc in docs]
+    with suite.stage("match_sections_keywords x8"):
+        for sections in sections_v1 + sections_v2:
+            for group, keywords in KEYWORD_GROUPS.items():
+                match_sections_keywords(sections, keywords, DEFAULT_NBCHAR[group])
+    with suite.stage("match_keyword_groups x2"):
+        for sections in sections_v1 + sections_v2:
+            match_keyword_groups(sections, DEFAULT_NBCHAR)
+    del docs, sections_v1, sections_v2
+
+    for mode in ("thread", "process"):
+        for strategy in ("adaptive", "both"):
+            with suite.stage(f"ingest_folder {mode} {strategy}"):
+                ingest_folder(folder, DEFAULT_NBCHAR, mode=mode, max_workers=workers,
+                              output_path=None, use_cache=False, strategy=strategy)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        file_loader.section_cache = SectionCache(cache_dir)
+        with suite.stage("ingest_folder cold cache"):
+            ingest_folder(folder, DEFAULT_NBCHAR, max_workers=workers, output_path=None)
+        with suite.stage("ingest_folder warm cache"):
+            ingest_folder(folder, DEFAULT_NBCHAR, max_workers=workers, output_path=None)
+    return suite.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite of the pdf ingestion.")
+    parser.add_argument("--folder", help="Folder of pdfs to benchmark (default: a generated synthetic corpus).")
+    parser.add_argument("--papers", type=int, default=50, help="Number of synthetic papers to generate.")
+    parser.add_argument("--max-pages", type=int, default=30, help="Max pages of the synthetic papers.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="Ingestion workers (default: executor default).")
+    parser.add_argument("--json", help="Also save the report to this JSON file, to compare runs.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.folder
+        if folder is None:
+            folder = os.path.join(tmp, "corpus")
+            start = time.perf_counter()
+            generate_corpus(folder, args.papers, max_pages=args.max_pages, seed=args.seed)
+            print(f"Synthetic corpus generated in {time.perf_counter() - start:.2f} seconds")
+        rows = run(folder, args.workers)
+
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nReport saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+synthetic_corpus.py
+
+Write a folder of synthetic academic papers with PyMuPDF, to benchmark the ingestion offline.
+The papers mix the heading styles met in real pdfs (numbered, bold, uppercase, larger font,
+"Abstract:" inline...), have a title block, an abstract, a references list and varied page counts.
+A few of them have no recognisable section at all, to exercise the page fallbacks.
+Usage:
+    python benchmarks/synthetic_corpus.py /path/to/output/folder [--papers 50] [--min-pages 4] [--max-pages 30]
+"""
+
+import os
+import random
+import argparse
+import fitz  # PyMuPDF
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4
+MARGIN = 60
+BODY_SIZE = 10
+LINE_HEIGHT = 13
+
+WORDS = (
+    "model data learning results analysis method network training performance study approach "
+    "evaluation dataset baseline accuracy proposed framework experiments significant improvement "
+    "neural features distribution sample bias robust inference estimation protocol participants "
+    "measurement clinical survey regression error benchmark architecture transfer domain"
+).split()
+
+BODY_SECTIONS = [
+    "Introduction", "Related Work", "Background", "Methodology", "Materials and Methods",
+    "Experimental Setup", "Results", "Discussion", "Analysis", "Limitations",
+    "Future Work", "Conclusion",
+]
+
+# heading styles: (font name, font size, transform of the title)
+HEADING_STYLES = {
+    "numbered_bold": ("hebo", 12, lambda i, title: f"{i}. {title}"),
+    "numbered_plain_large": ("helv", 14, lambda i, title: f"{i} {title}"),
+    "uppercase": ("helv", BODY_SIZE, lambda i, title: title.upper()),
+    "bold": ("hebo", BODY_SIZE, lambda i, title: title),
+}
+
+
+def sentence(rng: random.Random, nb_words: int) -> str:
+    words = [rng.choice(WORDS) for _ in range(nb_words)]
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng: random.Random) -> str:
+    return " ".join(sentence(rng, rng.randint(8, 22)) for _ in range(rng.randint(3, 7)))
+
+
+class PaperWriter:
+    """
+    Minimal text flow over pages: each call writes below the previous one and opens a new page when needed.
+    """
+
+    def __init__(self):
+        self.doc = fitz.Document()
+        self.page = None
+        self.y = PAGE_HEIGHT
+
+    def _ensure_room(self, height: float):
+        if self.page is None or self.y + height > PAGE_HEIGHT - MARGIN:
+            self.page = self.doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            self.y = MARGIN
+
+    def line(self, text: str, fontname: str = "helv", fontsize: float = BODY_SIZE, gap: float = 6):
+        self._ensure_room(fontsize + gap)
+        self.page.insert_text((MARGIN, self.y + fontsize), text, fontname=fontname, fontsize=fontsize)
+        self.y += fontsize + gap
+
+    def paragraph(self, text: str):
+        # ~95 characters per line at 10pt on an A4 page with these margins
+        chars_per_line = 95
+        nb_lines = len(text) // chars_per_line + 2
+        height = nb_lines * LINE_HEIGHT
+        self._ensure_room(min(height, PAGE_HEIGHT - 2 * MARGIN))
+        rect = fitz.Rect(MARGIN, self.y, PAGE_WIDTH - MARGIN, self.y + height)
+        self.page.insert_textbox(rect, text, fontname="helv", fontsize=BODY_SIZE)
+        self.y += height + 4
+
+    @property
+    def page_count(self) -> int:
+        return len(self.doc)
+
+    def save(self, path: str):
+        self.doc.save(path)
+        self.doc.close()
+
+
+def write_paper(path: str, rng: random.Random, target_pages: int, index: int):
+    writer = PaperWriter()
+    style = rng.choice(list(HEADING_STYLES))
+    fontname, fontsize, heading = HEADING_STYLES[style]
+    structured = rng.random() > 0.1  # some papers have no recognisable section
+
+    # title block
+    writer.line(sentence(rng, rng.randint(5, 10)).rstrip("."), fontname="hebo", fontsize=18, gap=10)
+    writer.line(", ".join(f"Author{index}_{i} Name" for i in range(rng.randint(1, 5))), gap=4)
+    writer.line(f"Journal of Synthetic Studies, {rng.randint(1990, 2025)}, doi:10.0000/synth.{index}", gap=14)
+
+    if not structured:
+        while writer.page_count < target_pages:
+            writer.paragraph(paragraph(rng))
+        writer.save(path)
+        return
+
+    # abstract, inline or as a heading
+    if rng.random() < 0.3:
+        writer.paragraph("Abstract: " + paragraph(rng))
+    else:
+        writer.line("ABSTRACT" if style == "uppercase" else "Abstract", fontname=fontname, fontsize=fontsize)
+        writer.paragraph(paragraph(rng))
+    writer.line("Keywords: " + ", ".join(rng.sample(WORDS, 5)), gap=12)
+
+    sections = ["Introduction"] + sorted(rng.sample(BODY_SECTIONS[1:-1], rng.randint(3, 7)), key=BODY_SECTIONS.index) + ["Conclusion"]
+    # share the pages between sections, the references take the rest
+    paragraphs_per_section = max(1, (target_pages * 5) // len(sections))
+    for number, title in enumerate(sections, 1):
+        writer.line(heading(number, title), fontname=fontname, fontsize=fontsize, gap=8)
+        for _ in range(rng.randint(max(1, paragraphs_per_section // 2), paragraphs_per_section)):
+            writer.paragraph(paragraph(rng))
+
+    writer.line("REFERENCES" if style == "uppercase" else "References", fontname=fontname, fontsize=fontsize, gap=8)
+    for ref in range(1, rng.randint(10, 40)):
+        writer.line(f"[{ref}] {sentence(rng, rng.randint(6, 12))} Proc. Synth. Conf., {rng.randint(1990, 2025)}.",
+                    fontsize=8, gap=3)
+    writer.save(path)
+
+
+def generate_corpus(folder: str, nb_papers: int = 50, min_pages: int = 4, max_pages: int = 30, seed: int = 0) -> list[str]:
+    """
+    Write `nb_papers` synthetic pdfs in `folder` and return their paths.
+    The same seed always gives the same corpus.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for index in range(nb_papers):
+        path = os.path.join(folder, f"synthetic_{index:04d}.pdf")
+        write_paper(path, rng, rng.randint(min_pages, max_pages), index)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a folder of synthetic academic pdfs.")
+    parser.add_argument("folder", help="Output folder.")
+    parser.add_argument("--papers", type=int, default=50)
+    parser.add_argument("--min-pages", type=int, default=4)
+    parser.add_argument("--max-pages", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.folder, args.papers, args.min_pages, args.max_pages, args.seed)
+    print(f"{len(paths)} synthetic papers written to {args.folder}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,26 @@
-# Expose all agents for easy imports
-from rag_app.utils.file_loader import ingest_folder
-from rag_app.utils.metadata_extractor import metadata_extractor
-from rag_app.utils.research_question import research_question_extractor
-from rag_app.utils.methodology_summary import methodology_summarizer
-from rag_app.utils.findings_synthesizer import findings_synthesizer
-from rag_app.utils.theme_cluster import thematic_synthesizer
-from rag_app.utils.gap_identifier import gap_identifier
-from rag_app.utils.citation_mapper import map_citations
-from rag_app.utils.vector_store import build_vector_store, retrieve_relevant
-from rag_app.utils.reranker import rerank_excerpts
-from rag_app.utils.composer import compose_review
-from rag_app.utils.editor import edit_review
+# Expose all agents for easy imports.
+# They are imported on first access, so that importing one utility (e.g. the pdf loader,
+# in the offline benchmarks) does not initialise every LLM and embedding client.
+import importlib
+
+_AGENTS = {
+    "ingest_folder": "rag_app.utils.file_loader",
+    "metadata_extractor": "rag_app.utils.metadata_extractor",
+    "research_question_extractor": "rag_app.utils.research_question",
+    "methodology_summarizer": "rag_app.utils.methodology_summary",
+    "findings_synthesizer": "rag_app.utils.findings_synthesizer",
+    "thematic_synthesizer": "rag_app.utils.theme_cluster",
+    "gap_identifier": "rag_app.utils.gap_identifier",
+    "map_citations": "rag_app.utils.citation_mapper",
+    "build_vector_store": "rag_app.utils.vector_store",
+    "retrieve_relevant": "rag_app.utils.vector_store",
+    "rerank_excerpts": "rag_app.utils.reranker",
+    "compose_review": "rag_app.utils.composer",
+    "edit_review": "rag_app.utils.editor",
+}
+
+
+def __getattr__(name):
+    if name in _AGENTS:
+        return getattr(importlib.import_module(_AGENTS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict, namedtuple
+from langfuse.openai import openai
+from .llm_client import chat_completion
+from .llm_cache import llm_cache
+from .section_cache import file_digest
+from .file_loader import iter_ingest_folder, list_pdfs
+from .metadata_extractor import metadata_request, parse_metadata, metadata_extractor
+from .research_question import research_question_request, parse_research_question, research_question_extractor
+from .methodology_summary import methodology_request, parse_methodology, methodology_summarizer
+from .findings_synthesizer import findings_request, parse_findings, findings_synthesizer
+from .gap_identifier import gaps_request, parse_gaps, gap_identifier
+
+# Backend running the batch: "openai" (Batch API) or "local" (stand-in processing the file in this process)
+BATCH_BACKEND = os.getenv("BATCH_BACKEND", "openai")
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "60"))
+BATCH_REQUESTS_PATH = os.path.join("results", "batch_requests.jsonl")
+BATCH_RESULTS_PATH = os.path.join("results", "batch_results.jsonl")
+# Id of the submitted batch, so that an interrupted run polls it again instead of submitting a new one
+BATCH_STATE_PATH = os.path.join("results", "batch_state.json")
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+ApiAgent = namedtuple("ApiAgent", "section request output agent")
+
+# Same order as the arguments of `assemble_paper`
+API_AGENTS = OrderedDict([
+    ("metadata", ApiAgent("metadata", metadata_request, parse_metadata, metadata_extractor)),
+    ("research_question", ApiAgent(
+        "research_question_sections", research_question_request,
+        lambda content: {'research_question': parse_research_question(content)}, research_question_extractor)),
+    ("methodology", ApiAgent(
+        "methodology_sections", methodology_request,
+        lambda content: {'methodology': parse_methodology(content)}, methodology_summarizer)),
+    ("findings", ApiAgent(
+        "findings_sections", findings_request,
+        lambda content: {'findings': parse_findings(content)}, findings_synthesizer)),
+    ("gaps", ApiAgent(
+        "gaps_sections", gaps_request,
+        lambda content: {'gaps': parse_gaps(content)}, gap_identifier)),
+])
+
+
+class OpenAIBatchBackend:
+    """
+    OpenAI Batch API: the requests file is uploaded and processed within 24h, at half the price
+    and outside of the RPM/TPM limits of the synchronous API.
+    """
+
+    def __init__(self, client=openai):
+        self.client = client
+
+    def submit(self, requests_path: str) -> str:
+        with open(requests_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window="24h"
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id: str, results_path: str):
+        """
+        Write the results file of the batch to `results_path`. Returns the path, or None if there is none.
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        if not batch.output_file_id:
+            return None
+        content = self.client.files.content(batch.output_file_id)
+        with open(results_path, "w", encoding="utf-8") as f:
+            f.write(content.text)
+        return results_path
+
+
+class LocalBatchBackend:
+    """
+    Stand-in for the Batch API, e.g. for tests: the requests file is processed in a thread of this process
+    by `complete(body) -> content`, and the results are written in the format of the Batch API.
+    """
+
+    def __init__(self, complete=None, batch_dir: str = os.path.join("cache", "batches")):
+        self.complete = complete or (lambda body: chat_completion(**body))
+        self.batch_dir = batch_dir
+        self._threads = {}
+
+    def _output_path(self, batch_id: str) -> str:
+        return os.path.join(self.batch_dir, f"{batch_id}.jsonl")
+
+    def _process(self, requests_path: str, batch_id: str):
+        lines = []
+        with open(requests_path, "r", encoding="utf-8") as f:
+            for line in f:
+                request = json.loads(line)
+                try:
+                    body = {"choices": [{"message": {"role": "assistant", "content": self.complete(request["body"])}}]}
+                    lines.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None})
+                except Exception as e:
+                    lines.append({"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}})
+        tmp_path = self._output_path(batch_id) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+        os.replace(tmp_path, self._output_path(batch_id))
+
+    def submit(self, requests_path: str) -> str:
+        os.makedirs(self.batch_dir, exist_ok=True)
+        batch_id = f"local_{uuid.uuid4().hex}"
+        thread = threading.Thread(target=self._process, args=(requests_path, batch_id), daemon=True)
+        self._threads[batch_id] = thread
+        thread.start()
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        if os.path.exists(self._output_path(batch_id)):
+            return "completed"
+        thread = self._threads.get(batch_id)
+        return "in_progress" if thread is not None and thread.is_alive() else "failed"
+
+    def download(self, batch_id: str, results_path: str):
+        if not os.path.exists(self._output_path(batch_id)):
+            return None
+        with open(self._output_path(batch_id), "r", encoding="utf-8") as src, open(results_path, "w", encoding="utf-8") as dst:
+            dst.write(src.read())
+        return results_path
+
+
+BACKENDS = {"openai": OpenAIBatchBackend, "local": LocalBatchBackend}
+
+
+def get_backend(name: str = None):
+    name = name or BATCH_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown batch backend: {name}. Use one of {', '.join(BACKENDS)}.")
+    return BACKENDS[name]()
+
+
+def batch_line(custom_id: str, request: dict) -> dict:
+    # the Langfuse generation name is not an argument of the API
+    body = {arg: value for arg, value in request.items() if arg != "name"}
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def read_results(results_path: str) -> dict:
+    """
+    Dict custom_id -> answer content, for the requests that succeeded.
+    """
+    answers, errors = {}, []
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if response.get("status_code") != 200:
+                errors.append(result.get("error") or response)
+                continue
+            answers[result["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    if errors:
+        print(f"{len(errors)} batch requests failed, e.g.: {errors[0]}")
+    return answers
+
+
+def load_state(state_path: str) -> dict:
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def wait_for_batch(backend, batch_id: str, poll_seconds: float = BATCH_POLL_SECONDS) -> str:
+    start = time.time()
+    while True:
+        status = backend.status(batch_id)
+        if status in FINAL_STATUSES:
+            print(f"Batch {batch_id} {status} after {time.time() - start:.0f} seconds")
+            return status
+        print(f"Batch {batch_id} {status}, checking again in {poll_seconds:.0f} seconds...")
+        time.sleep(poll_seconds)
+
+
+def run_batch_extraction(folder_path: str, nbchar: dict, backend=None,
+                         requests_path: str = BATCH_REQUESTS_PATH, results_path: str = BATCH_RESULTS_PATH,
+                         state_path: str = BATCH_STATE_PATH, poll_seconds: float = BATCH_POLL_SECONDS) -> list:
+    """
+    Run the 5 extractor agents on every paper of the folder through a batch backend.
+    Requests already in the LLM cache are not sent. The other ones are written to `requests_path`,
+    submitted, polled until done, and their answers parsed by the agents' own parse functions.
+    If the same requests file was already submitted (state file), that batch is polled instead of submitting a new one.
+    Requests that failed in the batch are sent to the agents one by one.
+    Papers are sorted back in folder order and requests are identified by filename, so that a rerun on the same
+    folder writes the same requests file whatever the order the pdfs were parsed in.
+    :return: List of (fname, outputs of the 5 agents), in folder order.
+    """
+    backend = backend or get_backend()
+    position = {os.path.basename(path): i for i, path in enumerate(list_pdfs(folder_path))}
+    papers = sorted(iter_ingest_folder(folder_path, nbchar), key=lambda paper: position.get(paper[0], len(position)))
+
+    requests, answers = OrderedDict(), {}
+    for fname, sections in papers:
+        for name, spec in API_AGENTS.items():
+            custom_id = f"{fname}:{name}"
+            requests[custom_id] = spec.request(sections[spec.section])
+            cached = llm_cache.get(llm_cache.key(requests[custom_id])) if llm_cache.enabled else None
+            if cached is not None:
+                answers[custom_id] = cached
+
+    pending = [custom_id for custom_id in requests if custom_id not in answers]
+    print(f"Batch extraction: {len(requests)} requests, {len(requests) - len(pending)} found in the LLM cache")
+    if pending:
+        os.makedirs(os.path.dirname(requests_path) or ".", exist_ok=True)
+        with open(requests_path, "w", encoding="utf-8") as f:
+            for custom_id in pending:
+                f.write(json.dumps(batch_line(custom_id, requests[custom_id]), ensure_ascii=False) + "\n")
+        digest = file_digest(requests_path)
+
+        state = load_state(state_path)
+        if state.get("requests_digest") == digest:
+            batch_id = state["batch_id"]
+            print(f"Resuming batch {batch_id}")
+        else:
+            batch_id = backend.submit(requests_path)
+            os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+            with open(state_path, "w", encoding="utf-8") as f:
+                json.dump({"batch_id": batch_id, "requests_digest": digest, "submitted": time.time()}, f)
+            print(f"Submitted batch {batch_id} ({len(pending)} requests)")
+
+        wait_for_batch(backend, batch_id, poll_seconds)
+        if backend.download(batch_id, results_path):
+            results = read_results(results_path)
+            for custom_id, content in results.items():
+                if custom_id in requests and llm_cache.enabled:
+                    llm_cache.put(llm_cache.key(requests[custom_id]), content)
+            answers.update((custom_id, content) for custom_id, content in results.items() if custom_id in requests)
+        os.remove(state_path)
+
+    extracted = []
+    for fname, sections in papers:
+        outputs, missing = [], []
+        for name, spec in API_AGENTS.items():
+            content = answers.get(f"{fname}:{name}")
+            if content is None:
+                missing.append(name)
+                outputs.append(spec.agent(sections[spec.section]))
+            else:
+                outputs.append(spec.output(content))
+        if missing:
+            print(f"No batch answer for {', '.join(missing)} of {fname}, called the agents instead.")
+        extracted.append((fname, outputs))
+    return extracted
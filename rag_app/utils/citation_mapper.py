@@ -3,9 +3,8 @@
 import re
 from typing import List, Dict
 from langchain_community.document_loaders import PyPDFLoader
-from openai import OpenAI
-
-openai_client = OpenAI()
+from .llm_retry import retry_on_rate_limit
+from .llm_client import chat_completion
 
 # Prompt to extract and normalize citations
 CITATION_PROMPT = """
@@ -21,18 +20,19 @@ from the following academic paper excerpt. Return the references as a JSON list
 Only return valid references. If no references are found, return an empty list.
 """
 
+@retry_on_rate_limit
 def extract_references(text: str) -> List[Dict]:
     """
     Calls GPT to extract structured reference data from a string of reference section.
     """
-    response = openai_client.chat.completions.create(
+    result = chat_completion(
         model='gpt-4',
         messages=[
             {'role': 'system', 'content': 'You are a citation extraction agent.'},
             {'role': 'user', 'content': CITATION_PROMPT + "\n\n" + text}
-        ]
+        ],
+        name="citation_extraction_request"
     )
-    result = response.choices[0].message.content
     try:
         import json
         references = json.loads(result)
@@ -1,8 +1,13 @@
-import tiktoken # used for opena AI, may be different for an other llm
-from typing import Dict, Any
+import os
+import asyncio
+import concurrent.futures
+from typing import Dict, Any, List
+from collections import OrderedDict
 from langfuse import get_client
-from langfuse.openai import openai
-from .llm_retry import retry_on_rate_limit
+from .llm_retry import retry_on_rate_limit, async_retry_on_rate_limit
+from .llm_client import chat_completion, async_chat_completion
+from .paper_encoding import LEGEND, count_tokens, encode_papers, encoding_stats
+from .task_scheduler import TaskScheduler
 
 langfuse = get_client()
 
@@ -10,22 +15,7 @@ langfuse = get_client()
 COMPOSER_PROMPT = """
 You are a senior researcher tasked with writing a literature review. Given the following structured data for multiple papers, draft a comprehensive review.
 If a topic is provided, the review should focus on that topic. If no topic is provided, synthesize the literature more generally.
-Data format (JSON):
-{
-  "papers": [
-    {
-      "filename": "...pdf",
-      "metadata": {title, authors, journal, year, doi, keywords},
-      "research_question": "...",
-      "methodology": ["...","..."],
-      "findings": ["...","..."],
-      "themes": ["...","..."],       # from thematic clustering
-      "gaps": ["...","..."],
-    },
-    ...
-  ],
-  "topic": "..." (Can be None)
-}
+{legend}
 
 Structure the output with headings:
 1. Introduction
@@ -34,11 +24,128 @@ Structure the output with headings:
 4. Conclusion
 
 Write in academic style, cite each paper by its title in parentheses where appropriate.
+""".replace("{legend}", LEGEND)
+
+# Max prompt tokens of one call: LLM's Token Per Minute (TPM)
+MAX_PROMPT_TOKENS = 10000
+# Max tokens of each partial synthesis when the papers do not fit in one call
+SECTION_MAX_TOKENS = int(os.getenv("COMPOSE_SECTION_MAX_TOKENS", "800"))
+# Partial syntheses written at the same time (threads), outside of the pipeline's task graph
+COMPOSE_WORKERS = int(os.getenv("COMPOSE_WORKERS", "8"))
+
+THEME_PROMPT = """
+You are a senior researcher writing one part of a literature review. Given the following structured data of papers
+sharing the theme below, write a synthesis of their research questions, methodologies and findings,
+then a short paragraph on their research gaps.
+If a topic is provided, focus on that topic.
+Write in academic style, cite each paper by its title in parentheses where appropriate.
+
+""" + LEGEND
+
+MERGE_PROMPT = """
+You are a senior researcher writing a literature review. Merge the following partial syntheses of groups of papers
+into one synthesis, grouped by theme, followed by a paragraph on the research gaps.
+Keep every citation (paper titles in parentheses) and do not add information.
 """
 
-@retry_on_rate_limit
-def compose_review(all_paper_data: Dict[str, Any], max_tokens: int) -> str:
+REDUCE_PROMPT = """
+You are a senior researcher tasked with writing a literature review. Given the following partial syntheses,
+each covering a theme or a group of papers, draft a comprehensive review.
+If a topic is provided, the review should focus on that topic. If no topic is provided, synthesize the literature more generally.
+
+Structure the output with headings:
+1. Introduction
+2. Thematic Synthesis
+3. Research Gaps
+4. Conclusion
+
+Write in academic style, keep the citations of each paper by its title in parentheses, and do not add information.
+"""
+
+
+def pack(items: list, budget: int, size_of=count_tokens) -> List[list]:
+    """
+    Group consecutive items into chunks of at most `budget` tokens (an item larger than the budget is alone in its chunk).
+    """
+    chunks, size = [], 0
+    for item in items:
+        tokens = size_of(item)
+        if chunks and size + tokens <= budget:
+            chunks[-1].append(item)
+            size += tokens
+        else:
+            chunks.append([item])
+            size = tokens
+    return chunks
+
+
+def theme_groups(papers: list) -> Dict[str, list]:
+    """
+    (index, paper) grouped by the first theme of the paper, in order of appearance.
+    """
+    groups = OrderedDict()
+    for index, paper in enumerate(papers, 1):
+        theme = next((theme for theme in paper.get("themes") or [] if theme), "Other papers")
+        groups.setdefault(theme, []).append((index, paper))
+    return groups
+
+
+def section_request(prompt: str, content: str, max_tokens: int, name: str) -> Dict[str, Any]:
+    return dict(
+        model="gpt-4",
+        messages=[
+            {"role": "system", "content": "You are a literature review composer."},
+            {"role": "user", "content": prompt + "\n\n" + content}
+        ],
+        temperature=0.7,
+        max_tokens=max_tokens,
+        name=name
+    )
+
+
+def theme_requests(all_paper_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Map step: one request per theme, or per part of a theme whose papers do not fit in one call.
     """
+    topic = all_paper_data.get("topic")
+    requests = []
+    for theme, papers in theme_groups(all_paper_data["papers"]).items():
+        header = f"Theme: {theme}\nTopic: {topic}\n\n"
+        budget = MAX_PROMPT_TOKENS - count_tokens(THEME_PROMPT + header) - SECTION_MAX_TOKENS
+        for chunk in pack(papers, budget, lambda item: count_tokens(encode_papers([item[1]], indices=[item[0]]))):
+            indices, chunk_papers = zip(*chunk)
+            content = header + encode_papers(list(chunk_papers), indices=list(indices))
+            requests.append(section_request(THEME_PROMPT, content, SECTION_MAX_TOKENS, "theme_synthesis_request"))
+    return requests
+
+
+def merge_requests(syntheses: List[str], topic: str) -> List[Dict[str, Any]]:
+    """
+    Intermediate reduce step, for when the partial syntheses do not fit in the final call:
+    merges them by groups fitting in one call. Raises ValueError if no two of them fit together.
+    """
+    header = f"Topic: {topic}\n\n"
+    budget = MAX_PROMPT_TOKENS - count_tokens(MERGE_PROMPT + header) - SECTION_MAX_TOKENS
+    chunks = pack(syntheses, budget)
+    if len(chunks) == len(syntheses):
+        raise ValueError(f"Partial syntheses exceed Token Per Minute (TPM): {len(syntheses)} of them cannot be merged in one call.")
+    return [section_request(MERGE_PROMPT, header + "\n\n".join(chunk), SECTION_MAX_TOKENS, "synthesis_merge_request") for chunk in chunks]
+
+
+def reduce_request(syntheses: List[str], topic: str, max_tokens: int):
+    """
+    Final step composing the review from the partial syntheses, or None if they do not fit in one call.
+    """
+    content = f"Topic: {topic}\n\n" + "\n\n".join(syntheses)
+    if count_tokens(REDUCE_PROMPT + content) + max_tokens > MAX_PROMPT_TOKENS:
+        return None
+    return section_request(REDUCE_PROMPT, content, max_tokens, "review_reduce_request")
+
+
+def compose_request(all_paper_data: Dict[str, Any], max_tokens: int) -> Dict[str, Any]:
+    """
+    Arguments of the chat completion composing the review in one call, the papers' data in compact encoding
+    (see paper_encoding.py). Raises ValueError if the prompt does not fit in the Token Per Minute limit.
     all_paper_data should be a dict:
     {
       "papers": [
@@ -48,13 +155,16 @@ def compose_review(all_paper_data: Dict[str, Any], max_tokens: int) -> str:
       "topic": "Optional topic for the review"
     }
     """
-    prompt= COMPOSER_PROMPT + "\n\n" + str(all_paper_data)
-    encoding = tiktoken.encoding_for_model("gpt-4")
-    nb_tokens = len(encoding.encode(prompt))
-    if nb_tokens >= 10000: # LLM's Token Per Minute (TPM)
-        raise ValueError(f"Prompt exceeds Token Per Minute (TPM): {nb_tokens} tokens in one call. Reduce the number of input papers.")
+    data = encode_papers(all_paper_data["papers"], all_paper_data.get("topic"))
+    prompt= COMPOSER_PROMPT + "\n\n" + data
+    nb_tokens = count_tokens(prompt)
+    repr_tokens = count_tokens(str(all_paper_data))
+    encoding_stats.record(repr_tokens, count_tokens(data))
+    print(f"Composer input: {count_tokens(data)} tokens ({repr_tokens} as Python repr)")
+    if nb_tokens >= MAX_PROMPT_TOKENS: # LLM's Token Per Minute (TPM)
+        raise ValueError(f"Prompt exceeds Token Per Minute (TPM): {nb_tokens} tokens in one call.")
     
-    response = openai.chat.completions.create(
+    return dict(
         model="gpt-4",
         messages=[
             {"role": "system", "content": "You are a literature review composer."},
@@ -64,4 +174,71 @@ def compose_review(all_paper_data: Dict[str, Any], max_tokens: int) -> str:
         max_tokens=max_tokens,
         name="review_composition_request"
     )
-    return response.choices[0].message.content.strip()
+
+
+@retry_on_rate_limit
+def section_completion(request: Dict[str, Any]) -> str:
+    return chat_completion(**request).strip()
+
+
+@async_retry_on_rate_limit
+async def asection_completion(request: Dict[str, Any]) -> str:
+    return (await async_chat_completion(**request)).strip()
+
+
+def run_parallel(func, items: list, scheduler: TaskScheduler = None) -> list:
+    """
+    `func` applied to each item at the same time: as tasks of the pipeline's graph when a scheduler is given,
+    so they share its worker budget, else on COMPOSE_WORKERS threads.
+    """
+    if scheduler is not None:
+        return scheduler.map(func, items)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(min(COMPOSE_WORKERS, len(items)), 1)) as executor:
+        return list(executor.map(func, items))
+
+
+def compose_review(all_paper_data: Dict[str, Any], max_tokens: int, scheduler: TaskScheduler = None) -> str:
+    """
+    Calls LLM to compose the review from the outputs of the agents (see `compose_request`).
+    When the papers do not fit in one call, the review is composed by map-reduce instead:
+    one partial synthesis per theme (split further if needed) written in parallel,
+    merged by groups until they fit in the final call writing the structured review.
+    :param scheduler: Task graph the review is composed in, running the partial syntheses (see `run_parallel`).
+    """
+    try:
+        request = compose_request(all_paper_data, max_tokens)
+    except ValueError as e:
+        print(f"{e} Composing the review theme by theme.")
+        return map_reduce_review(all_paper_data, max_tokens, scheduler)
+    return section_completion(request)
+
+
+def map_reduce_review(all_paper_data: Dict[str, Any], max_tokens: int, scheduler: TaskScheduler = None) -> str:
+    topic = all_paper_data.get("topic")
+    syntheses = run_parallel(section_completion, theme_requests(all_paper_data), scheduler)
+    request = reduce_request(syntheses, topic, max_tokens)
+    while request is None:
+        syntheses = run_parallel(section_completion, merge_requests(syntheses, topic), scheduler)
+        request = reduce_request(syntheses, topic, max_tokens)
+    print(f"Review composed from {len(syntheses)} partial syntheses.")
+    return section_completion(request)
+
+
+async def acompose_review(all_paper_data: Dict[str, Any], max_tokens: int) -> str:
+    try:
+        request = compose_request(all_paper_data, max_tokens)
+    except ValueError as e:
+        print(f"{e} Composing the review theme by theme.")
+        return await amap_reduce_review(all_paper_data, max_tokens)
+    return await asection_completion(request)
+
+
+async def amap_reduce_review(all_paper_data: Dict[str, Any], max_tokens: int) -> str:
+    topic = all_paper_data.get("topic")
+    syntheses = await asyncio.gather(*(asection_completion(request) for request in theme_requests(all_paper_data)))
+    request = reduce_request(syntheses, topic, max_tokens)
+    while request is None:
+        syntheses = await asyncio.gather(*(asection_completion(request) for request in merge_requests(syntheses, topic)))
+        request = reduce_request(syntheses, topic, max_tokens)
+    print(f"Review composed from {len(syntheses)} partial syntheses.")
+    return await asection_completion(request)
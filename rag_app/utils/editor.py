@@ -1,18 +1,18 @@
 from langfuse import get_client
-from langfuse.openai import openai
-from .llm_retry import retry_on_rate_limit
+from .llm_retry import retry_on_rate_limit, async_retry_on_rate_limit
+from .llm_client import chat_completion, async_chat_completion
+from .paper_encoding import count_tokens, encode_metadata, encoding_stats
 
 langfuse = get_client()
 
 
 def build_editor_prompt(paper_metadata):
     """
-    Build the editor prompt, including all paper metadata for reference formatting.
+    Build the editor prompt, including all paper metadata for reference formatting (one line per paper, see `encode_metadata`).
     """
-    meta_str = "\n\nPaper metadata for all cited papers (use these to build the reference list):\n"
-    for idx, meta in enumerate(paper_metadata, 1):
-        meta_lines = [f"  {k}: {v}" for k, v in meta.items()]
-        meta_str += f"[{idx}]\n" + "\n".join(meta_lines) + "\n"
+    references = encode_metadata(paper_metadata)
+    encoding_stats.record(count_tokens(str(paper_metadata)), count_tokens(references))
+    meta_str = "\n\nPaper metadata for all cited papers (use these to build the reference list):\n" + references + "\n"
     return f"""
 You are a scholarly editor.
 Please refine the following literature review draft for academic clarity, coherence, and readability. Also:
@@ -25,6 +25,33 @@ Please refine the following literature review draft for academic clarity, cohere
 {meta_str}
 """
 
+SECTION_EDITOR_PROMPT = """
+You are a scholarly editor.
+Please refine the following section of a literature review for academic clarity, coherence, and readability. Also:
+
+- Keep the numbered citations ([1], [2], …) as they are: they refer to the reference list of the whole review.
+- Ensure the section heading remains intact.
+- Do not add a reference list.
+"""
+
+
+def edit_request(draft_text: str, max_tokens: int, paper_metadata: list) -> dict:
+    """
+    Arguments of the chat completion editing the draft (see `edit_review`).
+    """
+    prompt = build_editor_prompt(paper_metadata) + "\n\n" + draft_text
+    return dict(
+        model="gpt-4",
+        messages=[
+            {"role": "system", "content": "You are a scholarly editor assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.3,
+        max_tokens=max_tokens,
+        name="review_editing_request"
+    )
+
+
 @retry_on_rate_limit
 def edit_review(draft_text: str, max_tokens: int, paper_metadata: list) -> str:
     """
@@ -34,15 +61,35 @@ def edit_review(draft_text: str, max_tokens: int, paper_metadata: list) -> str:
     :param paper_metadata: List of dicts, one per paper, with all metadata fields.
     :return: Polished review with IEEE-style citations.
     """
-    prompt = build_editor_prompt(paper_metadata) + "\n\n" + draft_text
-    response = openai.chat.completions.create(
+    return chat_completion(**edit_request(draft_text, max_tokens, paper_metadata)).strip()
+
+
+@async_retry_on_rate_limit
+async def aedit_review(draft_text: str, max_tokens: int, paper_metadata: list) -> str:
+    return (await async_chat_completion(**edit_request(draft_text, max_tokens, paper_metadata))).strip()
+
+
+def edit_section_request(section_text: str, max_tokens: int) -> dict:
+    """
+    Arguments of the chat completion editing one section of the review (see section_composer.py).
+    """
+    return dict(
         model="gpt-4",
         messages=[
             {"role": "system", "content": "You are a scholarly editor assistant."},
-            {"role": "user", "content": prompt}
+            {"role": "user", "content": SECTION_EDITOR_PROMPT + "\n\n" + section_text}
         ],
         temperature=0.3,
         max_tokens=max_tokens,
-        name="review_editing_request"
+        name="section_editing_request"
     )
-    return response.choices[0].message.content.strip()
+
+
+@retry_on_rate_limit
+def edit_section(section_text: str, max_tokens: int) -> str:
+    return chat_completion(**edit_section_request(section_text, max_tokens)).strip()
+
+
+@async_retry_on_rate_limit
+async def aedit_section(section_text: str, max_tokens: int) -> str:
+    return (await async_chat_completion(**edit_section_request(section_text, max_tokens))).strip()
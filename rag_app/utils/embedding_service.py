@@ -0,0 +1,167 @@
+import os
+import array
+import sqlite3
+import asyncio
+import hashlib
+import threading
+import concurrent.futures
+from typing import Dict, List
+from langchain_core.embeddings import Embeddings
+from langchain_openai.embeddings import OpenAIEmbeddings
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+# `off` sends every text to the API
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "on")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join("cache", "embeddings.sqlite"))
+# Max estimated tokens and texts of one embedding request, and requests sent at the same time
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "1000"))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "4"))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of embeddings (one sqlite file), keyed by (model, sha256 of the text).
+    Vectors are stored as float32, the precision of the FAISS index.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (model TEXT, hash TEXT, vector BLOB, PRIMARY KEY (model, hash))"
+            )
+        return self._conn
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(hashes), 500):  # sqlite limit on the number of parameters
+                chunk = hashes[i : i + 500]
+                rows = conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({', '.join('?' * len(chunk))})",
+                    [model, *chunk],
+                )
+                for hash_, vector in rows:
+                    found[hash_] = array.array("f", vector).tolist()
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, hash_, array.array("f", vector).tobytes()) for hash_, vector in vectors.items()],
+            )
+            conn.commit()
+
+
+def estimate_text_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def size_batches(texts: List[str], max_tokens: int = EMBEDDING_BATCH_TOKENS, max_size: int = EMBEDDING_BATCH_SIZE) -> List[List[str]]:
+    """
+    Consecutive groups of texts under `max_tokens` estimated tokens and `max_size` texts each.
+    """
+    batches, tokens = [], 0
+    for text in texts:
+        size = estimate_text_tokens(text)
+        if batches and tokens + size <= max_tokens and len(batches[-1]) < max_size:
+            batches[-1].append(text)
+            tokens += size
+        else:
+            batches.append([text])
+            tokens = size
+    return batches
+
+
+class EmbeddingService(Embeddings):
+    """
+    The embedding model of the app, shared by the vector store and the theme clustering.
+
+    Texts are deduplicated, looked up in the on-disk cache by (model, text hash), and only the missing ones
+    are sent, in batches sized by estimated tokens, up to EMBEDDING_WORKERS batches at the same time.
+    """
+
+    def __init__(self, model: str = EMBEDDING_MODEL, cache: EmbeddingCache = None, enabled: bool = EMBEDDING_CACHE != "off"):
+        self.model = model
+        self.client = OpenAIEmbeddings(model=model)
+        self.cache = cache or EmbeddingCache()
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.requests = 0
+
+    def stats(self) -> dict:
+        """
+        Distinct texts found in the cache and embedded, and embedding requests sent.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "requests": self.requests}
+
+    def _lookup(self, texts: List[str]):
+        """
+        (vectors found in the cache by hash, distinct texts to embed)
+        """
+        hashes = {text: text_hash(text) for text in texts}
+        found = self.cache.get_many(self.model, list(set(hashes.values()))) if self.enabled else {}
+        missing = [text for text in hashes if hashes[text] not in found]
+        with self._lock:
+            self.hits += len(hashes) - len(missing)
+            self.misses += len(missing)
+        return found, missing
+
+    def _store(self, found: dict, batches: List[List[str]], results: List[List[List[float]]]):
+        vectors = {text_hash(text): vector for batch, batch_vectors in zip(batches, results) for text, vector in zip(batch, batch_vectors)}
+        with self._lock:
+            self.requests += len(batches)
+        if self.enabled and vectors:
+            self.cache.put_many(self.model, vectors)
+        found.update(vectors)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        found, missing = self._lookup(texts)
+        batches = size_batches(missing)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(min(EMBEDDING_WORKERS, len(batches)), 1)) as executor:
+            results = list(executor.map(self.client.embed_documents, batches))
+        self._store(found, batches, results)
+        return [found[text_hash(text)] for text in texts]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        found, missing = await asyncio.to_thread(self._lookup, texts)
+        batches = size_batches(missing)
+        semaphore = asyncio.Semaphore(EMBEDDING_WORKERS)
+
+        async def embed(batch):
+            async with semaphore:
+                return await self.client.aembed_documents(batch)
+
+        results = await asyncio.gather(*(embed(batch) for batch in batches))
+        await asyncio.to_thread(self._store, found, batches, results)
+        return [found[text_hash(text)] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+embedding_service = EmbeddingService()
@@ -0,0 +1,239 @@
+import os
+import json
+import asyncio
+import threading
+from collections import OrderedDict, namedtuple
+from langfuse import get_client
+from .llm_retry import retry_on_rate_limit, async_retry_on_rate_limit
+from .llm_client import parsed_completion, async_parsed_completion
+from .rate_limiter import rate_limiter
+from .paper_extractor import as_bullets
+from .metadata_extractor import PROMPT as METADATA_PROMPT, parse_metadata, metadata_extractor, ametadata_extractor
+from .research_question import PROMPT as RQ_PROMPT, research_question_extractor, aresearch_question_extractor
+from .methodology_summary import PROMPT as METHODOLOGY_PROMPT, methodology_summarizer, amethodology_summarizer
+from .findings_synthesizer import PROMPT as FINDINGS_PROMPT, findings_synthesizer, afindings_synthesizer
+from .gap_identifier import PROMPT as GAPS_PROMPT, gap_identifier, agap_identifier
+
+langfuse = get_client()
+
+# Max estimated prompt tokens of one batch, and max papers in it (their answers share the completion)
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", "4000"))
+BATCH_MAX_PAPERS = int(os.getenv("BATCH_MAX_PAPERS", "10"))
+# Max completion tokens of one batch: with the prompt budget, within the 8k context of gpt-4
+BATCH_MAX_COMPLETION_TOKENS = int(os.getenv("BATCH_MAX_COMPLETION_TOKENS", "4000"))
+# Completion tokens of the JSON id and quoting around each paper's answer
+ANSWER_OVERHEAD_TOKENS = 20
+
+# answer_tokens: completion tokens of one paper's answer, from the agent's output schema with some headroom,
+# so that a batch is not cut before its last answers
+BatchAgent = namedtuple("BatchAgent", "prompt section answer answer_tokens wrap agent async_agent")
+
+# Same order as the arguments of `assemble_paper`
+BATCH_AGENTS = OrderedDict([
+    ("metadata", BatchAgent(
+        METADATA_PROMPT, "metadata", "the metadata JSON object", 500,
+        lambda answer: answer if isinstance(answer, dict) else parse_metadata(str(answer)),
+        metadata_extractor, ametadata_extractor)),
+    ("research_question", BatchAgent(
+        RQ_PROMPT, "research_question_sections", "a string", 150,
+        lambda answer: {'research_question': str(answer).strip()},
+        research_question_extractor, aresearch_question_extractor)),
+    ("methodology", BatchAgent(
+        METHODOLOGY_PROMPT, "methodology_sections", "a list of strings", 400,
+        lambda answer: {'methodology': as_bullets(answer)},
+        methodology_summarizer, amethodology_summarizer)),
+    ("findings", BatchAgent(
+        FINDINGS_PROMPT, "findings_sections", "a list of strings", 350,
+        lambda answer: {'findings': as_bullets(answer)},
+        findings_synthesizer, afindings_synthesizer)),
+    ("gaps", BatchAgent(
+        GAPS_PROMPT, "gaps_sections", "a list of strings", 300,
+        lambda answer: {'gaps': as_bullets(answer)},
+        gap_identifier, agap_identifier)),
+])
+
+BATCH_INSTRUCTIONS = '''
+
+The excerpts below come from different papers, each one introduced by its id in brackets.\
+Apply the instruction to each excerpt separately.\
+Return ONLY a valid JSON object mapping each id (as a string) to its answer: {answer}.\
+Do not include any explanation, markdown, or text before or after the JSON.'''
+
+
+def estimate_text_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def answer_tokens(name: str) -> int:
+    return BATCH_AGENTS[name].answer_tokens + ANSWER_OVERHEAD_TOKENS
+
+
+def max_batch_papers(name: str) -> int:
+    """
+    Papers in one batch of the agent `name`: BATCH_MAX_PAPERS, fewer if their answers would not fit in the completion.
+    """
+    return max(min(BATCH_MAX_PAPERS, BATCH_MAX_COMPLETION_TOKENS // answer_tokens(name)), 1)
+
+
+class BatchBudget:
+    """
+    Token budget of the next batches, adapted to the measured rate limits:
+    halved when the API answered with rate limit errors since the last batch, raised back
+    step by step after each successful batch, and never above a quarter of the TPM if it is set.
+    """
+
+    def __init__(self, max_tokens: int = BATCH_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._errors_seen = 0
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.batched_papers = 0
+        self.fallback_calls = 0
+
+    def current(self) -> int:
+        with self._lock:
+            errors = rate_limiter.nb_rate_limit_errors
+            if errors > self._errors_seen:
+                self.tokens = max(self.tokens // 2, 1)
+            self._errors_seen = errors  # also follows the limiter when its stats are reset
+            return min(self.tokens, max(rate_limiter.tpm // 4, 1)) if rate_limiter.tpm else self.tokens
+
+    def record(self, nb_papers: int, nb_fallbacks: int):
+        with self._lock:
+            self.batches += 1
+            self.batched_papers += nb_papers
+            self.fallback_calls += nb_fallbacks
+            if not nb_fallbacks:
+                self.tokens = min(self.max_tokens, self.tokens + self.max_tokens // 10)
+
+    def reset_stats(self):
+        with self._lock:
+            self.batches = 0
+            self.batched_papers = 0
+            self.fallback_calls = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "batched_papers": self.batched_papers,
+                "fallback_calls": self.fallback_calls,
+                "token_budget": self.tokens,
+            }
+
+
+batch_budget = BatchBudget()
+
+
+class BatchCollector:
+    """
+    Groups the inputs of each extractor agent, paper after paper, into batches under the token budget.
+    `add` and `flush` return the batches ready to be sent, as (agent name, [(fname, text), ...]).
+    """
+
+    def __init__(self, budget: BatchBudget = batch_budget):
+        self.budget = budget
+        self.pending = {name: [] for name in BATCH_AGENTS}
+        self.pending_tokens = {name: 0 for name in BATCH_AGENTS}
+
+    def add(self, fname: str, sections: dict) -> list:
+        ready = []
+        limit = self.budget.current()
+        for name, spec in BATCH_AGENTS.items():
+            text = sections[spec.section]
+            tokens = estimate_text_tokens(text)
+            items = self.pending[name]
+            if items and (self.pending_tokens[name] + tokens > limit or len(items) >= max_batch_papers(name)):
+                ready.append((name, items))
+                self.pending[name], self.pending_tokens[name] = [], 0
+            self.pending[name].append((fname, text))
+            self.pending_tokens[name] += tokens
+        return ready
+
+    def flush(self) -> list:
+        ready = [(name, items) for name, items in self.pending.items() if items]
+        self.pending = {name: [] for name in BATCH_AGENTS}
+        self.pending_tokens = {name: 0 for name in BATCH_AGENTS}
+        return ready
+
+
+def batch_request(name: str, items: list) -> dict:
+    """
+    Arguments of the chat completion running the agent `name` on the texts of several papers.
+    """
+    spec = BATCH_AGENTS[name]
+    text = "\n\n".join(f"[{i}]\n{excerpt}" for i, (_, excerpt) in enumerate(items, 1))
+    return dict(
+        model='gpt-4',
+        messages=[
+            {'role':'system','content':f'You are a batch {name.replace("_", " ")} extraction agent.'},
+            {'role':'user','content':spec.prompt + BATCH_INSTRUCTIONS.format(answer=spec.answer) + "\n\n" + text}
+        ],
+        max_tokens=answer_tokens(name) * len(items),
+        name=f"batched_{name}_request"
+    )
+
+
+def parse_batch(name: str, items: list, content: str) -> dict:
+    """
+    Dict fname -> agent output, for the ids answered in the JSON content. Raises ValueError if it is not JSON.
+    """
+    answers = json.loads(content)
+    if not isinstance(answers, dict):
+        raise ValueError(f"Expected a JSON object, got: {content[:200]}")
+    wrap = BATCH_AGENTS[name].wrap
+    return {
+        fname: wrap(answers[str(i)])
+        for i, (fname, _) in enumerate(items, 1)
+        if answers.get(str(i)) not in (None, "", [])
+    }
+
+
+@retry_on_rate_limit
+def batched_completion(name: str, items: list) -> dict:
+    """
+    `parse_batch` of the answer to the batch, which is only cached if it parses: a malformed or truncated
+    batch is sent again on the next run instead of falling back to the per-paper calls from the cache.
+    """
+    return parsed_completion(lambda content: parse_batch(name, items, content), **batch_request(name, items))
+
+
+@async_retry_on_rate_limit
+async def abatched_completion(name: str, items: list) -> dict:
+    return await async_parsed_completion(lambda content: parse_batch(name, items, content), **batch_request(name, items))
+
+
+def run_batch(name: str, items: list) -> dict:
+    """
+    Run the agent `name` on a batch of papers in one call. Papers missing from the answer,
+    or the whole batch if the call failed, are sent to the agent one by one.
+    :return: Dict fname -> agent output.
+    """
+    spec = BATCH_AGENTS[name]
+    results = {}
+    if len(items) > 1:
+        try:
+            results = batched_completion(name, items)
+        except Exception as e:
+            print(f"Batched {name} extraction failed: {e}. Calling the agent per paper.")
+    missing = [(fname, text) for fname, text in items if fname not in results]
+    for fname, text in missing:
+        results[fname] = spec.agent(text)
+    batch_budget.record(len(items), len(missing) if len(items) > 1 else 0)
+    return results
+
+
+async def arun_batch(name: str, items: list) -> dict:
+    spec = BATCH_AGENTS[name]
+    results = {}
+    if len(items) > 1:
+        try:
+            results = await abatched_completion(name, items)
+        except Exception as e:
+            print(f"Batched {name} extraction failed: {e}. Calling the agent per paper.")
+    missing = [(fname, text) for fname, text in items if fname not in results]
+    outputs = await asyncio.gather(*(spec.async_agent(text) for _, text in missing))
+    results.update(zip((fname for fname, _ in missing), outputs))
+    batch_budget.record(len(items), len(missing) if len(items) > 1 else 0)
+    return results
@@ -1,17 +1,44 @@
 import os
+import re
 import json
 import time
-from langchain_community.document_loaders import PyPDFLoader
+import queue
+import functools
+import threading
+import concurrent.futures
 from Levenshtein import distance
 from collections import OrderedDict
+from .parsed_document import PROCESS_CONTEXT, as_parsed_document, disable_page_parallelism
 from .section_splitter import extract_sections_by_parsing
 from .section_splitterv2 import extract_sections_by_format
+from .section_cache import section_cache
 
 rq_keywords = ["abstract", "introduction", "summary", "overview"]
 metholodology_keywords = ["abstract", "introduction", "summary","method", "methodology", "approach"]
 findings_keywords = ["abstract", "summary", "findings", "results", "discussion", "analysis", "interpretation", "conclusion"]
 gaps_keywords = [ "introduction","motivation", "literature review","related work", "state of the art","state-of-the-art","future work", "outlook", "limitation"]
 
+# Keyword index, built once at import: each section title of a paper is matched against
+# every distinct keyword once, whatever the number of keyword groups using it.
+KEYWORD_GROUPS = OrderedDict([
+    ("research_question", rq_keywords),
+    ("methodology", metholodology_keywords),
+    ("findings", findings_keywords),
+    ("gaps", gaps_keywords),
+])
+ALL_KEYWORDS = list(OrderedDict.fromkeys(k for keywords in KEYWORD_GROUPS.values() for k in keywords))
+
+# Ingestion executor, "thread" or "process", and its number of workers (0 = executor default)
+INGEST_MODE = os.getenv("INGEST_MODE", "thread")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or None
+# Max number of parsed papers waiting for the per-paper agents when ingestion is streamed
+INGEST_BUFFER_SIZE = int(os.getenv("INGEST_BUFFER_SIZE", "8"))
+
+# Part of the section cache key: bump it whenever a change of the splitters changes their output
+SPLITTER_VERSION = "3"
+# "adaptive": layout splitter only for what the regex splitter missed, "both": always run both splitters
+SPLITTER_STRATEGY = os.getenv("SPLITTER_STRATEGY", "adaptive")
+
 def list_pdfs(folder_path: str) -> list[str]:
     """
     Recursively list all PDF files in the given folder.
@@ -27,22 +54,62 @@ def list_pdfs(folder_path: str) -> list[str]:
     assert len(pdf_files) > 0, f"No PDF files found in {folder_path}"
     return pdf_files
 
-def extract_full_pages(path: str, nbpages :int,offset: int = 0):
-    loader = PyPDFLoader(path)
-    docs = loader.load()[offset:nbpages + offset] 
-    return ' '.join(page.page_content for page in docs)
-    
-def match_sections_keywords(sections, keywords, nbchar):
+def extract_full_pages(source, nbpages :int,offset: int = 0, max_chars: int = None):
+    """
+    Return the raw text of `nbpages` pages starting at `offset` (negative offsets count from the end),
+    cut to `max_chars` characters.
+    `source` is a pdf path or an already parsed document; only the pages of the window are decoded.
+    """
+    doc = as_parsed_document(source)
+    return doc.pages_text(nbpages, offset, max_chars)
+
+@functools.lru_cache(maxsize=None)
+def any_keyword(keywords: tuple):
+    """
+    Regex matching any of the keywords, compiled once per keyword list.
+    """
+    return re.compile("|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)))
+
+def closest_titles(sections, keywords=ALL_KEYWORDS) -> dict:
+    """
+    Single scan of the section titles: for each keyword, the title containing it
+    with the smallest Levenshtein distance to it (first one on ties).
+    """
+    best = {}
+    pattern = any_keyword(tuple(keywords))
+    for title in sections:
+        lowered = title.lower()
+        if not pattern.search(lowered):
+            continue  # most titles contain no keyword at all
+        for keyword in keywords:
+            if keyword in lowered:
+                dist = distance(keyword, lowered)
+                if keyword not in best or dist < best[keyword][0]:
+                    best[keyword] = (dist, title)
+    return {keyword: title for keyword, (dist, title) in best.items()}
+
+def select_sections(sections, titles: dict, keywords, nbchar):
     matched_sections = OrderedDict()
-    
     for keyword in keywords:
-        keylist = [title for title in sections.keys() if keyword in title.lower()]
-        if keylist:
-            # Compute Levenshtein distance between keyword and each key
-            min_key = min(keylist, key=lambda k: distance(keyword, k.lower()))
-            matched_sections[min_key] = sections[min_key][:nbchar]
+        if keyword in titles:
+            title = titles[keyword]
+            matched_sections[title] = sections[title][:nbchar]
     return matched_sections
 
+def match_sections_keywords(sections, keywords, nbchar):
+    return select_sections(sections, closest_titles(sections, keywords), keywords, nbchar)
+
+def match_keyword_groups(sections, nbchar: dict) -> dict:
+    """
+    Classify the sections of a paper into all the keyword groups at once.
+    :return: Dict group name -> matched sections (title -> text cut to nbchar[group]).
+    """
+    titles = closest_titles(sections)
+    return {
+        group: select_sections(sections, titles, keywords, nbchar[group])
+        for group, keywords in KEYWORD_GROUPS.items()
+    }
+
 
 def combine_versions(sectionV1: dict, sectionV2: dict, keywords: list) -> str:
     """ Combine sections from two versions based on keywords.
@@ -89,86 +156,307 @@ def combine_versions(sectionV1: dict, sectionV2: dict, keywords: list) -> str:
     return combined
 
 
-def extract_specific_sections(pdf_path, nbchar: dict) -> dict:
-    metadatav1, sectionsv1 = extract_sections_by_parsing(pdf_path)
-    metadatav2, sectionsv2 = extract_sections_by_format(pdf_path)
+def fallback_excerpt(doc, group: str, nbchar: dict) -> str:
+    """
+    Raw page text used when no section of a group was found, cut to the budget of that group.
+    """
+    if group == "findings":
+        # first pages and pages before the references, sharing the findings budget
+        budget = nbchar['findings'] // 2
+        tail_start = max(doc.page_count - 5, 2)
+        return " ".join(
+            part for part in (extract_full_pages(doc, 2, max_chars=budget), extract_full_pages(doc, 2, tail_start, max_chars=budget)) if part
+        )
+    return extract_full_pages(doc, 3, max_chars=nbchar[group])
+
+
+class SplitterStats:
+    """
+    Thread-safe counters of how often each splitter strategy covers the keyword groups, and what it costs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.papers = 0
+            self.layout_invoked = 0
+            self.decode_seconds = 0.0
+            self.regex_seconds = 0.0
+            self.layout_seconds = 0.0
+            self.covered_by = {group: {"regex": 0, "layout": 0, "fallback": 0} for group in KEYWORD_GROUPS}
+
+    def record(self, report: dict):
+        with self._lock:
+            self.papers += 1
+            self.decode_seconds += report["decode_seconds"]
+            self.regex_seconds += report["regex_seconds"]
+            if report["layout_seconds"] is not None:
+                self.layout_invoked += 1
+                self.layout_seconds += report["layout_seconds"]
+            for group, source in report["covered_by"].items():
+                self.covered_by[group][source] += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            papers = self.papers or 1
+            return {
+                "papers": self.papers,
+                "layout_invoked_rate": self.layout_invoked / papers,
+                "decode_avg_seconds": self.decode_seconds / papers,
+                "regex_avg_seconds": self.regex_seconds / papers,
+                "layout_avg_seconds": self.layout_seconds / self.layout_invoked if self.layout_invoked else 0.0,
+                "regex_hit_rate": {group: counts["regex"] / papers for group, counts in self.covered_by.items()},
+                "layout_hit_rate": {group: counts["layout"] / papers for group, counts in self.covered_by.items()},
+                "fallback_rate": {group: counts["fallback"] / papers for group, counts in self.covered_by.items()},
+            }
+
+
+splitter_stats = SplitterStats()
+
+
+def extract_specific_sections(pdf_path, nbchar: dict, strategy: str = None, report: dict = None) -> dict:
+    """
+    Extract the text given to each per-paper agent.
+    The pdf is parsed once and the same document is shared by both splitters and every fallback.
+    `pdf_path` may also be an already parsed document.
+
+    :param strategy: "both" runs the regex and the layout splitters on every paper and combines them.
+        "adaptive" runs the cheap regex splitter first, and the layout splitter only when the regex
+        one missed the metadata or a keyword group (default: SPLITTER_STRATEGY env variable, else "adaptive").
+    :param report: Optional dict filled with the timings of each splitter and, for each keyword group,
+        which one covered it ("regex", "layout" or "fallback"), see `SplitterStats`.
+    """
+    strategy = strategy or SPLITTER_STRATEGY
+    if strategy not in ("both", "adaptive"):
+        raise ValueError(f"Unknown splitter strategy: {strategy}. Use 'both' or 'adaptive'.")
+    doc = as_parsed_document(pdf_path)
+
+    # pages are decoded once for both splitters: timed apart so the splitter timings compare their own cost
+    start = time.perf_counter()
+    doc.page_texts
+    decode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    metadatav1, sectionsv1 = extract_sections_by_parsing(doc)
+    matchedv1 = match_keyword_groups(sectionsv1, nbchar)
+    regex_seconds = time.perf_counter() - start
+    regex_covered = {
+        group: combine_versions(matchedv1[group], {}, keywords) != "Section not found"
+        for group, keywords in KEYWORD_GROUPS.items()
+    }
+
+    layout_seconds = None
+    metadatav2 = ""
+    matchedv2 = {group: OrderedDict() for group in KEYWORD_GROUPS}
+    if strategy == "both" or not metadatav1 or not all(regex_covered.values()):
+        start = time.perf_counter()
+        metadatav2, sectionsv2 = extract_sections_by_format(doc)
+        matchedv2 = match_keyword_groups(sectionsv2, nbchar)
+        layout_seconds = time.perf_counter() - start
+
     if metadatav1:
         metadata = metadatav1
     elif metadatav2:
         metadata = metadatav2
     else:
-        print(f"Warning: no metadata found in {pdf_path}. Extracting full pages instead.")
-        metadata = extract_full_pages(pdf_path, 1)[:500]
-        
-    rq_sectionsv1 = match_sections_keywords(sectionsv1, rq_keywords, nbchar['research_question'])
-    rq_sectionsv2 = match_sections_keywords(sectionsv2, rq_keywords, nbchar['research_question'])
-    rq_sections = combine_versions(rq_sectionsv1, rq_sectionsv2, rq_keywords)
-    if rq_sections == "Section not found":
-        print(f"Warning: nothing found for 'research_question_sections' in {pdf_path}. Extracting full pages instead.")
-        rq_sections = extract_full_pages(pdf_path, 3)
-
-    methodology_sections = match_sections_keywords(sectionsv1, metholodology_keywords, nbchar['methodology'])
-    methodology_sectionsv2 = match_sections_keywords(sectionsv2, metholodology_keywords, nbchar['methodology'])
-    methodology_sections = combine_versions(methodology_sections, methodology_sectionsv2, metholodology_keywords)
-    if methodology_sections == "Section not found":
-        print(f"Warning: nothing found for 'methodology_sections' in {pdf_path}. Extracting full pages instead.")
-        methodology_sections = extract_full_pages(pdf_path, 3)
-
-    findings_sections = match_sections_keywords(sectionsv1, findings_keywords, nbchar['findings'])
-    findings_sectionsv2 = match_sections_keywords(sectionsv2, findings_keywords, nbchar['findings'])
-    findings_sections = combine_versions(findings_sections, findings_sectionsv2, findings_keywords)
-    if findings_sections == "Section not found":
-        print(f"Warning: nothing found for 'findings_sections' in {pdf_path}. Extracting full pages instead.")
-        findings_sections = extract_full_pages(pdf_path, 2).join(extract_full_pages(pdf_path, 2, -5))
-
-    gaps_sections = match_sections_keywords(sectionsv1, gaps_keywords, nbchar['gaps'])
-    gaps_sectionsv2 = match_sections_keywords(sectionsv2, gaps_keywords, nbchar['gaps'])
-    gaps_sections = combine_versions(gaps_sections, gaps_sectionsv2, gaps_keywords)
-    if gaps_sections == "Section not found":
-        print(f"Warning: nothing found for 'gaps_sections' in {pdf_path}. Extracting full pages instead.")
-        gaps_sections = extract_full_pages(pdf_path, 3)
-    
-    return {
-        "metadata": metadata,
-        "research_question_sections": rq_sections,
-        "methodology_sections": methodology_sections,
-        "findings_sections": findings_sections,
-        "gaps_sections": gaps_sections
-    }
+        print(f"Warning: no metadata found in {doc.path}. Extracting full pages instead.")
+        metadata = extract_full_pages(doc, 1, max_chars=500)
+
+    extracted = {"metadata": metadata}
+    covered_by = {}
+    for group, keywords in KEYWORD_GROUPS.items():
+        sections = combine_versions(matchedv1[group], matchedv2[group], keywords)
+        if sections == "Section not found":
+            print(f"Warning: nothing found for '{group}_sections' in {doc.path}. Extracting full pages instead.")
+            sections = fallback_excerpt(doc, group, nbchar)
+            covered_by[group] = "fallback"
+        else:
+            covered_by[group] = "regex" if regex_covered[group] else "layout"
+        extracted[f"{group}_sections"] = sections
 
-def process_pdf(path, nbchar):
+    if report is not None:
+        report.update({
+            "strategy": strategy,
+            "decode_seconds": decode_seconds,
+            "regex_seconds": regex_seconds,
+            "layout_seconds": layout_seconds,
+            "covered_by": covered_by,
+        })
+    return extracted
+
+def process_pdf(path, nbchar, strategy: str = None):
+    """
+    Extract the sections of one pdf. Only the small dict of section strings and the splitter report
+    are returned, so the result is cheap to send back from a worker process.
+    """
     fname = os.path.basename(path)
     print(f"Loading {fname}...")
+    report = {}
     try:
-        return fname, extract_specific_sections(path, nbchar)
+        return fname, extract_specific_sections(path, nbchar, strategy, report), report
     except Exception as e:
         print(f"Error loading {fname}: {e}")
-        return fname, None
-    
-def ingest_folder(folder_path: str, nbchar: dict) -> dict[str, dict]:
+        return fname, None, None
+
+def largest_first(pdf_paths: list[str]) -> list[str]:
     """
-    Ingest all PDFs in a folder and return a mapping of filename to extracted text.
+    Order pdfs by decreasing file size, so that the biggest documents start first and do not become stragglers.
+    """
+    return sorted(pdf_paths, key=os.path.getsize, reverse=True)
+
+def _executor_class(mode: str):
+    if mode == "process":
+        # one document per worker process, each decoded serially so the pools do not multiply
+        return functools.partial(concurrent.futures.ProcessPoolExecutor, mp_context=PROCESS_CONTEXT,
+                                 initializer=disable_page_parallelism)
+    if mode == "thread":
+        return concurrent.futures.ThreadPoolExecutor
+    raise ValueError(f"Unknown ingestion mode: {mode}. Use 'thread' or 'process'.")
+
+def iter_ingest_folder(folder_path: str, nbchar: dict, mode: str = None, max_workers: int = None,
+                       output_path: str = "results/LLM_food.jsonl", use_cache: bool = True,
+                       buffer_size: int = INGEST_BUFFER_SIZE, strategy: str = None):
+    """
+    Ingest all PDFs in a folder and yield (filename, sections) as soon as each pdf is parsed,
+    so the per-paper agents can start while the rest of the folder is still loading.
+
+    Parsing runs in a background thread feeding a bounded queue: when the consumer is slower,
+    at most `buffer_size` parsed papers wait in the queue and no new pdf is submitted,
+    so memory stays flat whatever the size of the folder.
 
     :param folder_path: Path to the folder containing PDFs.
-    :param max_pages: Pages to load per PDF.
-    :return: Dict where key is filename and value is extracted text.
+    :param nbchar: Max number of characters kept per section type.
+    :param mode: "thread" or "process" pool used to parse the pdfs (default: INGEST_MODE env variable, else "thread").
+    :param max_workers: Number of workers (default: INGEST_WORKERS env variable, else the executor's default).
+    :param output_path: JSONL file where each paper is appended as soon as it is yielded, None to skip it.
+    :param use_cache: Look each pdf up in the section cache (by content hash, nbchar and splitter version)
+        and only parse the misses.
+    :param buffer_size: Max number of parsed papers waiting for the consumer.
+    :param strategy: Splitter strategy, "adaptive" or "both", see `extract_specific_sections`.
+        The splitter hit rates and timings of this ingestion are recorded in `splitter_stats`.
+    :return: Generator of (filename, sections), in completion order. Pdfs that fail to load are skipped.
     """
-    import concurrent.futures
     starttime = time.time()
+    mode = mode or INGEST_MODE
+    max_workers = max_workers or INGEST_WORKERS
+    strategy = strategy or SPLITTER_STRATEGY
+    splitter_stats.reset()
+    executor_class = _executor_class(mode)
     pdf_paths = list_pdfs(folder_path)
-    corpus = {}
+    buffer = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    done = object()
+    counts = {"hits": 0, "misses": 0}
 
+    def put(item) -> bool:
+        # blocking put that gives up when the consumer went away
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        results = list(executor.map(process_pdf, pdf_paths, [nbchar] * len(pdf_paths)))
-    for fname, result in results:
-        if result is not None:
-            corpus[fname] = result
+    def produce():
+        try:
+            misses = []
+            cache_keys = {}
+            for path in pdf_paths:
+                if use_cache:
+                    cache_keys[path] = section_cache.key(path, nbchar, f"{SPLITTER_VERSION}-{strategy}")
+                    cached = section_cache.get(cache_keys[path])
+                    if cached is not None:
+                        counts["hits"] += 1
+                        if not put((os.path.basename(path), cached)):
+                            return
+                        continue
+                misses.append(path)
+            counts["misses"] = len(misses)
 
-    assert len(corpus) > 0, "No valid PDF files found or loaded."
+            # keep the workers busy without letting finished results pile up
+            max_in_flight = 2 * (max_workers or os.cpu_count() or 1)
+            remaining = iter(largest_first(misses))
+            with executor_class(max_workers=max_workers) as executor:
+                pending = {}
+                while True:
+                    while len(pending) < max_in_flight and not stop.is_set():
+                        path = next(remaining, None)
+                        if path is None:
+                            break
+                        pending[executor.submit(process_pdf, path, nbchar, strategy)] = path
+                    if not pending or stop.is_set():
+                        break
+                    finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        path = pending.pop(future)
+                        fname, result, report = future.result()
+                        if report:
+                            splitter_stats.record(report)
+                        if use_cache and result is not None:
+                            section_cache.put(cache_keys[path], result)
+                        if not put((fname, result)):
+                            break
+                if stop.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+            put(done)
+        except BaseException as e:
+            put(e)
 
-    print(f"Time taken for loading: {time.time() - starttime:.2f} seconds")
-    with open("results/LLM_food.json", "w", encoding="utf-8") as f:
-        json.dump(corpus, f, ensure_ascii=False, indent=2)
-        print(f"sections found saved to results/LLM_food.json")
+    producer = threading.Thread(target=produce, name="pdf-ingestion", daemon=True)
+    producer.start()
+    output = None
+    if output_path:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        output = open(output_path, "w", encoding="utf-8")
+    nb_loaded = 0
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            fname, sections = item
+            if sections is None:
+                continue
+            if output:
+                output.write(json.dumps({"filename": fname, "sections": sections}, ensure_ascii=False) + "\n")
+                output.flush()
+            nb_loaded += 1
+            yield fname, sections
+    finally:
+        stop.set()
+        producer.join()
+        if output:
+            output.close()
+
+    assert nb_loaded > 0, "No valid PDF files found or loaded."
+    print(f"Time taken for loading ({mode} mode): {time.time() - starttime:.2f} seconds")
+    if use_cache:
+        print(f"Section cache: {counts['hits']} hits, {counts['misses']} misses (totals: {section_cache.stats()})")
+    print(f"Splitter stats ({strategy}): {splitter_stats.summary()}")
+    if output_path:
+        print(f"sections found saved to {output_path}")
+
+def ingest_folder(folder_path: str, nbchar: dict, mode: str = None, max_workers: int = None,
+                  output_path: str = "results/LLM_food.jsonl", use_cache: bool = True,
+                  strategy: str = None) -> dict[str, dict]:
+    """
+    Ingest all PDFs in a folder and return a mapping of filename to extracted text.
+    Blocking version of `iter_ingest_folder`, see it for the parameters.
+
+    :return: Dict where key is filename and value is extracted text, in the folder order.
+    """
+    loaded = dict(iter_ingest_folder(folder_path, nbchar, mode=mode, max_workers=max_workers,
+                                     output_path=output_path, use_cache=use_cache, strategy=strategy))
+    # keep the folder order in the corpus, whatever the completion order
+    corpus = {}
+    for path in list_pdfs(folder_path):
+        fname = os.path.basename(path)
+        if fname in loaded:
+            corpus[fname] = loaded[fname]
     return corpus
@@ -1,7 +1,7 @@
 from typing import List, Dict
 from langfuse import get_client
-from langfuse.openai import openai
-from .llm_retry import extractor_retry_or_none
+from .llm_retry import extractor_retry_or_none, async_extractor_retry_or_none
+from .llm_client import chat_completion, async_chat_completion
 
 langfuse = get_client()
 
@@ -10,12 +10,11 @@ PROMPT = '''You are an academic assistant.\
 Summarize the key findings of the following paper excerpt.\
 List the top 3 most important results or conclusions in concise bullet points.'''
 
-@extractor_retry_or_none
-def synthesize_findings(text: str) -> List[str]:
+def findings_request(text: str) -> Dict:
     """
-    Calls LLM to extract and synthesize key findings.
+    Arguments of the chat completion extracting and synthesizing the key findings.
     """
-    response = openai.chat.completions.create(
+    return dict(
         model='gpt-4',
         messages=[
             {'role':'system','content':'You are a findings synthesizer agent.'},
@@ -23,9 +22,23 @@ def synthesize_findings(text: str) -> List[str]:
         ],
         name="findings_synthesis_request"
     )
-    content = response.choices[0].message.content.strip()
-    bullets = [line.strip('-•* ') for line in content.splitlines() if line.strip()]
-    return bullets
+
+
+def parse_findings(content: str) -> List[str]:
+    return [line.strip('-•* ') for line in content.strip().splitlines() if line.strip()]
+
+
+@extractor_retry_or_none
+def synthesize_findings(text: str) -> List[str]:
+    """
+    Calls LLM to extract and synthesize key findings.
+    """
+    return parse_findings(chat_completion(**findings_request(text)))
+
+
+@async_extractor_retry_or_none
+async def asynthesize_findings(text: str) -> List[str]:
+    return parse_findings(await async_chat_completion(**findings_request(text)))
 
 
 def findings_synthesizer(findings_sections):
@@ -33,4 +46,9 @@ def findings_synthesizer(findings_sections):
     Calls the LLM to synthesize findings from the provided sections of a paper.
     """
     bullets = synthesize_findings(findings_sections)
+    return {'findings': bullets}
+
+
+async def afindings_synthesizer(findings_sections):
+    bullets = await asynthesize_findings(findings_sections)
     return {'findings': bullets}
\ No newline at end of file
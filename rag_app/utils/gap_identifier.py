@@ -1,7 +1,7 @@
 from typing import List, Dict
 from langfuse import get_client
-from langfuse.openai import openai
-from .llm_retry import extractor_retry_or_none
+from .llm_retry import extractor_retry_or_none, async_extractor_retry_or_none
+from .llm_client import chat_completion, async_chat_completion
 
 langfuse = get_client()
 
@@ -10,12 +10,11 @@ PROMPT = '''You are an expert academic reviewer.\
 Identify 2-3 research gaps based on the abstract and methodology of the following paper excerpt.\
 Output each gap as a concise bullet point.'''  
 
-@extractor_retry_or_none
-def identify_gaps(text: str) -> List[str]:
+def gaps_request(text: str) -> Dict:
     """
-    Calls LLM to extract research gaps.
+    Arguments of the chat completion extracting the research gaps.
     """
-    response = openai.chat.completions.create(
+    return dict(
         model='gpt-4',
         messages=[
             {'role':'system','content':'You are a gap identification agent.'},
@@ -23,9 +22,24 @@ def identify_gaps(text: str) -> List[str]:
         ],
         name="gap_identification_request"
     )
-    content = response.choices[0].message.content.strip()
-    bullets = [line.strip('-•* ') for line in content.splitlines() if line.strip()]
-    return bullets
+
+
+def parse_gaps(content: str) -> List[str]:
+    return [line.strip('-•* ') for line in content.strip().splitlines() if line.strip()]
+
+
+@extractor_retry_or_none
+def identify_gaps(text: str) -> List[str]:
+    """
+    Calls LLM to extract research gaps.
+    """
+    return parse_gaps(chat_completion(**gaps_request(text)))
+
+
+@async_extractor_retry_or_none
+async def aidentify_gaps(text: str) -> List[str]:
+    return parse_gaps(await async_chat_completion(**gaps_request(text)))
+
 
 def gap_identifier(gaps_sections: str):
     """
@@ -33,3 +47,8 @@ def gap_identifier(gaps_sections: str):
     """
     gaps = identify_gaps(gaps_sections)
     return {'gaps': gaps}
+
+
+async def agap_identifier(gaps_sections: str):
+    gaps = await aidentify_gaps(gaps_sections)
+    return {'gaps': gaps}
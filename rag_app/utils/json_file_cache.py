@@ -0,0 +1,110 @@
+import os
+import json
+import threading
+
+
+class JsonFileCache:
+    """
+    On-disk cache of JSON values, one file per key in `cache_dir`. When the cache grows over `max_bytes`,
+    the least recently used entries are deleted. Subclasses define how their keys are computed
+    and may reject stored entries with `_valid`.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None  # computed on first write
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key: str):
+        """
+        Return the value stored for `key`, or None on a miss or an invalid entry.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            if not self._valid(value):
+                raise ValueError("stale entry")
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def _valid(self, entry) -> bool:
+        return True
+
+    def put(self, key: str, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        with self._lock:
+            try:
+                replaced = os.path.getsize(path)  # an overwritten entry no longer counts
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if self._size is None:
+                self._size = self._disk_size()
+            else:
+                self._size += os.path.getsize(path) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, fname))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fname))
+        return entries
+
+    def _disk_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # delete least recently used entries until the cache is back under 90% of its max size
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, fname in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, fname))
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
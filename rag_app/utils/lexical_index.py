@@ -0,0 +1,126 @@
+import os
+import re
+import json
+import math
+import heapq
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+# Candidates kept for the LLM reranker, the best ones by BM25 score (0: all of them)
+RERANK_PREFILTER_K = int(os.getenv("RERANK_PREFILTER_K", "20"))
+
+TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the their this to was were which with"
+    .split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [term for term in TOKEN.findall(text.lower()) if term not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-process BM25 statistics (document frequencies, average length) of a collection of texts,
+    e.g. the chunks of the vector store. Any text can then be scored against a query with them,
+    whether it is in the collection or not.
+    """
+
+    def __init__(self, texts: Iterable[str] = (), k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_freqs = Counter()
+        self.nb_docs = 0
+        self.total_length = 0
+        for text in texts:
+            self.add(text)
+
+    def add(self, text: str) -> Counter:
+        terms = Counter(tokenize(text))
+        self.doc_freqs.update(terms.keys())
+        self.nb_docs += 1
+        self.total_length += sum(terms.values())
+        return terms
+
+    def term_score(self, term: str, tf: int, length: int) -> float:
+        avg_length = self.total_length / self.nb_docs if self.nb_docs else 1
+        norm = self.k1 * (1 - self.b + self.b * length / (avg_length or 1))
+        return self.idf(term) * tf * (self.k1 + 1) / (tf + norm)
+
+    def idf(self, term: str) -> float:
+        df = self.doc_freqs.get(term, 0)
+        return math.log(1 + (self.nb_docs - df + 0.5) / (df + 0.5))
+
+    def score(self, query: str, text: str) -> float:
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        return sum(self.term_score(term, terms[term], length) for term in set(tokenize(query)) if terms.get(term))
+
+
+class InvertedIndex(BM25Index):
+    """
+    BM25 index that also keeps the postings of each term, to search the collection itself,
+    e.g. the chunks of the vector store by their docstore id. Saved as one JSON file.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        super().__init__((), k1, b)
+        self.postings = {}  # term -> {chunk_id: term frequency}
+        self.lengths = {}  # chunk_id -> number of terms
+
+    def add_chunk(self, chunk_id: str, text: str):
+        terms = self.add(text)
+        self.lengths[chunk_id] = sum(terms.values())
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        The `k` best (chunk_id, BM25 score) for the query, only reading the postings of its terms.
+        """
+        scores = Counter()
+        for term in set(tokenize(query)):
+            for chunk_id, tf in self.postings.get(term, {}).items():
+                scores[chunk_id] += self.term_score(term, tf, self.lengths[chunk_id])
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "postings": self.postings, "lengths": self.lengths}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "InvertedIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data["k1"], data["b"])
+        index.postings = data["postings"]
+        index.lengths = data["lengths"]
+        index.nb_docs = len(index.lengths)
+        index.total_length = sum(index.lengths.values())
+        index.doc_freqs = Counter({term: len(chunks) for term, chunks in index.postings.items()})
+        return index
+
+
+def lexical_scores(query: str, candidates: List[Tuple[str, str]], index: BM25Index = None) -> List[float]:
+    """
+    BM25 score of each (source_doc_id, excerpt_text) candidate for the query, with the statistics of `index`
+    (e.g. `lexical_index` of the vector store), or of the candidates themselves if it is None.
+    """
+    index = index or BM25Index(excerpt for _, excerpt in candidates)
+    return [index.score(query, excerpt) for _, excerpt in candidates]
+
+
+def prefilter(query: str, candidates: List[Tuple[str, str]], k: int = RERANK_PREFILTER_K, index: BM25Index = None):
+    """
+    Split the candidates into the `k` best by BM25 score, to be scored by the LLM, and the other ones.
+    :return: (kept, dropped) candidates, both by descending lexical score, or (candidates, []) if there are at most k.
+    """
+    if not k or len(candidates) <= k:
+        return list(candidates), []
+    scores = lexical_scores(query, candidates, index)
+    ranked = [candidate for _, candidate in sorted(zip(scores, candidates), key=lambda item: item[0], reverse=True)]
+    print(f"Lexical prefilter: {k} of {len(candidates)} candidates sent to the reranker")
+    return ranked[:k], ranked[k:]
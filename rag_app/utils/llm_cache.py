@@ -0,0 +1,54 @@
+import os
+import json
+import time
+import hashlib
+from .json_file_cache import JsonFileCache
+
+# `off` sends every request to the API, e.g. to compare the answers of two runs
+LLM_CACHE = os.getenv("LLM_CACHE", "on")
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join("cache", "llm"))
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "500"))
+# Age after which an answer is asked again (0: never)
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+
+# Arguments that do not change the answer: the Langfuse generation name
+UNKEYED_ARGS = {"name"}
+
+
+class LLMCache(JsonFileCache):
+    """
+    On-disk cache of chat completion answers, shared by all the agents.
+
+    Entries are keyed by every argument of the request (model, messages, sampling parameters...)
+    except the Langfuse name, and expire `ttl` seconds after being written.
+    Storage and LRU eviction are the ones of `JsonFileCache`.
+    """
+
+    def __init__(self, cache_dir: str = LLM_CACHE_DIR, max_bytes: int = LLM_CACHE_MAX_MB * 1024 * 1024,
+                 ttl: float = LLM_CACHE_TTL_HOURS * 3600, enabled: bool = LLM_CACHE != "off"):
+        super().__init__(cache_dir, max_bytes)
+        self.ttl = ttl
+        self.enabled = enabled
+
+    def key(self, request: dict) -> str:
+        params = {arg: value for arg, value in request.items() if arg not in UNKEYED_ARGS}
+        params = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+    def _valid(self, entry) -> bool:
+        if not isinstance(entry, dict) or "content" not in entry:
+            return False
+        return not self.ttl or time.time() - entry.get("created", 0) <= self.ttl
+
+    def get(self, key: str):
+        """
+        Return the cached answer for `key`, or None on a miss or an expired entry.
+        """
+        entry = super().get(key)
+        return None if entry is None else entry["content"]
+
+    def put(self, key: str, content: str):
+        super().put(key, {"created": time.time(), "content": content})
+
+
+llm_cache = LLMCache()
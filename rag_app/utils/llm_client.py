@@ -0,0 +1,118 @@
+import os
+import asyncio
+import weakref
+import httpx
+from langfuse.openai import openai
+from .rate_limiter import rate_limiter, estimate_tokens
+from .llm_cache import llm_cache
+
+# Max connections of the async client: the calls in flight above this wait for a free connection
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+
+# httpx connections are bound to the event loop that opened them: one async client per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def cache_key(kwargs: dict, cache: bool = None):
+    """
+    Key of the request in the LLM cache, or None if the cache is bypassed.
+    :param cache: True or False to force it, None to only cache requests that do not sample with a temperature
+        above 0 (the extractors), so that a rerun of the composer, style or editor calls writes a new text.
+    """
+    if cache is None:
+        cache = not kwargs.get("temperature")
+    if not (cache and llm_cache.enabled):
+        return None
+    return llm_cache.key(kwargs)
+
+
+def chat_completion(cache: bool = None, **kwargs) -> str:
+    """
+    Single entry point of the agents to the chat completion API (Langfuse-wrapped OpenAI client).
+    Takes the arguments of `openai.chat.completions.create`, waits for the shared rate limiter
+    to let the request through, and returns the content of the first choice.
+    Answers are stored in the LLM cache: the same request is only sent once, unless `cache` is False,
+    or it samples with a temperature above 0 and `cache` is not True (see `cache_key`).
+    """
+    key = cache_key(kwargs, cache)
+    if key is not None:
+        content = llm_cache.get(key)
+        if content is not None:
+            return content
+    rate_limiter.acquire(estimate_tokens(kwargs["messages"], kwargs.get("max_tokens")))
+    response = openai.chat.completions.create(**kwargs)
+    content = response.choices[0].message.content
+    if key is not None and content is not None:
+        llm_cache.put(key, content)
+    return content
+
+
+def get_async_client():
+    """
+    Langfuse-wrapped AsyncOpenAI client of the running event loop, all its calls sharing one connection pool.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+        client = openai.AsyncOpenAI(http_client=openai.DefaultAsyncHttpxClient(limits=limits))
+        _async_clients[loop] = client
+    return client
+
+
+async def async_chat_completion(cache: bool = None, **kwargs) -> str:
+    """
+    Async twin of `chat_completion`: same arguments, same rate limiter and cache, but waits without holding a thread.
+    """
+    key = cache_key(kwargs, cache)
+    if key is not None:
+        content = llm_cache.get(key)
+        if content is not None:
+            return content
+    await rate_limiter.async_acquire(estimate_tokens(kwargs["messages"], kwargs.get("max_tokens")))
+    response = await get_async_client().chat.completions.create(**kwargs)
+    content = response.choices[0].message.content
+    if key is not None and content is not None:
+        llm_cache.put(key, content)
+    return content
+
+
+def cached_answer(key, parse):
+    """
+    `parse` of the answer cached under `key`, or None if there is none or it does not parse (it is asked again).
+    """
+    content = llm_cache.get(key) if key is not None else None
+    if content is None:
+        return None
+    try:
+        return parse(content)
+    except ValueError:
+        return None
+
+
+def parsed_completion(parse, **kwargs):
+    """
+    `parse(chat_completion(**kwargs))`, the answer being stored in the LLM cache only once `parse` accepted it:
+    a malformed or truncated answer is asked again on the next run instead of failing again from the cache.
+    """
+    key = cache_key(kwargs)
+    parsed = cached_answer(key, parse)
+    if parsed is not None:
+        return parsed
+    content = chat_completion(cache=False, **kwargs)
+    parsed = parse(content)
+    if key is not None and content is not None:
+        llm_cache.put(key, content)
+    return parsed
+
+
+async def async_parsed_completion(parse, **kwargs):
+    key = cache_key(kwargs)
+    parsed = cached_answer(key, parse)
+    if parsed is not None:
+        return parsed
+    content = await async_chat_completion(cache=False, **kwargs)
+    parsed = parse(content)
+    if key is not None and content is not None:
+        llm_cache.put(key, content)
+    return parsed
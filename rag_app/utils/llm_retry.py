@@ -1,22 +1,48 @@
 import time
+import asyncio
+import random
 from langfuse.openai import openai
 import re
+from .rate_limiter import rate_limiter
+
+MAX_BACKOFF = 60
+
+
+def rate_limit_wait(error, attempt: int) -> float:
+    """
+    Time to wait after a rate limit error: the wait recommended in the error message if any,
+    else an exponential backoff, plus a random jitter so that the waiting threads do not retry all at once.
+    """
+    # Try to extract recommended wait time from error message
+    match = re.search(r"try again in ([\d\.]+)s", str(error))
+    if match:
+        wait_time = float(match.group(1)) + 0.1  # add a small buffer
+    else:
+        wait_time = min(MAX_BACKOFF, 2 ** attempt)
+    return wait_time + random.uniform(0, wait_time / 2)
+
+
+def rate_limit_backoff(error, attempt: int) -> float:
+    wait_time = rate_limit_wait(error, attempt)
+    # hold back every agent of the process, not only this thread
+    rate_limiter.pause(wait_time)
+    print(f"Rate limit reached, waiting {wait_time:.1f}s before retrying...")
+    return wait_time
+
+
+def handle_rate_limit(error, attempt: int):
+    time.sleep(rate_limit_backoff(error, attempt))
+
 
 def retry_on_rate_limit(func):
     def wrapper(*args, **kwargs):
+        attempt = 0
         while True:
             try:
                 return func(*args, **kwargs)
             except openai.RateLimitError as e:
-                # Try to extract recommended wait time from error message
-                msg = str(e)
-                match = re.search(r"try again in ([\d\.]+)s", msg)
-                if match:
-                    wait_time = float(match.group(1)) + 0.1  # add a small buffer
-                else:
-                    wait_time = 2
-                print(f"Rate limit reached, waiting {wait_time:.1f}s before retrying...")
-                time.sleep(wait_time)
+                attempt += 1
+                handle_rate_limit(e, attempt)
     return wrapper
 
 def extractor_retry_or_none(func):
@@ -26,19 +52,47 @@ def extractor_retry_or_none(func):
     return None on any other error to continue the flow anyway. None can be changed to the not summarized input if quality matters more than cost.
     '''
     def wrapper(*args, **kwargs):
+        attempt = 0
         while True:
             try:
                 return func(*args, **kwargs)
             except openai.RateLimitError as e:
-                msg = str(e)
-                match = re.search(r"try again in ([\d\.]+)s", msg)
-                if match:
-                    wait_time = float(match.group(1)) + 0.1
-                else:
-                    wait_time = 2
-                print(f"Rate limit reached, waiting {wait_time:.1f}s before retrying...")
-                time.sleep(wait_time)
+                attempt += 1
+                handle_rate_limit(e, attempt)
+            except Exception as e:
+                print(f"Extractor agent error: {e}. Returning None.")
+                return None
+    return wrapper
+
+
+def async_retry_on_rate_limit(func):
+    """
+    `retry_on_rate_limit` for coroutine functions.
+    """
+    async def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except openai.RateLimitError as e:
+                attempt += 1
+                await asyncio.sleep(rate_limit_backoff(e, attempt))
+    return wrapper
+
+
+def async_extractor_retry_or_none(func):
+    """
+    `extractor_retry_or_none` for coroutine functions.
+    """
+    async def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except openai.RateLimitError as e:
+                attempt += 1
+                await asyncio.sleep(rate_limit_backoff(e, attempt))
             except Exception as e:
                 print(f"Extractor agent error: {e}. Returning None.")
                 return None
-    return wrapper
\ No newline at end of file
+    return wrapper
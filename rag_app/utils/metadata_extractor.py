@@ -1,12 +1,10 @@
 import os
 import json
 from typing import Dict
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import CharacterTextSplitter
 
 from langfuse import get_client
-from langfuse.openai import openai
-from .llm_retry import extractor_retry_or_none
+from .llm_retry import extractor_retry_or_none, async_extractor_retry_or_none
+from .llm_client import chat_completion, async_chat_completion
 
 langfuse = get_client()
 
@@ -19,20 +17,34 @@ PROMPT = (
 )
 
 
-@extractor_retry_or_none
-def metadata_extractor(metadata_section) -> Dict:
+def metadata_request(metadata_section) -> Dict:
     """
-    call the LLM to extract metadata from the given section of text.
+    Arguments of the chat completion extracting the metadata of the given section of text.
     """
-    response = openai.chat.completions.create(
+    return dict(
         model='gpt-4',
         messages=[{'role':'system','content':'You are an academic metadata extractor.'},
                   {'role':'user','content':PROMPT + "\n\n" + metadata_section}],
         name="metadata_extraction_request"
     )
-    content = response.choices[0].message.content
+
+
+def parse_metadata(content: str) -> Dict:
     try:
         metadata = json.loads(content)
     except json.JSONDecodeError:
         metadata = {'raw_output': content}
     return metadata
+
+
+@extractor_retry_or_none
+def metadata_extractor(metadata_section) -> Dict:
+    """
+    call the LLM to extract metadata from the given section of text.
+    """
+    return parse_metadata(chat_completion(**metadata_request(metadata_section)))
+
+
+@async_extractor_retry_or_none
+async def ametadata_extractor(metadata_section) -> Dict:
+    return parse_metadata(await async_chat_completion(**metadata_request(metadata_section)))
@@ -1,7 +1,7 @@
 from typing import List, Dict
 from langfuse import get_client
-from langfuse.openai import openai
-from .llm_retry import extractor_retry_or_none
+from .llm_retry import extractor_retry_or_none, async_extractor_retry_or_none
+from .llm_client import chat_completion, async_chat_completion
 
 langfuse = get_client()
 # Prompt template for methodology summarization
@@ -11,12 +11,11 @@ Include study type, data sources, and key techniques.\
 Provide 3-4 concise bullet points.'''
 
 
-@extractor_retry_or_none
-def summarize_methodology(text: str) -> List[str]:
+def methodology_request(text: str) -> Dict:
     """
-    Calls LLM to summarize methodology into bullet points.
+    Arguments of the chat completion summarizing the methodology into bullet points.
     """
-    response = openai.chat.completions.create(
+    return dict(
         model='gpt-4',
         messages=[
             {'role':'system','content':'You are a methodology summarization agent.'},
@@ -24,9 +23,23 @@ def summarize_methodology(text: str) -> List[str]:
         ],
         name="methodology_summarization_request"
     )
-    content = response.choices[0].message.content.strip()
-    bullets = [line.strip('-•* ') for line in content.splitlines() if line.strip()]
-    return bullets
+
+
+def parse_methodology(content: str) -> List[str]:
+    return [line.strip('-•* ') for line in content.strip().splitlines() if line.strip()]
+
+
+@extractor_retry_or_none
+def summarize_methodology(text: str) -> List[str]:
+    """
+    Calls LLM to summarize methodology into bullet points.
+    """
+    return parse_methodology(chat_completion(**methodology_request(text)))
+
+
+@async_extractor_retry_or_none
+async def asummarize_methodology(text: str) -> List[str]:
+    return parse_methodology(await async_chat_completion(**methodology_request(text)))
 
 
 def methodology_summarizer(methodology_sections) -> Dict[str, List[str]]:
@@ -34,4 +47,9 @@ def methodology_summarizer(methodology_sections) -> Dict[str, List[str]]:
     Calls the LLM to summarize the methodology sections of a paper.
     """
     bullets = summarize_methodology(methodology_sections)
+    return {'methodology': bullets}
+
+
+async def amethodology_summarizer(methodology_sections) -> Dict[str, List[str]]:
+    bullets = await asummarize_methodology(methodology_sections)
     return {'methodology': bullets}
\ No newline at end of file
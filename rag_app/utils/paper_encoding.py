@@ -0,0 +1,169 @@
+import functools
+import threading
+from collections import OrderedDict
+import tiktoken # used for opena AI, may be different for an other llm
+
+# Short keys of the per-paper fields sent to the composer
+FIELDS = OrderedDict([
+    ("research_question", "Q"),
+    ("methodology", "M"),
+    ("findings", "F"),
+    ("gaps", "G"),
+])
+
+# Description of the encoding, for the prompts
+LEGEND = """Data format:
+- "Papers": one line per paper, "[index] title (first author, year)".
+- "Themes": one line per theme, "T<n> label".
+- "Shared points": points stated by several papers, "*<n> text".
+- Then, for each paper "[index]", one line per field: Q (research question), M (methodology),
+  F (findings), G (gaps), T (themes). Points are separated by " | ", "*<n>" refers to a shared point.
+  Missing fields are omitted."""
+
+REFERENCE_FIELDS = ("authors", "title", "journal", "year", "doi")
+# Characters kept of the raw output of a failed metadata extraction
+RAW_OUTPUT_CHARS = 300
+
+
+@functools.lru_cache(maxsize=1)
+def get_encoding():
+    return tiktoken.encoding_for_model("gpt-4")
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text))
+
+
+class EncodingStats:
+    """
+    Tokens of the composer and editor inputs, as Python repr and as compact encoding, summed over a run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def record(self, repr_tokens: int, encoded_tokens: int):
+        with self._lock:
+            self.inputs += 1
+            self.repr_tokens += repr_tokens
+            self.encoded_tokens += encoded_tokens
+
+    def reset_stats(self):
+        with self._lock:
+            self.inputs = 0
+            self.repr_tokens = 0
+            self.encoded_tokens = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "inputs": self.inputs,
+                "repr_tokens": self.repr_tokens,
+                "encoded_tokens": self.encoded_tokens,
+                "saved": 1 - self.encoded_tokens / self.repr_tokens if self.repr_tokens else 0.0,
+            }
+
+
+encoding_stats = EncodingStats()
+
+
+def is_empty(value) -> bool:
+    return value is None or (isinstance(value, (str, list, tuple, dict)) and not value)
+
+
+def as_list(value) -> list:
+    if is_empty(value):
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if not is_empty(item) and str(item).strip()]
+    return [str(value).strip()]
+
+
+def first_author(metadata: dict) -> str:
+    authors = as_list(metadata.get("authors"))
+    if not authors:
+        return ""
+    return authors[0] + (" et al." if len(authors) > 1 else "")
+
+
+def paper_label(paper: dict) -> str:
+    """
+    "title (first author, year)" of the paper, the filename if its metadata has no title.
+    """
+    metadata = paper.get("metadata") or {}
+    title = str(metadata.get("title") or "").strip() or paper.get("filename", "")
+    details = ", ".join(detail for detail in (first_author(metadata), str(metadata.get("year") or "").strip()) if detail)
+    return f"{title} ({details})" if details else title
+
+
+def normalize(point: str) -> str:
+    return " ".join(point.lower().split()).rstrip(".")
+
+
+def encode_papers(papers: list, topic: str = None, indices: list = None, fields=tuple(FIELDS)) -> str:
+    """
+    Compact encoding of the papers' data (see LEGEND): short field keys, no empty field, themes and points
+    stated by several papers written once, each paper referenced by its index in the reference list.
+    :param indices: Index of each paper (default: 1, 2, ...), e.g. their place in the whole corpus for a subset.
+    :param fields: Fields of FIELDS to encode, the themes are always included.
+    """
+    indices = indices or range(1, len(papers) + 1)
+    fields = OrderedDict((name, key) for name, key in FIELDS.items() if name in fields)
+    counts, themes = {}, OrderedDict()
+    for paper in papers:
+        for name in fields:
+            if name != "research_question":
+                for point in {normalize(point) for point in as_list(paper.get(name))}:
+                    counts[point] = counts.get(point, 0) + 1
+        for theme in as_list(paper.get("themes")):
+            themes.setdefault(theme, f"T{len(themes) + 1}")
+    shared = OrderedDict()
+
+    blocks = []
+    for index, paper in zip(indices, papers):
+        lines = [f"[{index}]"]
+        for name, key in fields.items():
+            points = as_list(paper.get(name))
+            if name != "research_question":
+                encoded = []
+                for point in points:
+                    if counts.get(normalize(point), 0) > 1:
+                        point = shared.setdefault(normalize(point), (f"*{len(shared) + 1}", point))[0]
+                    if point not in encoded:
+                        encoded.append(point)
+                points = encoded
+            if points:
+                lines.append(f"{key}: " + " | ".join(points))
+        paper_themes = [themes[theme] for theme in as_list(paper.get("themes"))]
+        if paper_themes:
+            lines.append("T: " + ", ".join(paper_themes))
+        blocks.append("\n".join(lines))
+
+    parts = [f"Topic: {topic}"] if topic else []
+    parts.append("Papers:\n" + "\n".join(f"[{index}] {paper_label(paper)}" for index, paper in zip(indices, papers)))
+    if themes:
+        parts.append("Themes:\n" + "\n".join(f"{key} {theme}" for theme, key in themes.items()))
+    if shared:
+        parts.append("Shared points:\n" + "\n".join(f"{key} {point}" for key, point in shared.values()))
+    parts.append("\n\n".join(blocks))
+    return "\n\n".join(parts)
+
+
+def encode_metadata(paper_metadata: list) -> str:
+    """
+    One line per paper with the fields of its reference: "[index] authors. title. journal. year. doi: ...".
+    Other fields (keywords) and empty ones are dropped, the raw output of a failed extraction is cut.
+    """
+    lines = []
+    for index, metadata in enumerate(paper_metadata, 1):
+        metadata = metadata or {}
+        fields = []
+        for name in REFERENCE_FIELDS:
+            value = ", ".join(as_list(metadata.get(name)))
+            if value:
+                fields.append(f"doi: {value}" if name == "doi" else value)
+        if not fields and metadata.get("raw_output"):
+            fields.append(" ".join(str(metadata["raw_output"]).split())[:RAW_OUTPUT_CHARS])
+        lines.append(f"[{index}] " + ". ".join(fields))
+    return "\n".join(lines)
@@ -0,0 +1,107 @@
+import os
+import re
+import json
+from typing import Dict
+from collections import OrderedDict
+from langfuse import get_client
+from .llm_retry import extractor_retry_or_none, async_extractor_retry_or_none
+from .llm_client import parsed_completion, async_parsed_completion
+from .file_loader import KEYWORD_GROUPS, ALL_KEYWORDS
+from .metadata_extractor import PROMPT as METADATA_PROMPT, parse_metadata
+from .research_question import PROMPT as RQ_PROMPT
+from .methodology_summary import PROMPT as METHODOLOGY_PROMPT
+from .findings_synthesizer import PROMPT as FINDINGS_PROMPT
+from .gap_identifier import PROMPT as GAPS_PROMPT
+
+langfuse = get_client()
+
+# "agents": one call per extractor agent, "fused": one call per paper for the 5 of them,
+# "batched": one call per agent for several papers (see extractor_batching.py)
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "agents")
+
+# The loader joins the matched sections of a group as "KEYWORD: text KEYWORD: text"
+FRAGMENT_TITLE = re.compile(
+    r"(?:^|(?<= ))(" + "|".join(re.escape(k.upper()) for k in sorted(ALL_KEYWORDS, key=len, reverse=True)) + r"): "
+)
+
+PROMPT = f'''You are an academic extraction agent.\
+From the paper sections below, return ONLY a valid JSON object with the keys:
+- "metadata": {METADATA_PROMPT}
+- "research_question": a string. {RQ_PROMPT}
+- "methodology": a list of strings. {METHODOLOGY_PROMPT}
+- "findings": a list of strings. {FINDINGS_PROMPT}
+- "gaps": a list of strings. {GAPS_PROMPT}
+Do not include any explanation, markdown, or text before or after the JSON.'''
+
+
+def section_fragments(sections: dict) -> Dict[str, str]:
+    """
+    Split the texts given to the extractor agents into titled fragments, each sent once:
+    a section matched by several keyword groups (e.g. the abstract) is kept in its longest cut.
+    Texts that are not made of matched sections (full pages fallback) are kept as a whole.
+    """
+    fragments = OrderedDict([("METADATA", sections["metadata"])])
+    for group in KEYWORD_GROUPS:
+        parts = FRAGMENT_TITLE.split(sections[f"{group}_sections"])
+        if parts[0].strip():
+            fragments[f"{group.upper()} PAGES"] = parts[0].strip()
+        for title, text in zip(parts[1::2], parts[2::2]):
+            text = text.strip()
+            if len(text) > len(fragments.get(title, "")):
+                fragments[title] = text
+    return fragments
+
+
+def fused_request(sections: dict) -> dict:
+    """
+    Arguments of the chat completion extracting the outputs of the 5 extractor agents at once.
+    """
+    text = "\n\n".join(f"[{title}]\n{fragment}" for title, fragment in section_fragments(sections).items())
+    return dict(
+        model='gpt-4',
+        messages=[
+            {'role':'system','content':'You are a paper extraction agent.'},
+            {'role':'user','content':PROMPT + "\n\n" + text}
+        ],
+        name="fused_extraction_request"
+    )
+
+
+def as_bullets(value) -> list:
+    if isinstance(value, str):
+        return [line.strip('-•* ') for line in value.strip().splitlines() if line.strip()]
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def parse_fused(content: str) -> tuple:
+    """
+    Outputs of the 5 extractor agents, in their own shape, from the JSON answer.
+    Raises ValueError if the answer is not the expected JSON object.
+    """
+    extracted = json.loads(content)
+    if not isinstance(extracted, dict) or not {"metadata", "research_question", "methodology", "findings", "gaps"} <= extracted.keys():
+        raise ValueError(f"Missing keys in the fused extraction: {content[:200]}")
+    metadata = extracted["metadata"]
+    if not isinstance(metadata, dict):
+        metadata = parse_metadata(str(metadata))
+    return (
+        metadata,
+        {'research_question': str(extracted["research_question"] or "").strip()},
+        {'methodology': as_bullets(extracted["methodology"] or [])},
+        {'findings': as_bullets(extracted["findings"] or [])},
+        {'gaps': as_bullets(extracted["gaps"] or [])},
+    )
+
+
+@extractor_retry_or_none
+def fused_extractor(sections: dict) -> tuple:
+    """
+    Calls the LLM once to extract metadata, research question, methodology, findings and gaps of a paper.
+    Returns the outputs of the 5 agents, or None if the call or its parsing failed.
+    """
+    return parsed_completion(parse_fused, **fused_request(sections))
+
+
+@async_extractor_retry_or_none
+async def afused_extractor(sections: dict) -> tuple:
+    return await async_parsed_completion(parse_fused, **fused_request(sections))
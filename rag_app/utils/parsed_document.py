@@ -0,0 +1,246 @@
+import os
+import threading
+import multiprocessing
+import concurrent.futures
+import concurrent.futures.process
+import fitz  # PyMuPDF
+
+# Documents with at least this many pages still to decode are split into page ranges decoded in parallel
+PARALLEL_PAGES_THRESHOLD = int(os.getenv("PARALLEL_PAGES_THRESHOLD", "150"))
+# Number of worker processes of the page pool, shared by all the documents (1 disables page-level parallelism)
+PAGE_WORKERS = int(os.getenv("PAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Pools are started with "spawn": forking a process that runs threads can copy their held locks
+PROCESS_CONTEXT = multiprocessing.get_context("spawn")
+
+_page_workers = PAGE_WORKERS
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+
+def page_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """
+    The pool decoding the page ranges of large documents, started on first use and shared by all of them,
+    so that documents parsed at the same time queue their ranges instead of each starting its own processes.
+    """
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = concurrent.futures.ProcessPoolExecutor(max_workers=_page_workers, mp_context=PROCESS_CONTEXT)
+        return _page_pool
+
+
+def _drop_page_pool(pool):
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is pool:
+            _page_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def disable_page_parallelism():
+    """
+    Decode every document serially in this process, e.g. in the workers of a process-mode ingestion,
+    which already run one document per core.
+    """
+    global _page_workers
+    _page_workers = 1
+
+
+def decode_page(page):
+    """
+    Decode one page into (text, blocks): the page text, lines separated by newlines, and its text blocks,
+    each block being a list of lines, each line a list of (text, size, flags) spans. Image blocks are dropped.
+    """
+    page_blocks = []
+    block_texts = []
+    for block in page.get_text("dict")["blocks"]:
+        if block.get("type") != 0 or "lines" not in block:
+            continue  # ignore images or non-text blocks
+        lines = []
+        for line in block["lines"]:
+            spans = [(span["text"], span["size"], span["flags"]) for span in line["spans"]]
+            if spans:
+                lines.append(spans)
+        if not lines:
+            continue
+        page_blocks.append(lines)
+        block_texts.append("\n".join("".join(span[0] for span in line) for line in lines))
+    return "\n".join(block_texts), page_blocks
+
+
+def decode_page_range(path: str, start: int, stop: int, scan=None) -> tuple:
+    """
+    Worker of the page-level parallelism: open the pdf and decode the pages [start, stop).
+    Only the compact (text, blocks) of each page is sent back, with `scan` applied to their blocks if given.
+    :return: (pages, scan result or None)
+    """
+    with fitz.open(path) as doc:
+        pages = [decode_page(doc[index]) for index in range(start, stop)]
+    return pages, scan([blocks for _, blocks in pages]) if scan is not None else None
+
+
+class ParsedDocument:
+    """
+    A PDF opened once and shared by every section extractor.
+
+    Pages are decoded lazily, each at most once, with ``page.get_text("dict")`` and kept in a compact form:
+    - page text: one string per page, lines separated by newlines
+    - page blocks: the text blocks of the page, each block being a list of lines,
+      each line a list of (text, size, flags) spans. Image blocks are dropped.
+    Reading a window of pages (`head`, `tail`, `pages_text`) only decodes the pages of that window.
+    Reading the whole document of a large pdf (PARALLEL_PAGES_THRESHOLD pages or more) decodes
+    contiguous page ranges in the shared pool of PAGE_WORKERS processes (`page_pool`), then stores them back in page order;
+    `scan_pages` also runs a per-range scan of their layout in the same workers
+    (serially in the workers of a process-mode ingestion, see `disable_page_parallelism`).
+    The pdf is closed as soon as every page has been decoded, or by `close()`.
+    The counters `opens` and `page_decodes` record how much PDF work the object has cost.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.opens = 0
+        self.page_decodes = 0
+        self._doc = None
+        self._open()
+        self.page_count = len(self._doc)
+        self._texts = [None] * self.page_count
+        self._blocks = [None] * self.page_count
+
+    def _open(self):
+        self._doc = fitz.open(self.path)
+        self.opens += 1
+
+    def close(self):
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _decode(self, index: int):
+        if self._doc is None:
+            self._open()
+        self._texts[index], self._blocks[index] = decode_page(self._doc[index])
+        self.page_decodes += 1
+        if all(text is not None for text in self._texts):
+            self.close()  # nothing left to decode
+
+    def _decode_ranges(self, scan=None):
+        """
+        Decode the pages not decoded yet of a large document in parallel page ranges, applying `scan`
+        to the blocks of each range in its worker.
+        :return: (first page, last page + 1, scan result of each range) of the ranges, None if the document
+            is not decoded in parallel (small, already decoded, page parallelism off, or the pool failed).
+        """
+        missing = [i for i, text in enumerate(self._texts) if text is None]
+        if len(missing) < PARALLEL_PAGES_THRESHOLD or _page_workers <= 1:
+            return None
+        start, stop = missing[0], missing[-1] + 1
+        range_size = -(-(stop - start) // _page_workers)
+        ranges = [(first, min(first + range_size, stop)) for first in range(start, stop, range_size)]
+        pool = page_pool()
+        try:
+            futures = [pool.submit(decode_page_range, self.path, first, last, scan) for first, last in ranges]
+            scans = []
+            for (first, last), future in zip(ranges, futures):
+                pages, range_scan = future.result()
+                scans.append(range_scan)
+                for index, (text, blocks) in enumerate(pages, first):
+                    if self._texts[index] is None:
+                        self._texts[index], self._blocks[index] = text, blocks
+                        self.page_decodes += 1
+            self.opens += len(ranges)
+        except (OSError, concurrent.futures.process.BrokenProcessPool) as e:
+            _drop_page_pool(pool)  # a new pool is started for the next document
+            print(f"Warning: parallel decoding of {self.path} failed ({e}). Decoding serially instead.")
+            return None
+        return start, stop, scans
+
+    def _decode_all(self):
+        """
+        Decode every page not decoded yet, in parallel page ranges for large documents.
+        """
+        self._decode_ranges()
+        for index, text in enumerate(self._texts):
+            if text is None:
+                self._decode(index)
+        self.close()
+
+    def scan_pages(self, scan) -> list:
+        """
+        `scan` applied to the blocks of consecutive page ranges covering the whole document, in page order.
+        The ranges of a large document are decoded and scanned in the page pool at the same time,
+        the pages decoded before (e.g. the head read for the metadata) are scanned here.
+        `scan` must be a module-level function, to be sent to the pool, and its results mergeable by the caller.
+        """
+        decoded = self._decode_ranges(scan)
+        self._decode_all()
+        if decoded is None:
+            return [scan(list(self._blocks))]
+        start, stop, scans = decoded
+        return [scan(self._blocks[:start])] + scans + [scan(self._blocks[stop:])]
+
+    def page_text(self, index: int) -> str:
+        if self._texts[index] is None:
+            self._decode(index % self.page_count)
+        return self._texts[index]
+
+    def page_layout(self, index: int) -> list:
+        if self._blocks[index] is None:
+            self._decode(index % self.page_count)
+        return self._blocks[index]
+
+    @property
+    def page_texts(self) -> list[str]:
+        self._decode_all()
+        return list(self._texts)
+
+    @property
+    def page_blocks(self) -> list[list]:
+        self._decode_all()
+        return list(self._blocks)
+
+    @property
+    def full_text(self) -> str:
+        return "\n".join(self.page_texts)
+
+    def pages_text(self, nbpages: int, offset: int = 0, max_chars: int = None) -> str:
+        """
+        Join the text of `nbpages` pages starting at `offset` (negative offsets count from the end).
+        Only the pages needed are decoded, and at most `max_chars` characters are returned.
+        """
+        start = offset if offset >= 0 else max(self.page_count + offset, 0)
+        stop = min(start + nbpages, self.page_count)
+        parts = []
+        length = 0
+        for index in range(start, stop):
+            if max_chars is not None and length >= max_chars:
+                break
+            text = self.page_text(index)
+            parts.append(text)
+            length += len(text) + 1
+        text = " ".join(parts)
+        return text if max_chars is None else text[:max_chars]
+
+    def head(self, nbpages: int, max_chars: int = None) -> str:
+        return self.pages_text(nbpages, 0, max_chars)
+
+    def tail(self, nbpages: int, max_chars: int = None) -> str:
+        return self.pages_text(nbpages, -nbpages, max_chars)
+
+    def stats(self) -> dict:
+        return {"pages": self.page_count, "opens": self.opens, "page_decodes": self.page_decodes}
+
+
+def as_parsed_document(source) -> ParsedDocument:
+    """
+    Return `source` unchanged if it is already a ParsedDocument, otherwise open the PDF at that path.
+    """
+    if isinstance(source, ParsedDocument):
+        return source
+    return ParsedDocument(source)
@@ -3,61 +3,163 @@
 import os
 from typing import Dict, Any, List
 import time
-import concurrent.futures
+import asyncio
 
-from rag_app.utils.style_applier import apply_writing_style
+from rag_app.utils.style_applier import apply_writing_style, aapply_writing_style
 
 # Import agents
-from .file_loader import ingest_folder
-from .metadata_extractor import metadata_extractor
-from .research_question import research_question_extractor
-from .methodology_summary import methodology_summarizer
-from .findings_synthesizer import findings_synthesizer
-from .theme_cluster import thematic_synthesizer
-from .gap_identifier import gap_identifier
+from .file_loader import iter_ingest_folder
+from .metadata_extractor import metadata_extractor, ametadata_extractor
+from .research_question import research_question_extractor, aresearch_question_extractor
+from .methodology_summary import methodology_summarizer, amethodology_summarizer
+from .findings_synthesizer import findings_synthesizer, afindings_synthesizer
+from .theme_cluster import thematic_synthesizer, athematic_synthesizer
+from .gap_identifier import gap_identifier, agap_identifier
 from .vector_store import build_vector_store, retrieve_relevant
 from .reranker import rerank_excerpts
-from .composer import compose_review
-from .editor import edit_review
+from .composer import compose_review, acompose_review
+from .editor import edit_review, aedit_review
+from .section_composer import COMPOSITION_MODE, compose_by_sections, acompose_by_sections
+from .rate_limiter import rate_limiter
+from .llm_cache import llm_cache
+from .paper_encoding import encoding_stats
+from .embedding_service import embedding_service
+from .task_scheduler import TaskScheduler
+from .paper_extractor import EXTRACTION_MODE, fused_extractor, afused_extractor
+from .extractor_batching import BATCH_AGENTS, BatchCollector, batch_budget, run_batch, arun_batch
+from .batch_api import run_batch_extraction
 import json
 
-def process_paper(fname, sections):
-    print(f"\nProcessing paper: {fname}")
+# `async`: one event loop drives every LLM call, `threads`: the task graph below runs them on a pool of threads,
+# `batch`: the extractions go through the Batch API (see batch_api.py), then the review is written as in `async`
+LLM_EXECUTION = os.getenv("LLM_EXECUTION", "async")
+# Agent calls running at the same time, for the whole pipeline in `threads` mode
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "16"))
+# Lower runs first: finish what is started (review, then papers) before extracting new papers
+REVIEW_PRIORITY = 0
+PAPER_PRIORITY = 1
+EXTRACTOR_PRIORITY = 2
+
+EXTRACTORS = [
+    ("metadata", metadata_extractor, "metadata"),
+    ("research_question", research_question_extractor, "research_question_sections"),
+    ("methodology", methodology_summarizer, "methodology_sections"),
+    ("findings", findings_synthesizer, "findings_sections"),
+    ("gaps", gap_identifier, "gaps_sections"),
+]
+ASYNC_EXTRACTORS = [
+    (ametadata_extractor, "metadata"),
+    (aresearch_question_extractor, "research_question_sections"),
+    (amethodology_summarizer, "methodology_sections"),
+    (afindings_synthesizer, "findings_sections"),
+    (agap_identifier, "gaps_sections"),
+]
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_md = executor.submit(metadata_extractor, sections['metadata'])
-        future_rq = executor.submit(research_question_extractor, sections['research_question_sections'])
-        future_meth = executor.submit(methodology_summarizer, sections['methodology_sections'])
-        future_finds = executor.submit(findings_synthesizer, sections['findings_sections'])
-        future_gaps = executor.submit(gap_identifier, sections['gaps_sections'])
-        md = future_md.result()
-        rq = future_rq.result()
-        meth = future_meth.result()
-        finds = future_finds.result()
-        gaps = future_gaps.result()
 
+def assemble_paper(fname, md, rq, meth, finds, gaps):
     return {
         "filename": fname,
-        "metadata": md,
+        "metadata": md or {},
         "research_question": rq.get("research_question", ""),
         "methodology": meth.get("methodology", []),
         "findings": finds.get("findings", []),
         "gaps": gaps.get("gaps", []),
     }
 
-def run_rag_litreview(folder_path: str, topic: str=None, writing_style: str=None) -> Dict[str, Any]:
+
+def fused_process_paper(fname, sections):
     """
-    End-to-end pipeline:
-    1. Ingest PDFs → raw text corpus
-    2. Metadata, question, method, findings, gaps, citations per paper
-    3. Build vector store for retrieval
-    4. Cluster themes across all papers
-    5. Compose & edit final review
-    Returns final edited review plus intermediate data.
+    Extract the paper in a single call, or with the 5 agents one after the other if it failed.
+    """
+    results = fused_extractor(sections)
+    if results is None:
+        print(f"Fused extraction failed for {fname}, calling the extractor agents instead.")
+        results = [agent(sections[section]) for _, agent, section in EXTRACTORS]
+    return assemble_paper(fname, *results)
+
+
+def add_paper_tasks(scheduler: TaskScheduler, fname, sections):
+    """
+    Add the 5 extractor tasks of a paper and the task assembling their results
+    (a single task in fused EXTRACTION_MODE). Returns the key of the latter.
+    """
+    print(f"\nProcessing paper: {fname}")
+    if EXTRACTION_MODE == "fused":
+        return scheduler.add((fname, "paper"), fused_process_paper, fname, sections, priority=EXTRACTOR_PRIORITY)
+    deps = [
+        scheduler.add((fname, name), agent, sections[section], priority=EXTRACTOR_PRIORITY)
+        for name, agent, section in EXTRACTORS
+    ]
+    return scheduler.add((fname, "paper"), assemble_paper, fname, deps=deps, priority=PAPER_PRIORITY)
+
+
+def process_paper(fname, sections):
+    with TaskScheduler(max_workers=len(EXTRACTORS)) as scheduler:
+        return scheduler.result(add_paper_tasks(scheduler, fname, sections))
+
+
+def assemble_batched(fname, *batch_results):
+    return assemble_paper(fname, *(results[fname] for results in batch_results))
+
+
+def add_batch_tasks(scheduler: TaskScheduler, batches, paper_batches: dict):
+    """
+    Add a task per ready batch, and the assemble task of each paper once all its batches are added.
+    :param paper_batches: Dict fname -> {agent name: batch task key}, filled as batches are added.
+    """
+    for name, items in batches:
+        key = scheduler.add((name, "batch", items[0][0]), run_batch, name, items, priority=EXTRACTOR_PRIORITY)
+        for fname, _ in items:
+            keys = paper_batches.setdefault(fname, {})
+            keys[name] = key
+            if len(keys) == len(BATCH_AGENTS):
+                deps = [keys[agent] for agent in BATCH_AGENTS]
+                scheduler.add((fname, "paper"), assemble_batched, fname, deps=deps, priority=PAPER_PRIORITY)
+
+
+async def aprocess_paper(fname, sections):
+    print(f"\nProcessing paper: {fname}")
+    if EXTRACTION_MODE == "fused":
+        results = await afused_extractor(sections)
+        if results is not None:
+            return assemble_paper(fname, *results)
+        print(f"Fused extraction failed for {fname}, calling the extractor agents instead.")
+    results = await asyncio.gather(*(agent(sections[section]) for agent, section in ASYNC_EXTRACTORS))
+    return assemble_paper(fname, *results)
+
+
+async def aassemble_batched(fname, batch_tasks):
+    return assemble_batched(fname, *(await asyncio.gather(*batch_tasks)))
+
+
+def paper_title(paper):
+    return paper["metadata"].get("title", paper["filename"])
+
+
+def attach_themes(paper_data, themes):
+    for paper in paper_data:
+        title = paper_title(paper)
+        paper["themes"] = [
+            theme for theme, members in themes.items() if title in members
+        ]
+
+
+def cluster_themes(*paper_data):
+    """
+    Cluster the papers by title and attach the theme labels back to them. Returns (paper_data, themes).
+    """
+    print("\nTheme clustering")
+    paper_data = list(paper_data)
+    titles = [paper_title(paper) for paper in paper_data]
+    themes = thematic_synthesizer(titles, n_clusters=min(5, len(titles)))
+    attach_themes(paper_data, themes)
+    return paper_data, themes
+
+
+def load_settings():
+    """
+    Dynamically load settings from AppSettings. Returns (nbchar, max_tokens_compose, max_tokens_edit).
     """
-    LR_start_time = time.time()
-    
-    # Dynamically load settings from AppSettings
     try:
         from rag_app.models import AppSettings
         settings = AppSettings.get_solo()
@@ -80,68 +182,238 @@ def run_rag_litreview(folder_path: str, topic: str=None, writing_style: str=None
         max_tokens_compose = 1500
         max_tokens_edit = 1500
     print(f"Using settings: {nbchar}, max_tokens_compose={max_tokens_compose}, max_tokens_edit={max_tokens_edit}")
-    corpus = ingest_folder(folder_path, nbchar)
-     
-    # 2. Per-paper agents
+    return nbchar, max_tokens_compose, max_tokens_edit
+
+
+def failed_review(error):
+    """
+    (raw_draft, LR_styled, final_review) of a review that could not be composed.
+    """
+    print(f"Error in compose_review: {error}")
+    return (
+        "Error too many papers in input",
+        "Error too many papers in input",
+        "Error : The literature review could not be generated, because it would have exceed the Token Per Minute limit (TPM). "
+        "Please reduce the number of papers given in input.",
+    )
+
+
+async def aiter_ingest_folder(folder_path: str, nbchar):
+    """
+    `iter_ingest_folder` for the event loop: the loader keeps parsing in its own workers,
+    the loop only waits for the next parsed paper in a thread.
+    """
+    papers = iter_ingest_folder(folder_path, nbchar)
+    while True:
+        paper = await asyncio.to_thread(next, papers, None)
+        if paper is None:
+            return
+        yield paper
+
+
+def run_rag_litreview(folder_path: str, topic: str=None, writing_style: str=None) -> Dict[str, Any]:
+    """
+    End-to-end pipeline:
+    1. Ingest PDFs → raw text corpus
+    2. Metadata, question, method, findings, gaps, citations per paper
+    3. Build vector store for retrieval
+    4. Cluster themes across all papers
+    5. Compose & edit final review
+    Returns final edited review plus intermediate data.
+    Runs `arun_rag_litreview` on a new event loop, or the threaded pipeline if LLM_EXECUTION is `threads`,
+    or the Batch API one if it is `batch`.
+    """
+    if LLM_EXECUTION == "threads":
+        return run_rag_litreview_threaded(folder_path, topic, writing_style)
+    if LLM_EXECUTION == "batch":
+        return run_rag_litreview_batch(folder_path, topic, writing_style)
+    return asyncio.run(arun_rag_litreview(folder_path, topic, writing_style))
+
+
+def reset_run_stats():
+    rate_limiter.reset_stats()
+    llm_cache.reset_stats()
+    batch_budget.reset_stats()
+    encoding_stats.reset_stats()
+    embedding_service.reset_stats()
+
+
+def print_run_stats(LR_start_time: float):
+    print(f"Total time needed for the literature review: {time.time() - LR_start_time:.2f} seconds")
+    print(f"Rate limiter: {rate_limiter.stats()}")
+    print(f"LLM cache: {llm_cache.stats()}")
+    print(f"Composer and editor inputs: {encoding_stats.stats()}")
+    print(f"Embeddings: {embedding_service.stats()}")
+    if EXTRACTION_MODE == "batched":
+        print(f"Extractor batches: {batch_budget.stats()}")
+
+
+def run_rag_litreview_threaded(folder_path: str, topic: str=None, writing_style: str=None) -> Dict[str, Any]:
+    LR_start_time = time.time()
+    reset_run_stats()
+    nbchar, max_tokens_compose, max_tokens_edit = load_settings()
+
+    # 1-2. Ingestion streamed into the per-paper agents, then clustering → compose → style → edit,
+    # all on one task graph capped at PIPELINE_WORKERS: each task starts as soon as its inputs are ready
     start_time = time.time()
-    paper_data = []
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(process_paper, fname, sections)
-            for fname, sections in corpus.items()
+    with TaskScheduler(max_workers=PIPELINE_WORKERS) as scheduler:
+        if EXTRACTION_MODE == "batched":
+            # the agents' inputs are batched across papers: a paper is assembled once all its batches are done
+            collector, paper_batches, paper_keys = BatchCollector(), {}, []
+            for fname, sections in iter_ingest_folder(folder_path, nbchar):
+                print(f"\nProcessing paper: {fname}")
+                add_batch_tasks(scheduler, collector.add(fname, sections), paper_batches)
+                paper_keys.append((fname, "paper"))
+            add_batch_tasks(scheduler, collector.flush(), paper_batches)
+        else:
+            paper_keys = [
+                add_paper_tasks(scheduler, fname, sections)
+                for fname, sections in iter_ingest_folder(folder_path, nbchar)
+            ]
+        print(f"---Corpus loaded in {time.time() - start_time:.2f} seconds---")
+
+        # 3. Vector store (for potential ad-hoc retrieval)
+        # vector_store = build_vector_store(corpus)
+
+        # 4. Theme clustering — cluster by paper titles
+        scheduler.add("themes", cluster_themes, deps=paper_keys, priority=REVIEW_PRIORITY)
+
+        # 5. Compose, apply style & edit
+        def compose(clustered):
+            paper_data, themes = clustered
+            print("\nComposing review")
+            return compose_review({"papers": paper_data, "topic": topic}, max_tokens=max_tokens_compose, scheduler=scheduler)
+
+        def style(raw_draft):
+            print("\nApplying writing style")
+            return apply_writing_style(raw_draft, writing_style, max_tokens=max_tokens_compose)
+
+        def edit(clustered, draft):
+            paper_data, themes = clustered
+            print("\nEditing review")
+            all_metadata = [paper["metadata"] for paper in paper_data]
+            return edit_review(draft, max_tokens=max_tokens_edit, paper_metadata=all_metadata)
+
+        def write_sections(clustered):
+            paper_data, themes = clustered
+            print("\nComposing, styling and editing the review by sections")
+            return compose_by_sections(paper_data, topic, writing_style, max_tokens_edit, scheduler=scheduler)
+
+        if COMPOSITION_MODE == "sections":
+            scheduler.add("sections", write_sections, deps=["themes"], priority=REVIEW_PRIORITY)
+        else:
+            scheduler.add("compose", compose, deps=["themes"], priority=REVIEW_PRIORITY)
+            if writing_style:
+                scheduler.add("style", style, deps=["compose"], priority=REVIEW_PRIORITY)
+            scheduler.add("edit", edit, deps=["themes", "style" if writing_style else "compose"], priority=REVIEW_PRIORITY)
+
+        paper_data, themes = scheduler.result("themes")
+        print(f"---Corpus loaded and processed in {time.time() - start_time:.2f} seconds---")
+
+        status = "COMPLETED"
+        try:
+            if COMPOSITION_MODE == "sections":
+                raw_draft, LR_styled, final_review = scheduler.result("sections")
+            else:
+                raw_draft = scheduler.result("compose")
+                LR_styled = scheduler.result("style") if writing_style else "no style applied"
+                final_review = scheduler.result("edit")
+        except ValueError as e:
+            raw_draft, LR_styled, final_review = failed_review(e)
+            status = "FAILED"
+
+    print_run_stats(LR_start_time)
+
+    # Return full structure
+    return {
+        "paper_data": paper_data,
+        "themes": themes,
+        "topic": topic,
+        "raw_draft": raw_draft,
+        "LR_styled": LR_styled,
+        "final_review": final_review,
+        "status": status,
+    }
+
+
+async def arun_rag_litreview(folder_path: str, topic: str=None, writing_style: str=None) -> Dict[str, Any]:
+    """
+    Async pipeline: the same steps as `run_rag_litreview`, with every LLM call awaited on one event loop.
+    Each paper's extractors start as soon as it is parsed, all papers being in flight at the same time
+    (bounded by the rate limiter and the connection pool of the async client).
+    """
+    LR_start_time = time.time()
+    reset_run_stats()
+    # the Django ORM cannot be called from the event loop
+    nbchar, max_tokens_compose, max_tokens_edit = await asyncio.to_thread(load_settings)
+
+    # 1-2. Ingestion streamed into the per-paper agents
+    start_time = time.time()
+    if EXTRACTION_MODE == "batched":
+        collector, paper_batches, fnames = BatchCollector(), {}, []
+
+        def send(batches):
+            for name, items in batches:
+                task = asyncio.create_task(arun_batch(name, items))
+                for fname, _ in items:
+                    paper_batches.setdefault(fname, {})[name] = task
+
+        async for fname, sections in aiter_ingest_folder(folder_path, nbchar):
+            print(f"\nProcessing paper: {fname}")
+            send(collector.add(fname, sections))
+            fnames.append(fname)
+        send(collector.flush())
+        tasks = [
+            asyncio.ensure_future(aassemble_batched(fname, [paper_batches[fname][name] for name in BATCH_AGENTS]))
+            for fname in fnames
+        ]
+    else:
+        tasks = [
+            asyncio.create_task(aprocess_paper(fname, sections))
+            async for fname, sections in aiter_ingest_folder(folder_path, nbchar)
         ]
-        for future in concurrent.futures.as_completed(futures):
-            paper_data.append(future.result())
-    print(f"---Corpus processed in {time.time() - start_time:.2f} seconds---")
+    print(f"---Corpus loaded in {time.time() - start_time:.2f} seconds---")
+    paper_data = list(await asyncio.gather(*tasks))
+    print(f"---Corpus loaded and processed in {time.time() - start_time:.2f} seconds---")
 
-    print("\nVectorisation")
-    # 3. Vector store (for potential ad-hoc retrieval)
-    # vector_store = build_vector_store(corpus)
+    result = await areview_papers(paper_data, topic, writing_style, max_tokens_compose, max_tokens_edit)
+    print_run_stats(LR_start_time)
+    return result
 
-    print("\nTheme clustering")
+
+async def areview_papers(paper_data: list, topic: str, writing_style: str, max_tokens_compose: int, max_tokens_edit: int) -> Dict[str, Any]:
+    """
+    Steps 4-5 of the pipeline on the extracted papers: theme clustering, then compose, apply style & edit.
+    """
     # 4. Theme clustering — cluster by paper titles
-    titles = [paper["metadata"].get("title", paper["filename"]) for paper in paper_data]
-    themes = thematic_synthesizer(titles, n_clusters=min(5, len(titles)))
-    # attach theme labels back to papers
-    for paper in paper_data:
-        paper_title = paper["metadata"].get("title", paper["filename"])
-        paper["themes"] = [
-            theme for theme, members in themes.items() if paper_title in members
-        ]
+    print("\nTheme clustering")
+    titles = [paper_title(paper) for paper in paper_data]
+    themes = await athematic_synthesizer(titles, n_clusters=min(5, len(titles)))
+    attach_themes(paper_data, themes)
 
     # 5. Compose, apply style & edit
-    all_data = {"papers": paper_data, "topic": topic}
     all_metadata = [paper["metadata"] for paper in paper_data]
-    
-    print("\nComposing review")
     status = "COMPLETED"
     try:
-        raw_draft = compose_review(all_data, max_tokens=max_tokens_compose)
-
-        if writing_style:
-            print("\nApplying writing style")
-            LR_styled = apply_writing_style(raw_draft, writing_style, max_tokens=max_tokens_compose)
-            
-            print("\nEditing review")
-            final_review = edit_review(LR_styled, max_tokens=max_tokens_edit, paper_metadata=all_metadata)
+        if COMPOSITION_MODE == "sections":
+            print("\nComposing, styling and editing the review by sections")
+            raw_draft, LR_styled, final_review = await acompose_by_sections(paper_data, topic, writing_style, max_tokens_edit)
         else:
-            LR_styled = "no style applied"
+            print("\nComposing review")
+            raw_draft = await acompose_review({"papers": paper_data, "topic": topic}, max_tokens=max_tokens_compose)
+            if writing_style:
+                print("\nApplying writing style")
+                LR_styled = await aapply_writing_style(raw_draft, writing_style, max_tokens=max_tokens_compose)
+                draft = LR_styled
+            else:
+                LR_styled = "no style applied"
+                draft = raw_draft
             print("\nEditing review")
-            final_review = edit_review(raw_draft, max_tokens=max_tokens_edit, paper_metadata=all_metadata)
-
+            final_review = await aedit_review(draft, max_tokens=max_tokens_edit, paper_metadata=all_metadata)
     except ValueError as e:
-        print(f"Error in compose_review: {e}")
-        raw_draft = "Error too many papers in input"
-        LR_styled = "Error too many papers in input"
-        final_review = (
-            "Error : The literature review could not be generated, because it would have exceed the Token Per Minute limit (TPM). "
-            "Please reduce the number of papers given in input."
-        )
+        raw_draft, LR_styled, final_review = failed_review(e)
         status = "FAILED"
 
-    print(f"Total time needed for the literature review: {time.time() - LR_start_time:.2f} seconds")
-    
-    # Return full structure
     return {
         "paper_data": paper_data,
         "themes": themes,
@@ -152,3 +424,21 @@ def run_rag_litreview(folder_path: str, topic: str=None, writing_style: str=None
         "status": status,
     }
 
+
+def run_rag_litreview_batch(folder_path: str, topic: str=None, writing_style: str=None) -> Dict[str, Any]:
+    """
+    Pipeline for overnight runs: all the per-paper extractions are written to one batch requests file,
+    submitted to the batch backend and polled until done; the review is then written from the results.
+    An interrupted run resumes polling the batch it submitted.
+    """
+    LR_start_time = time.time()
+    reset_run_stats()
+    nbchar, max_tokens_compose, max_tokens_edit = load_settings()
+
+    start_time = time.time()
+    paper_data = [assemble_paper(fname, *outputs) for fname, outputs in run_batch_extraction(folder_path, nbchar)]
+    print(f"---Corpus loaded and processed in {time.time() - start_time:.2f} seconds---")
+
+    result = asyncio.run(areview_papers(paper_data, topic, writing_style, max_tokens_compose, max_tokens_edit))
+    print_run_stats(LR_start_time)
+    return result
@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+import threading
+
+# Budgets of the OpenAI account (tier limits), shared by every agent of the process. 0: not metered,
+# the requests are only held back after a rate limit error
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "0"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "0"))
+
+
+def estimate_tokens(messages: list, max_tokens: int = None) -> int:
+    """
+    Cheap estimate of the tokens a chat completion counts against the TPM:
+    ~4 characters per prompt token, plus the `max_tokens` of the completion if it is set.
+    """
+    prompt_chars = sum(len(message.get("content") or "") for message in messages)
+    return prompt_chars // 4 + 4 * len(messages) + (max_tokens or 0)
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously at `capacity` per minute.
+    Taking more than available leaves a debt: the caller waits for it to be refilled,
+    and the next callers queue behind it instead of all retrying at the same time.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, amount: float, now: float) -> float:
+        """
+        Take `amount` (capped to the capacity) and return how long to wait before using it.
+        """
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+
+class RateLimiter:
+    """
+    Process-wide limiter metering requests and estimated tokens against RPM/TPM budgets before sending
+    (a budget of 0 is not metered).
+    After a rate limit error, `pause` holds every caller back, not only the one that got the error.
+    """
+
+    def __init__(self, rpm: int = OPENAI_RPM, tpm: int = OPENAI_TPM):
+        self._lock = threading.Lock()
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+        self._paused_until = 0.0
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.nb_requests = 0
+            self.nb_tokens = 0
+            self.nb_waits = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+            self.nb_rate_limit_errors = 0
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Book one request of `tokens` and return how long the caller has to wait before sending it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self._requests.take(1, now) if self._requests else 0.0,
+                self._tokens.take(tokens, now) if self._tokens else 0.0,
+                self._paused_until - now,
+            )
+            self.nb_requests += 1
+            self.nb_tokens += tokens
+            if wait > 0:
+                self.nb_waits += 1
+                self.wait_seconds += wait
+                self.max_wait_seconds = max(self.max_wait_seconds, wait)
+            return wait
+
+    def acquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def async_acquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """
+        Called after a rate limit error: no request is sent before `seconds` from now.
+        """
+        with self._lock:
+            self.nb_rate_limit_errors += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.nb_requests,
+                "estimated_tokens": self.nb_tokens,
+                "waited_requests": self.nb_waits,
+                "wait_seconds": round(self.wait_seconds, 2),
+                "max_wait_seconds": round(self.max_wait_seconds, 2),
+                "rate_limit_errors": self.nb_rate_limit_errors,
+            }
+
+
+rate_limiter = RateLimiter()
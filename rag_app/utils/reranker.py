@@ -1,10 +1,21 @@
 # reranker.py   # RelevanceRerankerAgent
 
-from typing import List, Tuple
-from openai import OpenAI
+import os
+import json
+import hashlib
+import concurrent.futures
+from typing import Dict, List, Optional, Tuple
 from langchain.docstore.document import Document
+from .llm_retry import retry_on_rate_limit
+from .llm_client import chat_completion
+from .llm_cache import llm_cache
+from .lexical_index import BM25Index, prefilter
 
-openai_client = OpenAI()
+# "listwise": the candidates are scored by groups in a few concurrent calls, "pointwise": one call per candidate
+RERANK_MODE = os.getenv("RERANK_MODE", "listwise")
+# Candidates scored in one listwise call, and listwise calls running at the same time
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "10"))
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "8"))
 
 # Prompt template to score relevance
 SCORE_PROMPT_TEMPLATE = """You are an expert academic reviewer.
@@ -18,35 +29,146 @@ Excerpt:
 {excerpt}
 \"\"\""""
 
+LISTWISE_PROMPT_TEMPLATE = """You are an expert academic reviewer.
+Given the query and the numbered document excerpts below, rate how relevant each excerpt is to answering the query on a scale from 1 (irrelevant) to 5 (highly relevant).
+Return ONLY a valid JSON object mapping each excerpt number (as a string) to its score, e.g. {{"1": 4, "2": 1}}.
+
+Query: {query}
+
+{excerpts}"""
+
+@retry_on_rate_limit
 def score_relevance(query: str, excerpt: str) -> int:
     """Call the LLM to score the relevance of one excerpt."""
     prompt = SCORE_PROMPT_TEMPLATE.format(query=query, excerpt=excerpt)
-    response = openai_client.chat.completions.create(
+    content = chat_completion(
         model="gpt-4",
         messages=[{"role": "user", "content": prompt}],
+        name="relevance_scoring_request"
     )
     try:
-        score = int(response.choices[0].message.content.strip())
+        score = int(content.strip())
     except ValueError:
         score = 1
     return score
 
+def score_key(query: str, excerpt: str) -> str:
+    """
+    Key of the relevance score in the LLM cache: the same (query, excerpt) is only scored once, whatever the group it is in.
+    """
+    excerpt_hash = hashlib.sha256(excerpt.encode("utf-8")).hexdigest()
+    return llm_cache.key({"model": "gpt-4", "rerank_query": query, "excerpt_sha256": excerpt_hash})
+
+
+def as_score(value) -> int:
+    try:
+        return min(max(int(value), 1), 5)
+    except (TypeError, ValueError):
+        return 1
+
+
+def parse_scores(content: str) -> dict:
+    """
+    Scores of a listwise answer, by excerpt number (as a string). The JSON object may be wrapped in a code fence
+    or surrounded by text; values that are not numbers between 1 and 5 are left out. Empty if there is no object.
+    """
+    content = (content or "").strip()
+    if content.startswith("```"):
+        content = content.strip("`").strip()
+        if content.lower().startswith("json"):
+            content = content[4:]
+    start, end = content.find("{"), content.rfind("}")
+    try:
+        scores = json.loads(content[start : end + 1]) if 0 <= start < end else {}
+    except ValueError:
+        scores = {}
+    if not isinstance(scores, dict):
+        return {}
+    parsed = {}
+    for number, score in scores.items():
+        try:
+            score = int(score)
+        except (TypeError, ValueError):
+            continue
+        if 1 <= score <= 5:
+            parsed[str(number).strip()] = score
+    return parsed
+
+
+@retry_on_rate_limit
+def score_relevance_list(query: str, excerpts: List[str]) -> List[Optional[int]]:
+    """
+    Call the LLM once to score the relevance of several excerpts. Excerpts left unscored by the answer get None.
+    The raw answer is not cached, only the scores parsed from it (see `score_candidates`).
+    """
+    numbered = "\n\n".join(f'[{i}]\n"""\n{excerpt}\n"""' for i, excerpt in enumerate(excerpts, 1))
+    content = chat_completion(
+        cache=False,
+        model="gpt-4",
+        messages=[{"role": "user", "content": LISTWISE_PROMPT_TEMPLATE.format(query=query, excerpts=numbered)}],
+        name="listwise_relevance_scoring_request"
+    )
+    scores = parse_scores(content)
+    return [scores.get(str(i)) for i in range(1, len(excerpts) + 1)]
+
+
+def score_candidates(query: str, excerpts: List[str]) -> Dict[str, int]:
+    """
+    Scores of the distinct excerpts: cached ones first, the others scored by groups of RERANK_BATCH_SIZE
+    in concurrent listwise calls, so that the latency barely grows with the number of candidates.
+    Excerpts the listwise answers left unscored are scored one by one with `score_relevance`;
+    only the scores read from a listwise answer are cached.
+    :return: Dict excerpt -> score.
+    """
+    scores, pending = {}, []
+    for excerpt in dict.fromkeys(excerpts):
+        cached = llm_cache.get(score_key(query, excerpt)) if llm_cache.enabled else None
+        if cached is not None:
+            scores[excerpt] = as_score(cached)
+        else:
+            pending.append(excerpt)
+
+    groups = [pending[i : i + RERANK_BATCH_SIZE] for i in range(0, len(pending), RERANK_BATCH_SIZE)]
+    unscored = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(min(RERANK_WORKERS, len(groups)), 1)) as executor:
+        for group, group_scores in zip(groups, executor.map(lambda group: score_relevance_list(query, group), groups)):
+            for excerpt, score in zip(group, group_scores):
+                if score is None:
+                    unscored.append(excerpt)
+                    continue
+                scores[excerpt] = score
+                if llm_cache.enabled:
+                    llm_cache.put(score_key(query, excerpt), str(score))
+        if unscored:
+            print(f"Listwise reranking: {len(unscored)} excerpts unscored, scoring them one by one")
+            scores.update(zip(unscored, executor.map(lambda excerpt: score_relevance(query, excerpt), unscored)))
+    return scores
+
+
 def rerank_excerpts(
     query: str, 
-    candidates: List[Tuple[str, str]]
+    candidates: List[Tuple[str, str]],
+    lexical_index: BM25Index = None
 ) -> List[Tuple[str, str]]:
     """
     Rerank candidate excerpts based on LLM relevance scores.
+    Only the RERANK_PREFILTER_K best candidates by BM25 score are scored by the LLM, the other ones follow them.
     :param query: The user or agent query string.
     :param candidates: List of (source_doc_id, excerpt_text).
+    :param lexical_index: BM25 statistics of the chunk store (see `vector_store.lexical_index`), default: of the candidates.
     :return: Candidates sorted by descending relevance.
     """
+    candidates, dropped = prefilter(query, candidates, index=lexical_index)
     scored: List[Tuple[int, str, str]] = []
-    for doc_id, excerpt in candidates:
-        score = score_relevance(query, excerpt)
-        scored.append((score, doc_id, excerpt))
+    if RERANK_MODE == "listwise":
+        scores = score_candidates(query, [excerpt for _, excerpt in candidates])
+        scored = [(scores[excerpt], doc_id, excerpt) for doc_id, excerpt in candidates]
+    else:
+        for doc_id, excerpt in candidates:
+            score = score_relevance(query, excerpt)
+            scored.append((score, doc_id, excerpt))
 
     # Sort by score descending
     scored.sort(reverse=True, key=lambda x: x[0])
-    # Return top excerpts (dropping score)
-    return [(doc_id, excerpt) for score, doc_id, excerpt in scored]
+    # Return top excerpts (dropping score), then the ones left out by the prefilter
+    return [(doc_id, excerpt) for score, doc_id, excerpt in scored] + dropped
@@ -1,7 +1,7 @@
 from typing import Dict
 from langfuse import get_client
-from langfuse.openai import openai
-from .llm_retry import extractor_retry_or_none
+from .llm_retry import extractor_retry_or_none, async_extractor_retry_or_none
+from .llm_client import chat_completion, async_chat_completion
 
 langfuse = get_client()
 
@@ -11,24 +11,44 @@ Extract the main research question or hypothesis from the following academic pap
 Respond in one sentence.'''
 
 
-@extractor_retry_or_none
-def extract_research_question(text: str) -> str:
+def research_question_request(text: str) -> Dict:
     """
-    Calls LLM to extract the core research question or hypothesis.
+    Arguments of the chat completion extracting the core research question or hypothesis.
     """
-    response = openai.chat.completions.create(
+    return dict(
         model='gpt-4',
         messages=[
             {'role':'system','content':'You are a research question extraction agent.'},
             {'role':'user','content':PROMPT + "\n\n" + text}],
         name="rq_extraction_request"
     )
-    return response.choices[0].message.content.strip()
+
+
+def parse_research_question(content: str) -> str:
+    return content.strip()
+
+
+@extractor_retry_or_none
+def extract_research_question(text: str) -> str:
+    """
+    Calls LLM to extract the core research question or hypothesis.
+    """
+    return parse_research_question(chat_completion(**research_question_request(text)))
+
+
+@async_extractor_retry_or_none
+async def aextract_research_question(text: str) -> str:
+    return parse_research_question(await async_chat_completion(**research_question_request(text)))
 
 
 def research_question_extractor(research_question_sections) -> Dict[str,str]:
     """
     call the LLM to extract the research question from the given sections of text.
     """
-    question = extract_research_question("test")
+    question = extract_research_question(research_question_sections)
+    return {'research_question': question}
+
+
+async def aresearch_question_extractor(research_question_sections) -> Dict[str,str]:
+    question = await aextract_research_question(research_question_sections)
     return {'research_question': question}
\ No newline at end of file
@@ -0,0 +1,39 @@
+import os
+import json
+import hashlib
+from .json_file_cache import JsonFileCache
+
+# Where the extracted sections are stored, and the max size of the cache on disk
+SECTION_CACHE_DIR = os.getenv("SECTION_CACHE_DIR", os.path.join("cache", "sections"))
+SECTION_CACHE_MAX_MB = int(os.getenv("SECTION_CACHE_MAX_MB", "200"))
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    sha256 of the content of a file, read by chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SectionCache(JsonFileCache):
+    """
+    Content-addressed on-disk cache of the sections extracted from a pdf.
+
+    Entries are keyed by the pdf content hash, the `nbchar` limits and the splitter version,
+    so renaming or moving a file is still a hit while any change of its content or of the
+    extraction parameters is a miss. Storage and LRU eviction are the ones of `JsonFileCache`.
+    """
+
+    def __init__(self, cache_dir: str = SECTION_CACHE_DIR, max_bytes: int = SECTION_CACHE_MAX_MB * 1024 * 1024):
+        super().__init__(cache_dir, max_bytes)
+
+    def key(self, pdf_path: str, nbchar: dict, version: str) -> str:
+        params = json.dumps({"pdf": file_digest(pdf_path), "nbchar": nbchar, "version": version}, sort_keys=True)
+        return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+
+section_cache = SectionCache()
@@ -0,0 +1,204 @@
+import os
+import re
+import asyncio
+from collections import OrderedDict, namedtuple
+from typing import Dict, List
+from .composer import MAX_PROMPT_TOKENS, SECTION_MAX_TOKENS, pack, theme_groups, section_request, section_completion, \
+    asection_completion, run_parallel
+from .style_applier import apply_writing_style, aapply_writing_style
+from .editor import edit_section, aedit_section
+from .paper_encoding import LEGEND, count_tokens, encode_papers, as_list
+from .task_scheduler import TaskScheduler
+
+# "review": the review is composed, styled and edited in one call each,
+# "sections": each heading of the review goes through its own compose → style → edit chain, all at the same time
+COMPOSITION_MODE = os.getenv("COMPOSITION_MODE", "review")
+
+SECTION_PROMPT = """
+You are a senior researcher writing one section of a literature review. {instruction}
+If a topic is provided, focus on that topic.
+Write in academic style. Cite the papers by their index in brackets, e.g. [3] or [3, 7], never as a range.
+Write only this section: {start}
+
+""" + LEGEND
+
+# Sections around the thematic synthesis: heading, instruction, fields of the papers they are written from
+Outline = namedtuple("Outline", "heading instruction fields")
+INTRODUCTION = Outline(
+    "1. Introduction",
+    "Introduce the field and the scope of the reviewed papers, their research questions and the themes they cover.",
+    ("research_question",))
+THEME = Outline(
+    "2.{n} {theme}",
+    "Synthesize the research questions, methodologies and findings of the papers of this theme, comparing them.",
+    ("research_question", "methodology", "findings"))
+GAPS = Outline(
+    "3. Research Gaps",
+    "Synthesize the research gaps stated by the papers and the open questions they leave.",
+    ("gaps",))
+CONCLUSION = Outline(
+    "4. Conclusion",
+    "Conclude the review: summarize its main findings and the directions for future research.",
+    ("findings",))
+SYNTHESIS_HEADING = "2. Thematic Synthesis"
+
+CITATION = re.compile(r"\[(\d+(?:\s*,\s*\d+)*)\]")
+
+
+def outline_requests(heading: str, instruction: str, fields: tuple, papers: list, topic: str) -> List[Dict]:
+    """
+    Requests writing a section from the given (index, paper): one request, or one per part of the papers
+    if they do not fit in one call, the parts after the first one continuing the section without its heading.
+    """
+    header = f"Topic: {topic}\n\n" if topic else ""
+    prompt = SECTION_PROMPT.format(instruction=instruction, start=f'start with the heading "{heading}".')
+    budget = MAX_PROMPT_TOKENS - count_tokens(prompt + header) - SECTION_MAX_TOKENS
+    chunks = pack(papers, budget, lambda item: count_tokens(encode_papers([item[1]], indices=[item[0]], fields=fields)))
+    requests = []
+    for part, chunk in enumerate(chunks, 1):
+        if part > 1:
+            prompt = SECTION_PROMPT.format(
+                instruction=instruction,
+                start=f'continue the section "{heading}" (part {part} of {len(chunks)}) from the papers below, without heading.')
+        indices, chunk_papers = zip(*chunk)
+        content = header + encode_papers(list(chunk_papers), indices=list(indices), fields=fields)
+        requests.append(section_request(prompt, content, SECTION_MAX_TOKENS, "section_composition_request"))
+    return requests
+
+
+def section_requests(paper_data: list, topic: str) -> "OrderedDict[str, List[Dict]]":
+    """
+    Heading -> requests writing it, in the order of the review: introduction, one section per theme, gaps, conclusion.
+    """
+    papers = list(enumerate(paper_data, 1))
+    sections = OrderedDict()
+    sections[INTRODUCTION.heading] = outline_requests(*INTRODUCTION, papers, topic)
+    for n, (theme, theme_papers) in enumerate(theme_groups(paper_data).items(), 1):
+        heading = THEME.heading.format(n=n, theme=theme)
+        sections[heading] = outline_requests(heading, THEME.instruction, THEME.fields, theme_papers, topic)
+    sections[GAPS.heading] = outline_requests(*GAPS, papers, topic)
+    sections[CONCLUSION.heading] = outline_requests(*CONCLUSION, papers, topic)
+    return sections
+
+
+def ieee_authors(authors) -> str:
+    """
+    Authors as "J. Doe", from "John Doe" or "Doe, John".
+    """
+    names = []
+    for author in as_list(authors):
+        if "," in author:
+            last, given = author.split(",", 1)
+            first, last = given.split(), last.strip()
+        else:
+            *first, last = author.split() or [""]
+        names.append(" ".join([f"{name[0]}." for name in first] + [last]))
+    if len(names) > 2:
+        return ", ".join(names[:-1]) + ", and " + names[-1]
+    return " and ".join(names)
+
+
+def ieee_reference(metadata: dict, fname: str) -> str:
+    """
+    IEEE entry of a paper: A. Author and B. Author, "Title," Journal, year, doi: ...
+    """
+    metadata = metadata or {}
+    title = str(metadata.get("title") or "").strip() or fname
+    authors = ieee_authors(metadata.get("authors"))
+    details = [str(metadata[name]).strip() for name in ("journal", "year") if metadata.get(name)]
+    if metadata.get("doi"):
+        details.append(f"doi: {metadata['doi']}")
+    reference = (f"{authors}, " if authors else "") + (f'"{title}," ' + ", ".join(details) if details else f'"{title}"')
+    return reference + "."
+
+
+def number_citations(text: str, nb_papers: int):
+    """
+    Renumber the citations (indices of the papers in the corpus) in order of first appearance, as in IEEE style.
+    Returns the text and the corpus indices of the cited papers, in their new order.
+    """
+    order = OrderedDict()
+
+    def renumber(match):
+        numbers = [int(number) for number in match.group(1).split(",")]
+        if not all(1 <= number <= nb_papers for number in numbers):
+            return match.group(0)
+        return "[" + ", ".join(str(order.setdefault(number, len(order) + 1)) for number in numbers) + "]"
+
+    return CITATION.sub(renumber, text), list(order)
+
+
+def stitch(sections: "OrderedDict[str, List[str]]") -> str:
+    """
+    The review from the texts of its sections, in order, with the heading of the thematic synthesis.
+    """
+    parts = []
+    for heading, texts in sections.items():
+        if heading.startswith("2.1 "):
+            parts.append(SYNTHESIS_HEADING)
+        parts.append("\n\n".join(texts))
+    return "\n\n".join(parts)
+
+
+def final_review(edited: "OrderedDict[str, List[str]]", paper_data: list) -> str:
+    """
+    The stitched review with its citations numbered and the reference list built from the papers' metadata.
+    """
+    review, cited = number_citations(stitch(edited), len(paper_data))
+    references = [
+        f"[{n}] {ieee_reference(paper_data[index - 1].get('metadata'), paper_data[index - 1].get('filename', ''))}"
+        for n, index in enumerate(cited, 1)
+    ]
+    return review + "\n\nReferences\n" + "\n".join(references)
+
+
+def write_section(request: Dict, writing_style: str, max_tokens_edit: int) -> tuple:
+    """
+    Compose, apply style & edit one section. Returns (raw, styled or None, edited) texts.
+    """
+    raw = section_completion(request)
+    styled = apply_writing_style(raw, writing_style, max_tokens=SECTION_MAX_TOKENS) if writing_style else None
+    return raw, styled, edit_section(styled or raw, max_tokens=min(max_tokens_edit, SECTION_MAX_TOKENS))
+
+
+async def awrite_section(request: Dict, writing_style: str, max_tokens_edit: int) -> tuple:
+    raw = await asection_completion(request)
+    styled = await aapply_writing_style(raw, writing_style, max_tokens=SECTION_MAX_TOKENS) if writing_style else None
+    return raw, styled, await aedit_section(styled or raw, max_tokens=min(max_tokens_edit, SECTION_MAX_TOKENS))
+
+
+def assemble_sections(sections: "OrderedDict[str, List[Dict]]", written: list, paper_data: list, writing_style: str) -> tuple:
+    """
+    (raw_draft, LR_styled, final_review) from the (raw, styled, edited) texts written for the requests of `sections`.
+    """
+    written = iter(written)
+    raw, styled, edited = OrderedDict(), OrderedDict(), OrderedDict()
+    for heading, requests in sections.items():
+        texts = [next(written) for _ in requests]
+        raw[heading] = [text[0] for text in texts]
+        styled[heading] = [text[1] for text in texts]
+        edited[heading] = [text[2] for text in texts]
+    print(f"Review written in {sum(len(requests) for requests in sections.values())} parallel sections.")
+    return stitch(raw), stitch(styled) if writing_style else "no style applied", final_review(edited, paper_data)
+
+
+def compose_by_sections(paper_data: list, topic: str, writing_style: str, max_tokens_edit: int,
+                        scheduler: TaskScheduler = None) -> tuple:
+    """
+    Writes each heading of the review (introduction, each theme, research gaps, conclusion) at the same time,
+    each one composed, styled and edited on its own, then stitches them back in order and appends the reference list.
+    The time to the final review is the one of the longest section instead of the whole review, written 3 times.
+    :param scheduler: Task graph the review is written in, running the sections (see `run_parallel`).
+    :return: (raw_draft, LR_styled, final_review), as in the review COMPOSITION_MODE.
+    """
+    sections = section_requests(paper_data, topic)
+    requests = [request for section in sections.values() for request in section]
+    written = run_parallel(lambda request: write_section(request, writing_style, max_tokens_edit), requests, scheduler)
+    return assemble_sections(sections, written, paper_data, writing_style)
+
+
+async def acompose_by_sections(paper_data: list, topic: str, writing_style: str, max_tokens_edit: int) -> tuple:
+    sections = section_requests(paper_data, topic)
+    requests = [request for section in sections.values() for request in section]
+    written = await asyncio.gather(*(awrite_section(request, writing_style, max_tokens_edit) for request in requests))
+    return assemble_sections(sections, written, paper_data, writing_style)
@@ -1,35 +1,40 @@
-from langchain_community.document_loaders import PyPDFLoader
 import re
 import sys
+from .parsed_document import as_parsed_document
 
-def extract_sections_by_parsing(path):
-    loader = PyPDFLoader(path)
-    pages = loader.load()
-    full_text = "\n".join([page.page_content for page in pages])
+# Regex sur sections, compiled once at import
+SECTION_HEADERS = [
+    "abstract", "summary",
+    "keywords?", "key terms", "index terms",
+    "introduction", "background", "overview",
+    "related works?", "previous works?", "recent work", "prior work", "literature review", "state of the art","state-of-the-art",
+    "methods?", "methodology", "approach", "materials and methods",
+    "experiment", "experimental setup", "implementation details", "experimental details",
+    "results?", "findings", "evaluation results",
+    "discussion", "analysis", "interpretation",
+    "conclusion", "concluding remarks?", "summary and conclusion",
+    "future work", "outlook", "limitations?","limitations and future work",
+    "acknowledgment", "thanks",
+    "references", "bibliography", "works cited",
+    "appendix", "supplementary materials"
+]
+SECTION_PATTERN = re.compile(r"\n\s*(\d.\.?)*\s*(%s)\s*:?\s*\n" % "|".join(SECTION_HEADERS), flags=re.IGNORECASE)
+SECTION_NUMBER = re.compile(r"(\d\.?)+")
 
-    # Regex sur sections
-    section_headers = [
-        "abstract", "summary",
-        "keywords?", "key terms", "index terms",
-        "introduction", "background", "overview",
-        "related works?", "previous works?", "recent work", "prior work", "literature review", "state of the art","state-of-the-art",
-        "methods?", "methodology", "approach", "materials and methods",
-        "experiment", "experimental setup", "implementation details", "experimental details",
-        "results?", "findings", "evaluation results",
-        "discussion", "analysis", "interpretation",
-        "conclusion", "concluding remarks?", "summary and conclusion",
-        "future work", "outlook", "limitations?","limitations and future work",
-        "acknowledgment", "thanks",
-        "references", "bibliography", "works cited",
-        "appendix", "supplementary materials"
-    ]
-    
-    pattern = r"\n\s*(\d.\.?)*\s*(%s)\s*:?\s*\n" % "|".join(section_headers)
-    splits = re.split(pattern, full_text, flags=re.IGNORECASE)
+def extract_sections_by_parsing(source):
+    """
+    Split a paper into sections by matching known section headers in its plain text.
+    `source` is a pdf path or an already parsed document. The text is the PyMuPDF one of the shared document
+    (blocks joined by newlines), not the PyPDFLoader one: headers are detected on its line breaks.
+    """
+    doc = as_parsed_document(source)
+    full_text = doc.full_text
+
+    splits = SECTION_PATTERN.split(full_text)
 
     # Cleaning up splits
     splits = [s for s in splits if s is not None]
-    splits = [s for s in splits if not re.fullmatch(r"(\d\.?)+", s.strip())]
+    splits = [s for s in splits if not SECTION_NUMBER.fullmatch(s.strip())]
     
     sections = {}
     metadata = ""
@@ -48,7 +53,7 @@ def extract_sections_by_parsing(path):
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python section_splitter.py <pdf_path>")
+        print("Usage: python -m rag_app.utils.section_splitter <pdf_path>")
         sys.exit(1)
     pdf_path = sys.argv[1]
     metadata, result = extract_sections_by_parsing(pdf_path)
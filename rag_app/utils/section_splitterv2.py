@@ -1,95 +1,113 @@
-import fitz  # PyMuPDF
 from collections import OrderedDict
 import re
+from .parsed_document import as_parsed_document
 
-def extract_sections_by_format(pdf_path):
-    doc = fitz.open(pdf_path)
-    all_font_sizes = []
+# characters that reveal an equation rather than a title
+NOT_IN_TITLE = ("=", "<", ">", "∈", "+", "-")
+SECTION_NUMBER = re.compile(r"^(\d\.?)*\s*")
 
-    # compute the average font size across the document
-    for page in doc:
-        blocks = page.get_text("dict")["blocks"]
-        for b in blocks:
-            if "lines" not in b:
-                continue
-            for line in b["lines"]:
-                for span in line["spans"]:
-                    all_font_sizes.append(span["size"])
-    avg_font_size = sum(all_font_sizes) / len(all_font_sizes)
-
-    # extract sections, titles based on formatting, and remove images
-    sections = OrderedDict()
-    current_section = "initial"
-    sections[current_section] = []
-
-    for page_num, page in enumerate(doc):
-        blocks = page.get_text("dict")["blocks"]
 
+def scan_layout(page_blocks):
+    """
+    Single pass over the spans of the given pages.
+    Gathers the font size statistics and, for every text block, what is needed to decide later
+    whether it starts a section. Title classification needs the average font size of the whole
+    document, so it is done afterwards on these records only, without walking the pages again.
+    :return: (records, size_sum, size_count), records being one tuple
+        (title_candidate, max_size, styled, shape_ok, first_line_text, rest_text) per block.
+        Scans of consecutive page ranges can be merged by concatenating the records and summing the sizes.
+    """
+    records = []
+    size_sum = 0.0
+    size_count = 0
+    for blocks in page_blocks:
         for block in blocks:
-            if "lines" not in block or block["type"] != 0:
-                continue  # ignore images or non-text blocks
-
-            title_candidate = ""
+            first_line = block[0]
             max_size = 0
             bold_count = 0
-            total_spans = 0
-            first_line = block["lines"][0]
-            for span in first_line["spans"]:
-                title_candidate += span["text"]
-                max_size = max(max_size, span["size"])
-                if span["flags"] & 2:  # flag "bold"
+            for text, size, flags in first_line:
+                max_size = max(max_size, size)
+                if flags & 2:  # flag "bold"
                     bold_count += 1
-                total_spans += 1
+            for line in block:
+                for span in line:
+                    size_sum += span[1]
+                size_count += len(line)
 
-            title_candidate = title_candidate.strip()
+            first_line_text = "".join(span[0] for span in first_line)
+            title_candidate = first_line_text.strip()
             if not title_candidate or len(title_candidate) < 4:
                 continue
 
-            is_bold = bold_count / total_spans > 0.5
-            is_upper = title_candidate.isupper()
-            is_title = (
-                (
-                    (max_size > avg_font_size * 1.15)
-                    or is_bold
-                    or is_upper
-                )
-                and len(title_candidate.split()) <= 12
-                and "=" not in title_candidate  # to avoid equations
-                and "<" not in title_candidate
-                and ">" not in title_candidate
-                and "∈" not in title_candidate
-                and "+" not in title_candidate
-                and "-" not in title_candidate
+            styled = bold_count / len(first_line) > 0.5 or title_candidate.isupper()
+            shape_ok = (
+                len(title_candidate.split()) <= 12
+                and not any(char in title_candidate for char in NOT_IN_TITLE)
             )
-           
-            if "lines" not in block or block["type"] != 0:
-                continue  # ignorer images ou blocs non textuels
+            rest_text = " ".join("".join(span[0] for span in line) for line in block[1:])
+            records.append((title_candidate, max_size, styled, shape_ok, first_line_text, rest_text))
+    return records, size_sum, size_count
 
-            if is_title:
-                # Use only the first line as the section title
-                section_title = ""
-                for span in first_line["spans"]:
-                    section_title += span["text"]
-                section_title = section_title.replace("\n", " ").strip()
-                if section_title not in sections:
-                    section_title = re.sub(r"^(\d\.?)*\s*", "", section_title).strip()
-                    sections[section_title] = []
-                current_section = section_title
 
-            block_text = ""
-            for line in block["lines"][(1 if is_title else 0):]:
-                for span in line["spans"]:
-                    block_text += span["text"]
-            block_text = block_text.strip()
+def build_sections(records, avg_font_size):
+    """
+    Classify the scanned blocks into titles and text, and group the text by section.
+    Everything before the abstract, if there is one, is returned as metadata.
+    :return: (metadata, sections). `metadata` has one "title : text" line per section before the section
+        titled "abstract" (in any case), empty if there is none. `sections` maps each title to its text
+        as one string: one line per block, the lines of a block joined by spaces, empty blocks dropped.
+    """
+    sections = OrderedDict()
+    current_section = "initial"
+    sections[current_section] = []
+
+    for title_candidate, max_size, styled, shape_ok, first_line_text, rest_text in records:
+        is_title = (max_size > avg_font_size * 1.15 or styled) and shape_ok
+        if is_title:
+            # Use only the first line as the section title
+            section_title = title_candidate.replace("\n", " ")
+            if section_title not in sections:
+                section_title = SECTION_NUMBER.sub("", section_title).strip()
+                sections.setdefault(section_title, [])
+            current_section = section_title
+            block_text = rest_text
+        elif rest_text:
+            block_text = first_line_text + " " + rest_text
+        else:
+            block_text = first_line_text
+        block_text = block_text.strip()
+        if block_text:
             sections[current_section].append(block_text)
-            
-        # Group all sections before "abstract" into "metadata" if "abstract" exists
-        metadata_section = ""
-        if "abstract" in sections:
-            for key in list(sections.keys()):
-                if key == "abstract":
-                    break
-                metadata_section += "\n" + key + " : " + sections[key]
-                del sections[key]
-    
-    return metadata_section, sections
+
+    # Group all sections before "abstract" into "metadata" if "abstract" exists
+    metadata_parts = []
+    abstract_key = next((key for key in sections if key.lower() == "abstract"), None)
+    if abstract_key is not None:
+        for key in list(sections.keys()):
+            if key == abstract_key:
+                break
+            metadata_parts.append(key + " : " + " ".join(sections.pop(key)))
+    metadata_section = "\n".join(metadata_parts)
+
+    return metadata_section, OrderedDict((key, "\n".join(texts)) for key, texts in sections.items())
+
+
+def merge_scans(scans):
+    """
+    One scan of consecutive page ranges from the scans of each range, in page order.
+    """
+    records = [record for range_records, _, _ in scans for record in range_records]
+    return records, sum(scan[1] for scan in scans), sum(scan[2] for scan in scans)
+
+
+def extract_sections_by_format(source):
+    """
+    Split a paper into sections by detecting titles from their formatting (size, bold, uppercase).
+    `source` is a pdf path or an already parsed document. The pages of a large document are scanned by
+    ranges in parallel (see `ParsedDocument.scan_pages`), then the scans are merged to classify the titles.
+    """
+    doc = as_parsed_document(source)
+    records, size_sum, size_count = merge_scans(doc.scan_pages(scan_layout))
+    if not size_count:
+        return "", OrderedDict()
+    return build_sections(records, size_sum / size_count)
@@ -1,6 +1,6 @@
 from langfuse import get_client
-from langfuse.openai import openai
-from .llm_retry import retry_on_rate_limit
+from .llm_retry import retry_on_rate_limit, async_retry_on_rate_limit
+from .llm_client import chat_completion, async_chat_completion
 
 langfuse = get_client()
 
@@ -20,17 +20,12 @@ Writing Style Example:
 Maintain the academic tone, structure, and content of the review, but adapt the phrasing, sentence structure, and word choice to reflect the given writing style. Do not add or remove information.
 """
 
-@retry_on_rate_limit
-def apply_writing_style(lit_review: str, writing_style: str, max_tokens: int = 2048) -> str:
+def style_request(lit_review: str, writing_style: str, max_tokens: int = 2048) -> dict:
     """
-    Calls LLM to rewrite the literature review using the provided writing style.
-    :param lit_review: The original literature review text.
-    :param writing_style: The writing style sample to emulate.
-    :param max_tokens: Max tokens for the LLM response.
-    :return: The rewritten literature review in the target style.
+    Arguments of the chat completion rewriting the review (see `apply_writing_style`).
     """
     prompt = build_style_applier_prompt(writing_style) + "\n\n" + lit_review
-    response = openai.chat.completions.create(
+    return dict(
         model="gpt-4",
         messages=[
             {"role": "system", "content": "You are a scholarly writing style applier."},
@@ -40,4 +35,20 @@ def apply_writing_style(lit_review: str, writing_style: str, max_tokens: int = 2
         max_tokens=max_tokens,
         name="style_applier_request"
     )
-    return response.choices[0].message.content.strip()
+
+
+@retry_on_rate_limit
+def apply_writing_style(lit_review: str, writing_style: str, max_tokens: int = 2048) -> str:
+    """
+    Calls LLM to rewrite the literature review using the provided writing style.
+    :param lit_review: The original literature review text.
+    :param writing_style: The writing style sample to emulate.
+    :param max_tokens: Max tokens for the LLM response.
+    :return: The rewritten literature review in the target style.
+    """
+    return chat_completion(**style_request(lit_review, writing_style, max_tokens)).strip()
+
+
+@async_retry_on_rate_limit
+async def aapply_writing_style(lit_review: str, writing_style: str, max_tokens: int = 2048) -> str:
+    return (await async_chat_completion(**style_request(lit_review, writing_style, max_tokens))).strip()
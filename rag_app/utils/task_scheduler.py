@@ -0,0 +1,167 @@
+import heapq
+import itertools
+import threading
+import concurrent.futures
+
+
+class _Task:
+    def __init__(self, key, func, args, deps, priority):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.deps = tuple(deps)
+        self.priority = priority
+        self.waiting = set()
+        self.dependents = []
+        self.started = False
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class TaskScheduler:
+    """
+    Runs a graph of tasks on one bounded pool of threads.
+
+    A task starts as soon as all the tasks it depends on are done: it is called with its own
+    arguments followed by the results of its dependencies, in the order of `deps`.
+    Among the ready tasks, the lowest `priority` runs first, then the oldest one.
+    Tasks can be added while the graph is running, e.g. as papers come out of the ingestion,
+    or fanned out by a running task with `map`.
+    If a task raises, the tasks depending on it are not run and fail with the same exception.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        self._cond = threading.Condition()
+        self._tasks = {}
+        self._ready = []
+        self._order = itertools.count()
+        self._maps = itertools.count()
+        self._running = 0
+        self._local = threading.local()
+
+    def add(self, key, func, *args, deps=(), priority: int = 0):
+        """
+        Add the task `key` running `func(*args, *results_of_deps)`. Returns `key`.
+        """
+        deps = tuple(deps)
+        with self._cond:
+            if key in self._tasks:
+                raise ValueError(f"Task {key!r} already exists.")
+            for dep in deps:
+                if dep not in self._tasks:
+                    raise KeyError(f"Task {key!r} depends on unknown task {dep!r}.")
+            task = _Task(key, func, args, deps, priority)
+            self._tasks[key] = task
+            for dep in task.deps:
+                dep_task = self._tasks[dep]
+                if dep_task.error is not None:
+                    self._fail(task, dep_task.error)
+                    return key
+                if not dep_task.done:
+                    task.waiting.add(dep)
+                    dep_task.dependents.append(key)
+            if not task.waiting:
+                self._push(task)
+            self._dispatch()
+        return key
+
+    def _push(self, task):
+        heapq.heappush(self._ready, (task.priority, next(self._order), task.key))
+
+    def _dispatch(self):
+        # only hand to the pool what it can run now, so that priorities apply to everything still waiting
+        while self._ready and self._running < self.max_workers:
+            _, _, key = heapq.heappop(self._ready)
+            self._running += 1
+            self._tasks[key].started = True
+            self._executor.submit(self._run, self._tasks[key])
+
+    def _claim(self, key):
+        """
+        Take the task `key` out of the ready queue, to be run by the calling worker. None if it has started.
+        """
+        with self._cond:
+            task = self._tasks[key]
+            if task.started or task.done or task.waiting:
+                return None
+            task.started = True
+            self._ready = [entry for entry in self._ready if entry[2] != key]
+            heapq.heapify(self._ready)
+            return task
+
+    def _run(self, task, release: bool = True):
+        result, error = None, None
+        caller = getattr(self._local, "task", None)
+        self._local.task = task
+        try:
+            args = task.args + tuple(self._tasks[dep].result for dep in task.deps)
+            result = task.func(*args)
+        except BaseException as e:
+            error = e
+        self._local.task = caller
+        with self._cond:
+            if release:
+                self._running -= 1
+            if error is not None:
+                self._fail(task, error)
+            else:
+                task.result = result
+                task.done = True
+                for key in task.dependents:
+                    dependent = self._tasks[key]
+                    dependent.waiting.discard(task.key)
+                    if not dependent.waiting and not dependent.done:
+                        self._push(dependent)
+            self._dispatch()
+            self._cond.notify_all()
+
+    def _fail(self, task, error):
+        task.error = error
+        task.done = True
+        for key in task.dependents:
+            dependent = self._tasks[key]
+            if not dependent.done:
+                self._fail(dependent, error)
+
+    def result(self, key):
+        """
+        Wait for the task `key` and return its result, or raise its exception.
+        """
+        with self._cond:
+            task = self._tasks[key]
+            self._cond.wait_for(lambda: task.done)
+        if task.error is not None:
+            raise task.error
+        return task.result
+
+    def map(self, func, items, priority: int = None) -> list:
+        """
+        Run `func(item)` for each item as tasks of the graph and return their results in order.
+        Called from a task, the calling worker runs the ones no other worker has picked up instead of
+        waiting, so that the fan-out stays within `max_workers` along with the rest of the graph
+        and cannot wait for a worker it holds. The tasks get the priority of the calling task by default.
+        """
+        caller = getattr(self._local, "task", None)
+        if priority is None:
+            priority = caller.priority if caller is not None else 0
+        batch = next(self._maps)
+        keys = [self.add(("map", batch, i), func, item, priority=priority) for i, item in enumerate(items)]
+        if caller is not None:
+            for key in keys:
+                task = self._claim(key)
+                if task is not None:
+                    self._run(task, release=False)
+        return [self.result(key) for key in keys]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
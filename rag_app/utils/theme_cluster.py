@@ -1,12 +1,13 @@
+import asyncio
 from typing import List, Dict
-from langchain_openai.embeddings import OpenAIEmbeddings
 from langfuse import get_client
-from langfuse.openai import openai
 from sklearn.cluster import KMeans
-from .llm_retry import extractor_retry_or_none
+from .llm_retry import extractor_retry_or_none, async_extractor_retry_or_none
+from .llm_client import chat_completion, async_chat_completion
+from .embedding_service import embedding_service
 
 langfuse = get_client()
-embeddings_model = OpenAIEmbeddings()  # Utilisation de la nouvelle classe
+embeddings_model = embedding_service  # shared with the vector store, cached on disk
 
 # Prompt template to label clusters
 LABEL_PROMPT = '''You are an academic assistant.\
@@ -18,6 +19,15 @@ def cluster_themes(texts: List[str], n_clusters: int = 5) -> Dict[int, List[int]
     Returns mapping of cluster_id to list of text indices.
     """
     embs = embeddings_model.embed_documents(texts)
+    return group_clusters(embs, n_clusters)
+
+
+async def acluster_themes(texts: List[str], n_clusters: int = 5) -> Dict[int, List[int]]:
+    embs = await embeddings_model.aembed_documents(texts)
+    return group_clusters(embs, n_clusters)
+
+
+def group_clusters(embs, n_clusters: int) -> Dict[int, List[int]]:
     kmeans = KMeans(n_clusters=n_clusters, random_state=42)
     labels = kmeans.fit_predict(embs)
     clusters = {}
@@ -25,19 +35,30 @@ def cluster_themes(texts: List[str], n_clusters: int = 5) -> Dict[int, List[int]
         clusters.setdefault(label, []).append(idx)
     return clusters
 
-@extractor_retry_or_none
-def label_cluster(texts: List[str], cluster_indices: List[int]) -> str:
+def label_request(texts: List[str], cluster_indices: List[int]) -> Dict:
     """
-    Use LLM to generate a label for a cluster of paper titles/texts.
+    Arguments of the chat completion generating a label for a cluster of paper titles/texts.
     """
     subset = [texts[i] for i in cluster_indices]
     prompt = LABEL_PROMPT + "\n\n" + " ".join(subset)
-    response = openai.chat.completions.create(
+    return dict(
         model='gpt-4',
         messages=[{'role':'user','content':prompt}],
         name="theme_labeling_request"
     )
-    return response.choices[0].message.content.strip()
+
+
+@extractor_retry_or_none
+def label_cluster(texts: List[str], cluster_indices: List[int]) -> str:
+    """
+    Use LLM to generate a label for a cluster of paper titles/texts.
+    """
+    return chat_completion(**label_request(texts, cluster_indices)).strip()
+
+
+@async_extractor_retry_or_none
+async def alabel_cluster(texts: List[str], cluster_indices: List[int]) -> str:
+    return (await async_chat_completion(**label_request(texts, cluster_indices))).strip()
 
 
 def thematic_synthesizer(texts: List[str], n_clusters: int = 5) -> Dict[str, List[str]]:
@@ -49,4 +70,13 @@ def thematic_synthesizer(texts: List[str], n_clusters: int = 5) -> Dict[str, Lis
     for cid, indices in clusters.items():
         label = label_cluster(texts, indices)
         themed[label] = [texts[i] for i in indices]
-    return themed
\ No newline at end of file
+    return themed
+
+
+async def athematic_synthesizer(texts: List[str], n_clusters: int = 5) -> Dict[str, List[str]]:
+    """
+    Async twin of `thematic_synthesizer`, labelling all the clusters concurrently.
+    """
+    clusters = await acluster_themes(texts, n_clusters=n_clusters)
+    labels = await asyncio.gather(*(alabel_cluster(texts, indices) for indices in clusters.values()))
+    return {label: [texts[i] for i in indices] for label, indices in zip(labels, clusters.values())}
@@ -1,59 +1,228 @@
 # vector_store.py   # RAG Vector Store Setup
 
 import os
+import json
+import time
+import hashlib
+import weakref
 from typing import Dict, List, Tuple
 from openai import OpenAI
-from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_community.docstore.document import Document
+from .lexical_index import InvertedIndex
+from .embedding_service import embedding_service
 
-# Initialize embedding model
-embeddings_model = OpenAIEmbeddings()
+# Embedding model, shared with the theme clustering and cached on disk
+embeddings_model = embedding_service
 
 # Path to persist the FAISS index
 INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "faiss_index")
+# Documents indexed (content hash, chunk ids) and the parameters of the index, saved next to it
+MANIFEST_FILE = "manifest.json"
+CHUNK_SIZE = 1000
+# Bump when the splitting of the documents changes: the index is then rebuilt
+CHUNKING_VERSION = "1"
+
+# Inverted index of the chunks, saved next to the FAISS index
+LEXICAL_INDEX_FILE = "lexical_index.json"
+# "hybrid": FAISS and lexical results fused by reciprocal rank, "vector": FAISS only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Results of each retriever fused for the k final ones
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+# Damping constant of reciprocal rank fusion: 1 / (RRF_K + rank)
+RRF_K = 60
+
+# Inverted index of each store's chunks, loaded or built once per store
+_lexical_indexes = weakref.WeakKeyDictionary()
+
+def index_params() -> dict:
+    """
+    What the vectors of the index depend on, besides the documents: any change means a rebuild.
+    """
+    return {
+        "embedding_model": embeddings_model.model,
+        "chunk_size": CHUNK_SIZE,
+        "chunking_version": CHUNKING_VERSION,
+    }
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def split_document(doc_id: str, text: str) -> List[Document]:
+    # Simple text splitter; you can swap in RecursiveCharacterTextSplitter if desired (and bump CHUNKING_VERSION)
+    chunks = [
+        text[i : i + CHUNK_SIZE]
+        for i in range(0, len(text), CHUNK_SIZE)
+    ]
+    return [
+        Document(
+            page_content=chunk,
+            metadata={"source": doc_id, "chunk": idx},
+        )
+        for idx, chunk in enumerate(chunks)
+    ]
+
+def load_manifest(index_dir: str = INDEX_DIR) -> dict:
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest: dict, index_dir: str = INDEX_DIR):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
 
 def build_vector_store(corpus: Dict[str, str]) -> FAISS:
     """
-    Build (or load) a FAISS vector store from a dict of {doc_id: text}.
+    Build (or update) a FAISS vector store from a dict of {doc_id: text}.
     - Splits long documents into chunks.
     - Embeds chunks and indexes them.
-    Returns the FAISS store instance.
+    The documents of the index are tracked by content hash in its manifest: new or changed documents
+    are (re-)embedded, removed ones deleted, unchanged ones reused as they are. If the embedding model
+    or the chunking parameters of the manifest are not the current ones, the index is rebuilt.
+    The manifest is checked against the chunks actually in the index (the two files are not saved atomically
+    together): documents with missing chunks are re-embedded, and chunks the manifest does not list are deleted.
+    Returns the FAISS store instance, or None if the corpus is empty.
     """
+    manifest = load_manifest()
+    store, indexed = None, {}
     # Check for existing index
     if os.path.exists(INDEX_DIR):
-        return FAISS.load_local(INDEX_DIR, embeddings_model, allow_dangerous_deserialization=True)
+        if manifest.get("params") == index_params():
+            store = FAISS.load_local(INDEX_DIR, embeddings_model, allow_dangerous_deserialization=True)
+            indexed = manifest.get("documents", {})
+        else:
+            print(f"Vector store: rebuilding {INDEX_DIR}, its manifest does not match {index_params()}")
+
+    stored = set(store.docstore._dict) if store is not None else set()
+    listed = {chunk_id for entry in indexed.values() for chunk_id in entry["chunk_ids"]}
+    hashes = {doc_id: text_hash(text) for doc_id, text in corpus.items()}
+    stale = [
+        doc_id for doc_id, entry in indexed.items()
+        if hashes.get(doc_id) != entry["hash"] or not stored.issuperset(entry["chunk_ids"])
+    ]
+    new = [doc_id for doc_id in corpus if doc_id not in indexed or doc_id in stale]
+    removed_ids = [chunk_id for doc_id in stale for chunk_id in indexed[doc_id]["chunk_ids"] if chunk_id in stored]
+    removed_ids.extend(sorted(stored - listed))
 
     # Prepare documents
     docs: List[Document] = []
-    for doc_id, text in corpus.items():
-        # Simple text splitter; you can swap in RecursiveCharacterTextSplitter if desired
-        chunks = [
-            text[i : i + 1000]
-            for i in range(0, len(text), 1000)
-        ]
-        for idx, chunk in enumerate(chunks):
-            docs.append(
-                Document(
-                    page_content=chunk,
-                    metadata={"source": doc_id, "chunk": idx},
-                )
-            )
-
-    # Build new index
-    store = FAISS.from_documents(docs, embeddings_model)
-    # Persist it
+    ids: List[str] = []
+    documents = {doc_id: entry for doc_id, entry in indexed.items() if doc_id not in stale}
+    for doc_id in new:
+        chunks = split_document(doc_id, corpus[doc_id])
+        chunk_ids = [f"{doc_id}#{hashes[doc_id][:16]}#{idx}" for idx in range(len(chunks))]
+        docs.extend(chunks)
+        ids.extend(chunk_ids)
+        documents[doc_id] = {"hash": hashes[doc_id], "chunk_ids": chunk_ids}
+
+    if not documents or (store is None and not docs):
+        # FAISS cannot build an index without vectors: the index on disk is left as it is
+        print("Vector store: no document to index")
+        return None
+    if store is None:
+        # Build new index
+        store = FAISS.from_documents(docs, embeddings_model, ids=ids)
+    else:
+        if removed_ids:
+            store.delete(removed_ids)
+        if docs:
+            store.add_documents(docs, ids=ids)
+    print(f"Vector store: {len(new)} documents embedded, {len(removed_ids)} chunks deleted, "
+          f"{len(documents) - len(new)} documents unchanged")
+
+    # Persist it, with its manifest and the inverted index of the same chunks
     store.save_local(INDEX_DIR)
+    save_manifest({"params": index_params(), "documents": documents})
+    _lexical_indexes.pop(store, None)
+    lexical_index(store)
     return store
 
+def store_documents(doc_store: FAISS) -> List[Document]:
+    """
+    The chunks indexed in the vector store.
+    """
+    return list(doc_store.docstore._dict.values())
+
+def lexical_index(doc_store: FAISS, index_dir: str = INDEX_DIR) -> InvertedIndex:
+    """
+    Inverted index (BM25) of the chunks of the vector store, by docstore id, e.g. for the hybrid retrieval
+    or the lexical prefilter of `rerank_excerpts`. Loaded from `index_dir`, or built and saved there
+    if it is missing or does not have the chunks of the store.
+    """
+    index = _lexical_indexes.get(doc_store)
+    if index is not None:
+        return index
+    path = os.path.join(index_dir, LEXICAL_INDEX_FILE)
+    chunks = doc_store.docstore._dict
+    try:
+        index = InvertedIndex.load(path)
+    except (OSError, ValueError, KeyError):
+        index = None
+    if index is None or index.lengths.keys() != chunks.keys():
+        index = InvertedIndex()
+        for chunk_id, doc in chunks.items():
+            index.add_chunk(chunk_id, doc.page_content)
+        os.makedirs(index_dir, exist_ok=True)
+        index.save(path)
+    _lexical_indexes[doc_store] = index
+    return index
+
 def retrieve_relevant(doc_store: FAISS, query: str, k: int = 5) -> List[Tuple[str, str]]:
     """
     Perform a similarity search against the vector store.
+    In the hybrid RETRIEVAL_MODE, the FAISS results are fused with the ones of the inverted index (see `retrieve_hybrid`).
     Returns up to k tuples of (source_doc_id, chunk_text).
     """
+    if RETRIEVAL_MODE == "hybrid":
+        return retrieve_hybrid(doc_store, [query], k=k)[0]
     results = doc_store.similarity_search(query, k=k)
     # Extract source & text
     return [
         (res.metadata.get("source", ""), res.page_content) 
         for res in results
     ]
+
+def chunk_key(doc: Document) -> tuple:
+    return doc.metadata.get("source", ""), doc.metadata.get("chunk"), doc.page_content
+
+def rrf_fuse(rankings: List[List[Document]], rrf_k: int = RRF_K) -> List[Document]:
+    """
+    Reciprocal rank fusion: the chunks of all the rankings, by descending sum of 1 / (rrf_k + rank).
+    The same chunk found by several retrievers (see `chunk_key`) is counted once per ranking.
+    """
+    fused, docs = {}, {}
+    for hits in rankings:
+        for rank, doc in enumerate(hits, 1):
+            key = chunk_key(doc)
+            docs[key] = doc
+            fused[key] = fused.get(key, 0.0) + 1 / (rrf_k + rank)
+    return [docs[key] for key in sorted(fused, key=fused.get, reverse=True)]
+
+def retrieve_hybrid(doc_store: FAISS, queries: List[str], k: int = 5,
+                    candidates: int = RETRIEVAL_CANDIDATES) -> List[List[Tuple[str, str]]]:
+    """
+    Hybrid search of several queries: the `candidates` best chunks of FAISS (all the queries embedded in one call)
+    and of the inverted index are fused by reciprocal rank, so that exact terms (method or dataset names)
+    are found even when the embeddings miss them. The latency of each query is printed.
+    Returns, for each query, up to k tuples of (source_doc_id, chunk_text).
+    """
+    index = lexical_index(doc_store)
+    start = time.time()
+    vectors = doc_store.embeddings.embed_documents(queries) if queries else []
+    embedding_time = (time.time() - start) / max(len(queries), 1)  # one call shared by the queries
+
+    results = []
+    for n, (query, vector) in enumerate(zip(queries, vectors), 1):
+        start = time.time()
+        vector_hits = doc_store.similarity_search_by_vector(vector, k=candidates)
+        lexical_hits = [doc_store.docstore.search(chunk_id) for chunk_id, _ in index.search(query, candidates)]
+        lexical_hits = [doc for doc in lexical_hits if isinstance(doc, Document)]  # search returns a message if not found
+        best = rrf_fuse([vector_hits, lexical_hits])[:k]
+        results.append([(doc.metadata.get("source", ""), doc.page_content) for doc in best])
+        print(f"Query {n}/{len(queries)}: {(embedding_time + time.time() - start) * 1000:.1f} ms "
+              f"({len(vector_hits)} vector, {len(lexical_hits)} lexical hits)")
+    return results
@@ -1,6 +1,6 @@
 from langfuse import get_client
-from langfuse.openai import openai
 from .llm_retry import retry_on_rate_limit
+from .llm_client import chat_completion
 
 langfuse = get_client()
 
@@ -17,7 +17,7 @@ def describe_writing_style(text: str, max_tokens: int = 512) -> str:
     Calls OpenAI to describe the writing style of the input text.
     Returns only the style description.
     """
-    response = openai.chat.completions.create(
+    content = chat_completion(
         model="gpt-4",
         messages=[
             {"role": "system", "content": "You are a writing style analysis assistant."},
@@ -27,4 +27,4 @@ def describe_writing_style(text: str, max_tokens: int = 512) -> str:
         max_tokens=max_tokens,
         name="writing_style_description_request"
     )
-    return response.choices[0].message.content.strip()
+    return content.strip()
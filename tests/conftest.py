@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# The modules read their settings at import: keep the tests off the API and off the caches of the app
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("LLM_CACHE", "off")
+os.environ.setdefault("EMBEDDING_CACHE", "off")
+os.environ.setdefault("SECTION_CACHE_DIR", os.path.join(tempfile.mkdtemp(), "sections"))
+# Relative, so that a test run in a temporary directory never touches the index of the app
+os.environ["FAISS_INDEX_DIR"] = "faiss_index"
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from rag_app.utils import extractor_batching
+from rag_app.utils.extractor_batching import (
+    BATCH_AGENTS, BatchBudget, BatchCollector, answer_tokens, max_batch_papers, parse_batch,
+)
+
+ITEMS = [("a.pdf", "text a"), ("b.pdf", "text b"), ("c.pdf", "text c")]
+
+
+def test_parse_batch_skips_unanswered_ids():
+    content = json.dumps({"1": ["first"], "2": [], "3": "- third"})
+    assert parse_batch("findings", ITEMS, content) == {
+        "a.pdf": {"findings": ["first"]},
+        "c.pdf": {"findings": ["third"]},
+    }
+
+
+def test_parse_batch_wraps_the_answers_of_the_agent():
+    content = json.dumps({"1": {"title": "A"}, "2": '{"title": "B"}', "3": ""})
+    assert parse_batch("metadata", ITEMS, content) == {"a.pdf": {"title": "A"}, "b.pdf": {"title": "B"}}
+    assert parse_batch("research_question", ITEMS, json.dumps({"2": " why? "})) == {
+        "b.pdf": {"research_question": "why?"},
+    }
+
+
+@pytest.mark.parametrize("content", ["not json", json.dumps(["a", "b"])])
+def test_parse_batch_rejects_malformed_answers(content):
+    with pytest.raises(ValueError):
+        parse_batch("gaps", ITEMS, content)
+
+
+def test_max_batch_papers_fits_the_answers_in_the_completion(monkeypatch):
+    monkeypatch.setattr(extractor_batching, "BATCH_MAX_PAPERS", 10)
+    monkeypatch.setattr(extractor_batching, "BATCH_MAX_COMPLETION_TOKENS", 4000)
+    assert max_batch_papers("research_question") == 10
+    assert max_batch_papers("metadata") == 4000 // answer_tokens("metadata") == 7
+    monkeypatch.setattr(extractor_batching, "BATCH_MAX_COMPLETION_TOKENS", 100)
+    assert max_batch_papers("metadata") == 1
+
+
+def sections(size: int) -> dict:
+    return {spec.section: "x" * size for spec in BATCH_AGENTS.values()}
+
+
+def test_collector_cuts_batches_at_the_token_budget():
+    collector = BatchCollector(BatchBudget(max_tokens=100))
+    assert collector.add("a.pdf", sections(200)) == []
+    assert collector.add("b.pdf", sections(200)) == []  # 50 + 50 tokens
+    ready = collector.add("c.pdf", sections(200))
+    assert [name for name, _ in ready] == list(BATCH_AGENTS)
+    assert all([fname for fname, _ in items] == ["a.pdf", "b.pdf"] for _, items in ready)
+    assert collector.flush() == [(name, [("c.pdf", "x" * 200)]) for name in BATCH_AGENTS]
+    assert collector.flush() == []
+
+
+def test_collector_cuts_batches_at_the_max_papers(monkeypatch):
+    monkeypatch.setattr(extractor_batching, "BATCH_MAX_PAPERS", 2)
+    collector = BatchCollector(BatchBudget(max_tokens=10_000))
+    collector.add("a.pdf", sections(4))
+    collector.add("b.pdf", sections(4))
+    ready = collector.add("c.pdf", sections(4))
+    assert len(ready) == len(BATCH_AGENTS)
+
+
+def test_budget_is_halved_after_rate_limit_errors(monkeypatch):
+    monkeypatch.setattr(extractor_batching.rate_limiter, "nb_rate_limit_errors", 0)
+    monkeypatch.setattr(extractor_batching.rate_limiter, "tpm", 0)
+    budget = BatchBudget(max_tokens=1000)
+    assert budget.current() == 1000
+    extractor_batching.rate_limiter.nb_rate_limit_errors = 1
+    assert budget.current() == 500
+    assert budget.current() == 500
+    budget.record(nb_papers=2, nb_fallbacks=0)
+    assert budget.current() == 600
+    budget.record(nb_papers=2, nb_fallbacks=1)
+    assert budget.current() == 600
+    monkeypatch.setattr(extractor_batching.rate_limiter, "tpm", 1000)
+    assert budget.current() == 250
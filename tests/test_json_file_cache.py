@@ -0,0 +1,86 @@
+import os
+import time
+
+from rag_app.utils.json_file_cache import JsonFileCache
+from rag_app.utils.llm_cache import LLMCache
+from rag_app.utils.section_cache import SectionCache
+
+
+def test_get_and_put(tmp_path):
+    cache = JsonFileCache(str(tmp_path), max_bytes=10_000)
+    assert cache.get("a") is None
+    cache.put("a", {"value": [1, 2]})
+    assert cache.get("a") == {"value": [1, 2]}
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "hit_rate": 0.5}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = JsonFileCache(str(tmp_path), max_bytes=400)
+    for index, key in enumerate("abcd"):
+        cache.put(key, "x" * 90)
+        os.utime(cache._path(key), (index, index))  # a is the oldest
+    cache.get("a")  # ... until it is read again
+    cache.put("e", "x" * 90)
+    assert cache.evictions == 2
+    assert cache.get("b") is None and cache.get("c") is None
+    assert cache.get("a") is not None and cache.get("e") is not None
+    assert cache._size == cache._disk_size() <= 400 * 0.9
+
+
+def test_overwrite_does_not_grow_the_size(tmp_path):
+    cache = JsonFileCache(str(tmp_path), max_bytes=10_000)
+    cache.put("a", "x" * 50)
+    cache.put("b", "x" * 50)
+    for _ in range(5):
+        cache.put("a", "x" * 50)
+    assert cache._size == cache._disk_size()
+    assert cache.evictions == 0
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = JsonFileCache(str(tmp_path), max_bytes=10_000)
+    os.makedirs(cache.cache_dir, exist_ok=True)
+    with open(cache._path("a"), "w") as f:
+        f.write("{not json")
+    assert cache.get("a") is None
+    assert cache.misses == 1
+
+
+def test_llm_cache_key_ignores_the_name():
+    cache = LLMCache(cache_dir="unused")
+    request = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    assert cache.key({**request, "name": "a"}) == cache.key({**request, "name": "b"}) == cache.key(request)
+    assert cache.key(request) != cache.key({**request, "temperature": 0.5})
+
+
+def test_llm_cache_entries_expire(tmp_path):
+    cache = LLMCache(str(tmp_path), max_bytes=10_000, ttl=60)
+    cache.put("fresh", "answer")
+    assert cache.get("fresh") == "answer"
+    JsonFileCache.put(cache, "old", {"created": time.time() - 120, "content": "answer"})
+    assert cache.get("old") is None
+    assert LLMCache(str(tmp_path), max_bytes=10_000, ttl=0).get("old") == "answer"
+
+
+def test_llm_cache_rejects_malformed_entries(tmp_path):
+    cache = LLMCache(str(tmp_path), max_bytes=10_000, ttl=60)
+    JsonFileCache.put(cache, "list", ["answer"])
+    JsonFileCache.put(cache, "no_content", {"created": time.time()})
+    JsonFileCache.put(cache, "no_date", {"content": "answer"})
+    assert cache.get("list") is None
+    assert cache.get("no_content") is None
+    assert cache.get("no_date") is None
+
+
+def test_section_cache_key_follows_the_file_content(tmp_path):
+    cache = SectionCache(str(tmp_path / "cache"))
+    first, copy = tmp_path / "a.pdf", tmp_path / "b.pdf"
+    first.write_bytes(b"%PDF content")
+    copy.write_bytes(b"%PDF content")
+    nbchar = {"findings": 1000}
+    key = cache.key(str(first), nbchar, "1")
+    assert cache.key(str(copy), nbchar, "1") == key
+    assert cache.key(str(first), {"findings": 2000}, "1") != key
+    assert cache.key(str(first), nbchar, "2") != key
+    copy.write_bytes(b"%PDF other content")
+    assert cache.key(str(copy), nbchar, "1") != key
@@ -0,0 +1,49 @@
+from rag_app.utils.lexical_index import BM25Index, InvertedIndex, prefilter, tokenize
+
+TEXTS = {
+    "c1": "Transformers improve machine translation quality.",
+    "c2": "Convolutional networks for image classification.",
+    "c3": "Machine translation of low resource languages with transformers and transformers.",
+}
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("The Role of BM25 in the retrieval") == ["role", "bm25", "retrieval"]
+
+
+def test_bm25_prefers_matching_and_rare_terms():
+    index = BM25Index(TEXTS.values())
+    assert index.score("image", TEXTS["c2"]) > 0
+    assert index.score("image", TEXTS["c1"]) == 0
+    assert index.idf("image") > index.idf("translation")
+
+
+def test_prefilter_keeps_the_best_candidates():
+    candidates = [(chunk_id, text) for chunk_id, text in TEXTS.items()]
+    kept, dropped = prefilter("image classification", candidates, k=1)
+    assert kept == [("c2", TEXTS["c2"])]
+    assert len(dropped) == 2
+    assert prefilter("image", candidates, k=3) == (candidates, [])
+    assert prefilter("image", candidates, k=0) == (candidates, [])
+
+
+def test_inverted_index_search():
+    index = InvertedIndex()
+    for chunk_id, text in TEXTS.items():
+        index.add_chunk(chunk_id, text)
+    results = index.search("machine translation transformers", k=2)
+    assert sorted(chunk_id for chunk_id, _ in results) == ["c1", "c3"]
+    assert results[0][1] >= results[1][1]
+    assert index.search("unknown", k=2) == []
+
+
+def test_inverted_index_save_and_load(tmp_path):
+    index = InvertedIndex(k1=1.2, b=0.5)
+    for chunk_id, text in TEXTS.items():
+        index.add_chunk(chunk_id, text)
+    path = str(tmp_path / "lexical.json")
+    index.save(path)
+    loaded = InvertedIndex.load(path)
+    assert (loaded.k1, loaded.b, loaded.nb_docs, loaded.total_length) == (1.2, 0.5, 3, index.total_length)
+    assert loaded.doc_freqs == index.doc_freqs
+    assert loaded.search("machine translation", k=3) == index.search("machine translation", k=3)
@@ -0,0 +1,66 @@
+from rag_app.utils.paper_encoding import encode_metadata, encode_papers, paper_label
+
+PAPERS = [
+    {
+        "filename": "a.pdf",
+        "metadata": {"title": "First paper", "authors": ["Ada Lovelace", "Alan Turing"], "year": 2020},
+        "research_question": "Does it work?",
+        "methodology": ["Survey", "Interviews"],
+        "findings": ["It works.", "It is fast"],
+        "gaps": [],
+        "themes": ["Evaluation"],
+    },
+    {
+        "filename": "b.pdf",
+        "metadata": {},
+        "research_question": "",
+        "methodology": ["survey"],
+        "findings": "it works",
+        "gaps": None,
+        "themes": ["Evaluation", "Tooling"],
+    },
+]
+
+
+def test_encode_papers():
+    assert encode_papers(PAPERS, topic="Testing") == "\n\n".join([
+        "Topic: Testing",
+        "Papers:\n[1] First paper (Ada Lovelace et al., 2020)\n[2] b.pdf",
+        "Themes:\nT1 Evaluation\nT2 Tooling",
+        "Shared points:\n*1 Survey\n*2 It works.",
+        "[1]\nQ: Does it work?\nM: *1 | Interviews\nF: *2 | It is fast\nT: T1",
+        "[2]\nM: *1\nF: *2\nT: T1, T2",
+    ])
+
+
+def test_encode_papers_with_custom_indices_and_fields():
+    encoded = encode_papers(PAPERS, indices=[4, 7], fields=("findings",))
+    assert "[4] First paper" in encoded and "[7] b.pdf" in encoded
+    assert "M:" not in encoded and "Q:" not in encoded
+    assert "*1 It works." in encoded
+    assert "Survey" not in encoded
+
+
+def test_points_shared_by_a_single_paper_are_not_factored():
+    paper = {"metadata": {"title": "T"}, "findings": ["Same point", "same point."]}
+    encoded = encode_papers([paper])
+    assert "Shared points" not in encoded
+    assert "F: Same point | same point." in encoded
+
+
+def test_paper_label():
+    assert paper_label({"metadata": {"title": " T ", "authors": "Ada Lovelace"}}) == "T (Ada Lovelace)"
+    assert paper_label({"filename": "x.pdf", "metadata": None}) == "x.pdf"
+
+
+def test_encode_metadata():
+    metadata = [
+        {"authors": ["A. One", "B. Two"], "title": "Title", "year": 2021, "doi": "10.1/x", "keywords": ["k"]},
+        {"raw_output": "  broken\n  output  "},
+        None,
+    ]
+    assert encode_metadata(metadata) == "\n".join([
+        "[1] A. One, B. Two. Title. 2021. doi: 10.1/x",
+        "[2] broken output",
+        "[3] ",
+    ])
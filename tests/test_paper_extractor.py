@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from rag_app.utils import llm_client
+from rag_app.utils.llm_cache import LLMCache
+from rag_app.utils.paper_extractor import as_bullets, parse_fused
+
+ANSWER = {
+    "metadata": {"title": "A paper"},
+    "research_question": " Why? ",
+    "methodology": ["survey", " "],
+    "findings": "- first\n- second\n",
+    "gaps": None,
+}
+
+
+def test_parse_fused_returns_the_outputs_of_the_agents():
+    metadata, question, methodology, findings, gaps = parse_fused(json.dumps(ANSWER))
+    assert metadata == {"title": "A paper"}
+    assert question == {"research_question": "Why?"}
+    assert methodology == {"methodology": ["survey"]}
+    assert findings == {"findings": ["first", "second"]}
+    assert gaps == {"gaps": []}
+
+
+def test_parse_fused_parses_metadata_given_as_a_string():
+    metadata = parse_fused(json.dumps({**ANSWER, "metadata": "not json"}))[0]
+    assert metadata == {"raw_output": "not json"}
+
+
+@pytest.mark.parametrize("content", [
+    "not json",
+    json.dumps(["a list"]),
+    json.dumps({key: value for key, value in ANSWER.items() if key != "gaps"}),
+])
+def test_parse_fused_rejects_malformed_answers(content):
+    with pytest.raises(ValueError):
+        parse_fused(content)
+
+
+def test_as_bullets():
+    assert as_bullets("- a\n\n• b\n* c") == ["a", "b", "c"]
+    assert as_bullets([" a ", "", 3]) == ["a", "3"]
+
+
+@pytest.fixture
+def answers(monkeypatch, tmp_path):
+    """
+    Answers returned by the chat completion, in order, and the requests it received.
+    """
+    answers, requests = [], []
+
+    def chat_completion(cache=None, **kwargs):
+        requests.append(kwargs)
+        return answers.pop(0)
+
+    monkeypatch.setattr(llm_client, "chat_completion", chat_completion)
+    monkeypatch.setattr(llm_client, "llm_cache", LLMCache(str(tmp_path), max_bytes=10_000, enabled=True))
+    return answers, requests
+
+
+def test_parsed_completion_caches_parsed_answers(answers):
+    pending, requests = answers
+    pending.append(json.dumps(ANSWER))
+    first = llm_client.parsed_completion(parse_fused, model="gpt-4", messages=[], name="fused")
+    second = llm_client.parsed_completion(parse_fused, model="gpt-4", messages=[], name="fused")
+    assert first == second
+    assert len(requests) == 1
+
+
+def test_parsed_completion_does_not_cache_malformed_answers(answers):
+    pending, requests = answers
+    pending.extend(["truncated {", json.dumps(ANSWER)])
+    with pytest.raises(ValueError):
+        llm_client.parsed_completion(parse_fused, model="gpt-4", messages=[])
+    assert llm_client.parsed_completion(parse_fused, model="gpt-4", messages=[])[0] == {"title": "A paper"}
+    assert len(requests) == 2
+
+
+def test_parsed_completion_asks_again_when_the_cached_answer_does_not_parse(answers):
+    pending, requests = answers
+    request = dict(model="gpt-4", messages=[])
+    llm_client.llm_cache.put(llm_client.cache_key(request), "truncated {")
+    pending.append(json.dumps(ANSWER))
+    assert llm_client.parsed_completion(parse_fused, **request)[0] == {"title": "A paper"}
+    assert len(requests) == 1
+    assert llm_client.llm_cache.get(llm_client.cache_key(request)) == json.dumps(ANSWER)
+
+
+def test_sampled_requests_are_not_cached(answers):
+    pending, requests = answers
+    pending.extend([json.dumps(ANSWER)] * 2)
+    for _ in range(2):
+        llm_client.parsed_completion(parse_fused, model="gpt-4", messages=[], temperature=0.7)
+    assert len(requests) == 2
@@ -0,0 +1,53 @@
+import pytest
+
+from rag_app.utils.rate_limiter import RateLimiter, TokenBucket, estimate_tokens
+
+
+def test_estimate_tokens():
+    messages = [{"role": "system", "content": "x" * 40}, {"role": "user", "content": None}]
+    assert estimate_tokens(messages) == 10 + 8
+    assert estimate_tokens(messages, max_tokens=100) == 118
+
+
+def test_token_bucket_waits_for_its_debt():
+    bucket = TokenBucket(60)  # 1 per second
+    assert bucket.take(60, now=bucket.updated) == 0.0
+    assert bucket.take(1, now=bucket.updated) == pytest.approx(1.0)
+    assert bucket.take(1, now=bucket.updated) == pytest.approx(2.0)
+
+
+def test_token_bucket_refills_up_to_its_capacity():
+    bucket = TokenBucket(60)
+    start = bucket.updated
+    bucket.take(60, now=start)
+    assert bucket.take(30, now=start + 30) == 0.0
+    assert bucket.take(60, now=start + 1000) == 0.0  # not more than a full bucket
+    assert bucket.take(1, now=start + 1000) == pytest.approx(1.0)
+
+
+def test_token_bucket_caps_the_amount_to_its_capacity():
+    bucket = TokenBucket(60)
+    assert bucket.take(1000, now=bucket.updated) == 0.0
+    assert bucket.take(1000, now=bucket.updated) == pytest.approx(60.0)
+
+
+def test_unmetered_limiter_never_waits():
+    limiter = RateLimiter(rpm=0, tpm=0)
+    assert all(limiter.reserve(100_000) == 0.0 for _ in range(100))
+    assert limiter.stats()["requests"] == 100
+    assert limiter.stats()["waited_requests"] == 0
+
+
+def test_limiter_waits_on_the_tightest_budget():
+    limiter = RateLimiter(rpm=60, tpm=600)
+    assert limiter.reserve(600) == 0.0
+    assert limiter.reserve(60) == pytest.approx(6.0, abs=0.1)
+    assert limiter.stats()["waited_requests"] == 1
+
+
+def test_pause_holds_every_caller_back():
+    limiter = RateLimiter(rpm=0, tpm=0)
+    limiter.pause(5)
+    assert limiter.reserve(1) == pytest.approx(5.0, abs=0.1)
+    assert limiter.reserve(1) == pytest.approx(5.0, abs=0.1)
+    assert limiter.stats()["rate_limit_errors"] == 1
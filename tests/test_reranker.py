@@ -0,0 +1,24 @@
+import pytest
+
+from rag_app.utils.reranker import as_score, parse_scores
+
+
+@pytest.mark.parametrize("content, expected", [
+    ('{"1": 5, "2": 3}', {"1": 5, "2": 3}),
+    ('```json\n{"1": 4}\n```', {"1": 4}),
+    ('Here are the scores: {"1": "2", " 2 ": 1} as requested.', {"1": 2, "2": 1}),
+    ('{"1": 9, "2": 0, "3": "high", "4": null, "5": 5}', {"5": 5}),
+    ('{"1": 4, "2":', {}),
+    ("[4, 5]", {}),
+    ("", {}),
+    (None, {}),
+])
+def test_parse_scores(content, expected):
+    assert parse_scores(content) == expected
+
+
+def test_as_score_is_clamped():
+    assert as_score("4") == 4
+    assert as_score(9) == 5
+    assert as_score(-1) == 1
+    assert as_score("n/a") == 1
@@ -0,0 +1,41 @@
+from collections import OrderedDict
+
+import pytest
+
+from rag_app.utils.section_composer import ieee_authors, ieee_reference, number_citations, stitch, SYNTHESIS_HEADING
+
+
+@pytest.mark.parametrize("authors, expected", [
+    ("John Doe", "J. Doe"),
+    ("Doe, John", "J. Doe"),
+    (["Doe, John Paul", "Ada Lovelace"], "J. P. Doe and A. Lovelace"),
+    (["van Rossum, Guido"], "G. van Rossum"),
+    (["Ada Lovelace", "Alan Turing", "Grace Hopper"], "A. Lovelace, A. Turing, and G. Hopper"),
+    (["Plato"], "Plato"),
+    (None, ""),
+])
+def test_ieee_authors(authors, expected):
+    assert ieee_authors(authors) == expected
+
+
+def test_ieee_reference():
+    metadata = {"authors": ["Ada Lovelace"], "title": "Notes", "journal": "Memoirs", "year": 1843, "doi": "10.1/x"}
+    assert ieee_reference(metadata, "a.pdf") == 'A. Lovelace, "Notes," Memoirs, 1843, doi: 10.1/x.'
+    assert ieee_reference(None, "a.pdf") == '"a.pdf".'
+
+
+def test_number_citations_in_order_of_appearance():
+    text, cited = number_citations("As shown in [3] and [1, 3], then [2].", nb_papers=3)
+    assert text == "As shown in [1] and [2, 1], then [3]."
+    assert cited == [3, 1, 2]
+
+
+def test_number_citations_leaves_unknown_indices():
+    text, cited = number_citations("See [4] and [0, 1] but [2].", nb_papers=3)
+    assert text == "See [4] and [0, 1] but [1]."
+    assert cited == [2]
+
+
+def test_stitch_adds_the_synthesis_heading():
+    sections = OrderedDict([("1. Introduction", ["intro"]), ("2.1 Theme", ["a", "b"]), ("2.2 Theme", ["c"])])
+    assert stitch(sections) == "\n\n".join(["intro", SYNTHESIS_HEADING, "a\n\nb", "c"])
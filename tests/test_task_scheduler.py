@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from rag_app.utils.task_scheduler import TaskScheduler
+
+
+def test_dependency_results_are_appended_to_the_arguments():
+    with TaskScheduler(max_workers=2) as scheduler:
+        scheduler.add("a", lambda: 2)
+        scheduler.add("b", lambda: 3)
+        scheduler.add("sum", lambda x, a, b: x + a + b, 10, deps=["a", "b"])
+        assert scheduler.result("sum") == 15
+
+
+def test_failure_propagates_to_dependents():
+    def fail():
+        raise RuntimeError("boom")
+
+    with TaskScheduler(max_workers=2) as scheduler:
+        scheduler.add("fail", fail)
+        scheduler.add("child", lambda value: value, deps=["fail"])
+        scheduler.add("grandchild", lambda value: value, deps=["child"])
+        for key in ("fail", "child", "grandchild"):
+            with pytest.raises(RuntimeError, match="boom"):
+                scheduler.result(key)
+        # a task added after the failure fails at once
+        scheduler.add("late", lambda value: value, deps=["fail"])
+        with pytest.raises(RuntimeError, match="boom"):
+            scheduler.result("late")
+
+
+def test_unknown_dependency_does_not_register_the_task():
+    with TaskScheduler(max_workers=1) as scheduler:
+        with pytest.raises(KeyError):
+            scheduler.add("task", lambda value: value, deps=["missing"])
+        scheduler.add("missing", lambda: 1)
+        scheduler.add("task", lambda value: value + 1, deps=["missing"])
+        assert scheduler.result("task") == 2
+
+
+def test_duplicate_key_is_rejected():
+    with TaskScheduler(max_workers=1) as scheduler:
+        scheduler.add("a", lambda: 1)
+        with pytest.raises(ValueError):
+            scheduler.add("a", lambda: 2)
+
+
+def test_lowest_priority_runs_first():
+    order = []
+    gate = threading.Event()
+    with TaskScheduler(max_workers=1) as scheduler:
+        scheduler.add("blocker", gate.wait)
+        scheduler.add("low", order.append, "low", priority=2)
+        scheduler.add("high", order.append, "high", priority=0)
+        gate.set()
+        scheduler.result("low")
+        scheduler.result("high")
+    assert order == ["high", "low"]
+
+
+@pytest.mark.parametrize("max_workers", [1, 2, 4])
+def test_map_from_a_task_stays_within_max_workers(max_workers):
+    lock = threading.Lock()
+    active = {"now": 0, "peak": 0}
+
+    def work(item):
+        with lock:
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+        time.sleep(0.01)
+        with lock:
+            active["now"] -= 1
+        return item * 2
+
+    with TaskScheduler(max_workers=max_workers) as scheduler:
+        scheduler.add("a", lambda: sum(scheduler.map(work, range(8))))
+        scheduler.add("b", lambda: sum(scheduler.map(work, range(8))))
+        assert scheduler.result("a") == scheduler.result("b") == 56
+    assert active["peak"] <= max_workers
+
+
+def test_map_outside_of_a_task():
+    with TaskScheduler(max_workers=2) as scheduler:
+        assert scheduler.map(lambda item: item + 1, [1, 2, 3]) == [2, 3, 4]
@@ -0,0 +1,159 @@
+import os
+import pickle
+import types
+
+import pytest
+from langchain_community.docstore.document import Document
+
+from rag_app.utils import vector_store
+from rag_app.utils.vector_store import rrf_fuse
+
+
+def chunk(source: str, idx: int = 0) -> Document:
+    return Document(page_content=f"{source} chunk {idx}", metadata={"source": source, "chunk": idx})
+
+
+def test_rrf_fuse_favours_chunks_found_by_both_retrievers():
+    vector_hits = [chunk("a"), chunk("b"), chunk("c")]
+    lexical_hits = [chunk("d"), chunk("c")]
+    fused = rrf_fuse([vector_hits, lexical_hits])
+    assert [doc.metadata["source"] for doc in fused] == ["c", "a", "d", "b"]
+
+
+def test_rrf_fuse_identifies_chunks_by_source_index_and_text():
+    same = [chunk("a", 0)], [Document(page_content="a chunk 0", metadata={"source": "a", "chunk": 0})]
+    assert len(rrf_fuse(same)) == 1
+    other = [chunk("a", 0)], [Document(page_content="a chunk 0", metadata={"source": "a", "chunk": 1})]
+    assert len(rrf_fuse(other)) == 2
+
+
+def test_rrf_fuse_damping_constant():
+    vector_hits = [chunk("a"), chunk("b")]
+    lexical_hits = [chunk("c"), chunk("d"), chunk("e"), chunk("b")]
+    # without damping, the first result of a retriever outweighs a chunk found by both: 1 > 1/2 + 1/4 ...
+    sources = [doc.metadata["source"] for doc in rrf_fuse([vector_hits, lexical_hits], rrf_k=0)]
+    assert sources.index("a") < sources.index("b")
+    # ... with the default one it does not: 1/61 < 1/62 + 1/64
+    assert rrf_fuse([vector_hits, lexical_hits])[0].metadata["source"] == "b"
+
+
+def test_rrf_fuse_without_hits():
+    assert rrf_fuse([[], []]) == []
+
+
+class FakeDocstore:
+    def __init__(self):
+        self._dict = {}
+
+    def search(self, chunk_id):
+        return self._dict.get(chunk_id, f"ID {chunk_id} not found.")
+
+
+class FakeFAISS:
+    """
+    In-memory FAISS store counting the embedded chunks, saved with pickle.
+    """
+
+    embedded = 0
+
+    def __init__(self):
+        self.docstore = FakeDocstore()
+
+    @classmethod
+    def from_documents(cls, docs, embeddings, ids):
+        store = cls()
+        store.add_documents(docs, ids=ids)
+        return store
+
+    def add_documents(self, docs, ids):
+        FakeFAISS.embedded += len(docs)
+        self.docstore._dict.update(zip(ids, docs))
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            del self.docstore._dict[chunk_id]
+
+    def save_local(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        with open(os.path.join(index_dir, "index.pkl"), "wb") as f:
+            pickle.dump(self.docstore._dict, f)
+
+    @classmethod
+    def load_local(cls, index_dir, embeddings, allow_dangerous_deserialization=False):
+        store = cls()
+        with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+            store.docstore._dict = pickle.load(f)
+        return store
+
+
+@pytest.fixture
+def build(monkeypatch, tmp_path):
+    """
+    `build_vector_store` on the fake store, in an empty index directory: returns the store and the chunks embedded.
+    """
+    monkeypatch.chdir(tmp_path)  # INDEX_DIR is relative (see conftest.py)
+    monkeypatch.setattr(vector_store, "FAISS", FakeFAISS)
+    monkeypatch.setattr(vector_store, "embeddings_model", types.SimpleNamespace(model="test-embedding"))
+
+    def build(corpus):
+        FakeFAISS.embedded = 0
+        store = vector_store.build_vector_store(corpus)
+        return store, FakeFAISS.embedded
+
+    return build
+
+
+def manifest() -> dict:
+    return vector_store.load_manifest(vector_store.INDEX_DIR)
+
+
+def sources(store) -> list:
+    return sorted({doc.metadata["source"] for doc in store.docstore._dict.values()})
+
+
+CORPUS = {"a": "x" * 2500, "b": "y" * 1500}
+
+
+def test_only_new_and_changed_documents_are_embedded(build):
+    store, embedded = build(CORPUS)
+    assert embedded == 5
+    assert manifest()["documents"].keys() == {"a", "b"}
+    store, embedded = build(CORPUS)
+    assert embedded == 0
+    store, embedded = build({**CORPUS, "c": "z" * 10})
+    assert embedded == 1
+    store, embedded = build({"a": "w" * 900, "c": "z" * 10})
+    assert embedded == 1
+    assert sources(store) == ["a", "c"]
+    assert len(store.docstore._dict) == 2
+    assert sorted(manifest()["documents"]) == ["a", "c"]
+
+
+def test_index_is_rebuilt_when_its_parameters_change(build, monkeypatch):
+    build(CORPUS)
+    monkeypatch.setattr(vector_store, "CHUNK_SIZE", 500)
+    store, embedded = build(CORPUS)
+    assert embedded == 8
+    assert len(store.docstore._dict) == 8
+    assert manifest()["params"]["chunk_size"] == 500
+
+
+def test_manifest_is_reconciled_with_the_index(build):
+    store, _ = build(CORPUS)
+    # chunks of a missing from the index, and a chunk the manifest does not list
+    documents = manifest()["documents"]
+    for chunk_id in documents["a"]["chunk_ids"][:1]:
+        del store.docstore._dict[chunk_id]
+    store.docstore._dict["orphan#0"] = Document(page_content="orphan", metadata={"source": "orphan", "chunk": 0})
+    store.save_local(vector_store.INDEX_DIR)
+    store, embedded = build(CORPUS)
+    assert embedded == 3
+    assert sources(store) == ["a", "b"]
+    assert len(store.docstore._dict) == 5
+
+
+def test_empty_corpus_leaves_the_index(build):
+    assert build({}) == (None, 0)
+    build(CORPUS)
+    assert build({}) == (None, 0)
+    assert manifest()["documents"].keys() == {"a", "b"}